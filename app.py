@@ -1,11 +1,14 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import json
-import math
 from typing import List, Dict, Optional
 
-from utils import parse_csv_to_items, parse_csv_to_activities, calculate_steps
-from gear_optimizer import GearOptimizer, OPTIMAZATION_TARGET
+from utils import calculate_steps, filter_owned_items, inventory_fingerprint, calculate_level_from_xp, calculate_char_level_from_steps
+from catalogue import Catalogue, ResultCache
+from result_store import ResultStore, StoreKey, optimize_with_store
+from precompute import Precomputer, DEFAULT_LEVEL
+from gear_optimizer_q import OPTIMAZATION_TARGET
+from optimizers import make_optimizer
 from export import export_gearset
 
 st.set_page_config(
@@ -14,62 +17,47 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def get_xp_for_level(level: int) -> int:
-    """Standard XP curve formula (internal)."""
-    total = 0
-    for i in range(1, level):
-        total += math.floor(i + 300 * (2 ** (i / 7.0)))
-    return math.floor(total / 4)
-
-def calculate_level_from_xp(current_xp: int) -> int:
-    """Reverse lookup: Finds skill level based on XP."""
-    # Optimization: Simple iterative check since max level is usually < 150
-    for lvl in range(1, 150):
-        if get_xp_for_level(lvl + 1) > current_xp:
-            return lvl
-    return 150
-
-def calculate_char_level_from_steps(current_steps: int) -> int:
-    """
-    Specific formula for Character Level based on Steps.
-    Step Req = (Standard_XP_Curve / 4).floor() * 4.6
-    """
-    for lvl in range(1, 120):
-        # Calculate steps required for NEXT level
-        xp_req_standard = get_xp_for_level(lvl + 1)
-        steps_req = math.floor(xp_req_standard) * 4.6
-        
-        if steps_req > current_steps:
-            return lvl
-    return 120
-
 # --- 3. Data Loading ---
-@st.cache_data
+# One catalogue per server process, it watches the CSVs and swaps in new rows without a restart
+@st.cache_resource
+def get_catalogue() -> Catalogue:
+    catalogue = Catalogue(items_file="items.csv", activities_file="activities.csv", recipes_file="recipes.csv")
+    catalogue.watch()
+    return catalogue
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    return ResultCache(get_catalogue())
+
+# Results on disk survive restarts and are shared with the CLI, catalogue reloads migrate them
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    store = ResultStore()
+    store.attach(get_catalogue())
+    return store
+
+# Every activity x target for all items at level 99 is the same for every user, computed once in the background
+@st.cache_resource
+def get_precomputer() -> Precomputer:
+    precomputer = Precomputer(get_catalogue(), get_result_store())
+    precomputer.start()
+    return precomputer
+
 def load_data():
-    items_file = "items.csv"
-    activity_file = "activities.csv"
-    recipes_file = "recipes.csv"
-    
-    all_items = parse_csv_to_items(items_file)
-    activities = parse_csv_to_activities(activity_file, recipes_file)
-    return all_items, activities
+    snapshot = get_catalogue().snapshot()
+    return snapshot.items, snapshot.activities, snapshot.version
 
 def filter_user_items(all_items, user_data: Dict):
     try:
-        owned_names = set()
-        owned_names.update(user_data.get("bank", {}).keys())
-        owned_names.update(user_data.get("inventory", {}).keys())
-        if "gear" in user_data:
-            equipped = {v for v in user_data["gear"].values() if v}
-            owned_names.update(equipped)
-        return [item for item in all_items if item.export_name in owned_names]
+        return filter_owned_items(all_items, user_data)
     except Exception:
         return all_items
 
 # --- 4. Main App ---
 def main():
     st.title("🛡️ WalkScape Gear Optimizer")
-    all_items_raw, activities = load_data()
+    all_items_raw, activities, catalogue_version = load_data()
+    precomputer = get_precomputer()
     
     # --- State Management for Levels ---
     # We store these to allow the UI to react to the JSON immediately
@@ -127,6 +115,10 @@ def main():
         st.divider()
         wiki_url = st.text_input("Iframe URL", value="https://gear.walkscape.app")
 
+        status = precomputer.status()
+        if not status.finished:
+            st.caption(f"Precomputing default results: {status.done}/{status.total}")
+
     # --- Item Filtering ---
     if use_owned and user_data:
         available_items = filter_user_items(all_items_raw, user_data)
@@ -188,14 +180,35 @@ def main():
     if run_opt and selected_act_name:
         activity = act_map[selected_act_name]
         
-        with st.spinner(f"Optimizing for {selected_act_name}..."):
-            optimizer = GearOptimizer(available_items)
-            best_gear = optimizer.optimize(
-                activity, 
-                player_level=player_lvl, 
-                player_skill_level=final_skill_lvl, # Uses the auto-calculated level
-                optimazation_target=selected_target
-            )
+        result_cache = get_result_cache()
+        fingerprint = inventory_fingerprint(available_items)
+        result_key = (selected_act_name, selected_target.name, player_lvl, final_skill_lvl, fingerprint)
+        best_gear = result_cache.get(result_key)
+        # All items at the default levels: served from the precompute once it got there
+        if best_gear is None and not (use_owned and user_data) and player_lvl == DEFAULT_LEVEL and final_skill_lvl == DEFAULT_LEVEL:
+            precomputed = precomputer.get(catalogue_version, selected_act_name, selected_target.name)
+            if precomputed is not None:
+                best_gear = precomputed.gearset
+                result_cache.put(result_key, activity, best_gear, catalogue_version)
+        if best_gear is None:
+            # The precompute's optimizer, so on-demand and precomputed answers agree and share store keys
+            def run_optimizer():
+                optimizer, targets = make_optimizer(precomputer.optimizer, available_items)
+                result = optimizer.optimize_with_info(
+                    activity, 
+                    player_level=player_lvl, 
+                    player_skill_level=final_skill_lvl, # Uses the auto-calculated level
+                    optimazation_target=targets[selected_target.name]
+                )
+                return result.gearset, result.score
+
+            store_key = StoreKey(catalogue_version=catalogue_version, activity=selected_act_name, target=selected_target.name,
+                                 level=player_lvl, skill_level=final_skill_lvl, inventory=fingerprint, optimizer=precomputer.optimizer)
+            items_by_key = {(i.name, i.skill): i for i in available_items}
+            with st.spinner(f"Optimizing for {selected_act_name}..."):
+                stored, _ = optimize_with_store(get_result_store(), store_key, items_by_key, activity, run_optimizer)
+            best_gear = stored.gearset
+            result_cache.put(result_key, activity, best_gear, catalogue_version)
 
         # Stats
         stats = best_gear.get_stats(activity.skill)
@@ -0,0 +1,214 @@
+import itertools
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel
+from models import Item, Activity, GearSet, cap_stats
+from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET, CONVERGENCE_REASON, SINGLE_SLOTS, OptimizationResult, SetTracker, is_candidate
+from optimizers import make_optimizer
+
+OPTIMAL_GAP = 1e-9  # Relative gaps below this are float noise between equally good loadouts
+
+
+class ExhaustiveOptimizer(GearOptimizer):
+    """
+    Reference solver for small inventories: every valid loadout of the candidates is considered, without
+    the heuristics of the other optimizers (no best-version filter, tool or set cut-offs, slot order).
+    Only exact reductions are used: items beaten in every target stat by another item of the same slot are
+    dropped (set items and items a requirement needs are always kept), and a branch is cut when even the best
+    remaining option of every slot can't beat the best loadout found so far, or can't make up for the
+    required keywords it still lacks. Set bonuses are checked on complete loadouts.
+    """
+    def search(self) -> OptimizationResult:
+        """One exhaustive pass, there is no local search to converge."""
+        gearset = self._solve()
+        return OptimizationResult(gearset=gearset, score=self.calculate_score_for_set(gearset), iterations=1,
+                                  reason=CONVERGENCE_REASON.converged, unmet_requirements=dict(self.unmet_requirements))
+
+    def _solve(self) -> GearSet:
+        self._empty_stats = GearSet().get_stats(self.context.skills, capped=False)
+        self.nodes = 0
+
+        dims = sorted(self.score_kernel().stats)
+        candidates = self._get_candidates()
+        self._set_requirements(candidates)
+        decisions = self._decisions(candidates, dims)
+        keywords = sorted(self.requirements.needed)
+        needed = tuple(self.requirements.needed[k] for k in keywords)
+        # Items per required keyword of every option
+        pieces = [[tuple(sum(k in item.keywords for item in items) for k in keywords) for items, _ in options] for options in decisions]
+        # optimistic[i]: the most every stat can still grow from decision i on, pieces_left[i] the same for the required keywords
+        optimistic = [tuple(0 for _ in dims)] * (len(decisions) + 1)
+        pieces_left = [tuple(0 for _ in keywords)] * (len(decisions) + 1)
+        for i in range(len(decisions) - 1, -1, -1):
+            optimistic[i] = tuple(o + max(vector[k] for _, vector in decisions[i]) for k, o in enumerate(optimistic[i + 1]))
+            pieces_left[i] = tuple(left + max(p[k] for p in pieces[i]) for k, left in enumerate(pieces_left[i + 1]))
+
+        best_score = float("-inf")
+        best_chosen: List[Tuple[Item, ...]] = []
+        chosen: List[Tuple[Item, ...]] = []
+        def search(i: int, values: tuple, counts: tuple):
+            nonlocal best_score, best_chosen
+            self.nodes += 1
+            if any(c + left < n for c, left, n in zip(counts, pieces_left[i], needed)): return
+            if self._score(tuple(v + o for v, o in zip(values, optimistic[i])), dims) <= best_score: return
+            if i == len(decisions):
+                items = [item for group in chosen for item in group]
+                if SetTracker(items).all_satisfied(items):
+                    best_score = self._score(values, dims)
+                    best_chosen = list(chosen)
+                return
+            for (items, vector), added in zip(decisions[i], pieces[i]):
+                chosen.append(items)
+                search(i + 1, tuple(v + d for v, d in zip(values, vector)), tuple(c + a for c, a in zip(counts, added)))
+                chosen.pop()
+        search(0, tuple(0 for _ in dims), tuple(0 for _ in keywords))
+
+        best_set = GearSet()
+        for group in best_chosen:
+            for item in group:
+                if item.slot == "Ring": best_set.rings.append(item)
+                elif item.slot == "Tool": best_set.tools.append(item)
+                else: setattr(best_set, item.slot.lower(), item)
+        return best_set
+
+    def is_valid(self, gearset: GearSet) -> bool:
+        """Whether a loadout (of any optimizer) fits the bound call's search: slot counts, tool keywords, set bonuses and requirements."""
+        items = gearset.all_items
+        return (len(gearset.rings) <= 2 and len(gearset.tools) <= self.tool_slots and self._is_valid_tool_set(gearset.tools)
+                and self._distinct_tools(gearset.tools) and SetTracker(items).all_satisfied(items)
+                and self.requirements.is_satisfied(items) and all(self.requirements.allows(item) for item in items))
+
+    def _distinct_tools(self, tools) -> bool:
+        """Versions of one tool (e.g. "Omni-tool (Base)" and "Omni-tool (200+)") can't be worn together."""
+        names = [tool.clean_item_name or tool.name for tool in tools]
+        return len(names) == len(set(names))
+
+    def _decisions(self, candidates: Dict[str, List[Item]], dims: List[str]) -> List[List[Tuple[Tuple[Item, ...], tuple]]]:
+        """
+        One decision per single slot, one for the ring pair and one for the tool subset. Every option is
+        (items, summed stat vector), the empty choice included, best standalone score first.
+        """
+        groups = [[(item,) for item in candidates.get(slot.capitalize(), [])] for slot in SINGLE_SLOTS]
+        rings = candidates.get("Ring", [])
+        groups.append([(ring,) for ring in rings] + list(itertools.combinations_with_replacement(rings, 2)))
+        tools = candidates.get("Tool", [])
+        groups.append([subset for r in range(1, self.tool_slots + 1) for subset in itertools.combinations(tools, r)
+                       if self._is_valid_tool_set(list(subset)) and self._distinct_tools(subset)])
+
+        decisions = []
+        for options in groups:
+            if not options: continue
+            options = [((), tuple(0 for _ in dims))] + [(items, self._vector(items, dims)) for items in options]
+            options = self._without_dominated(options)
+            options.sort(key=lambda option: self._score(option[1], dims), reverse=True)
+            # A slot whose only option left is to stay empty adds nothing
+            if any(items for items, _ in options): decisions.append(options)
+        return decisions
+
+    def _vector(self, items: Tuple[Item, ...], dims: List[str]) -> tuple:
+        return tuple(sum(self._stats_of(item)[d] for item in items) for d in dims)
+
+    def _without_dominated(self, options: list) -> list:
+        """Drops options another one matches or beats in every stat. Options with set or required items are never dropped or used to drop."""
+        free = [not any(item.set_name or self.requirements.keywords_of(item) for item in items) for items, _ in options]
+        kept = []
+        for i, (items, vector) in enumerate(options):
+            if free[i] and any(
+                free[j] and j != i and all(o >= v for o, v in zip(other, vector)) and (other != vector or j < i)
+                for j, (_, other) in enumerate(options)
+            ): continue
+            kept.append((items, vector))
+        return kept
+
+    def _score(self, values: tuple, dims: List[str]) -> float:
+        stats = dict(self._empty_stats)
+        for d, value in zip(dims, values):
+            stats[d] = value
+        return self.calculate_score_for_stats(cap_stats(stats))
+
+
+class BenchmarkRow(BaseModel):
+    activity: str
+    target: str
+    seed: int
+    inventory_size: int
+    optimizer: str
+    score: float
+    optimum: float
+    gap: float  # (optimum - score) / optimum, 0 if the optimizer found an optimum
+    valid: bool  # False if the loadout breaks a set bonus or tool rule, its score isn't comparable then
+    seconds: float
+    oracle_seconds: float
+
+
+class OptimizerSummary(BaseModel):
+    optimizer: str
+    cases: int
+    invalid: int
+    optimal: int
+    mean_gap: float  # over the valid loadouts
+    max_gap: float
+    seconds: float
+
+
+def sample_inventory(items: List[Item], activity: Activity, size: int, seed: int) -> List[Item]:
+    """`size` random candidates of the activity, in catalogue order. The same seed gives the same inventory."""
+    candidates = [item for item in items if is_candidate(item, activity)]
+    picked = set(random.Random(seed).sample(range(len(candidates)), min(size, len(candidates))))
+    return [item for i, item in enumerate(candidates) if i in picked]
+
+def _timed_optimize(name: str, items: List[Item], activity: Activity, target: OPTIMAZATION_TARGET,
+                    player_level: int, player_skill_level: int) -> Optional[Tuple[GearSet, float, GearOptimizer]]:
+    """(gearset, seconds, optimizer), None if the optimizer doesn't know the target. The optimizer is the one bound to the call, except legacy."""
+    optimizer, targets = make_optimizer(name, items)
+    if target.name not in targets.__members__: return None
+    start = time.perf_counter()
+    if name == "legacy":
+        gearset = optimizer.optimize(activity, player_level=player_level, player_skill_level=player_skill_level,
+                                     optimazation_target=targets[target.name])
+    else:
+        optimizer = optimizer.bind(activity, player_level, player_skill_level, targets[target.name])
+        gearset = optimizer.search().gearset
+    return gearset, time.perf_counter() - start, optimizer
+
+def run_benchmark(items: List[Item], activities: List[Activity], targets: Sequence[OPTIMAZATION_TARGET],
+                  optimizers: Sequence[str] = ("q", "dp", "legacy"), inventory_size: int = 20, seeds: Sequence[int] = (0, 1, 2),
+                  player_level: int = 99, player_skill_level: int = 99) -> List[BenchmarkRow]:
+    """
+    Every optimizer on sampled inventories of every activity and target, against the exhaustive optimum.
+    All loadouts are scored with the same closed-form score (simulator.analytic_score).
+    """
+    from simulator import analytic_score
+    rows = []
+    for activity in activities:
+        for seed in seeds:
+            inventory = sample_inventory(items, activity, inventory_size, seed)
+            for target in targets:
+                oracle, oracle_seconds, exhaustive = _timed_optimize("oracle", inventory, activity, target, player_level, player_skill_level)
+                optimum = analytic_score(oracle, activity, player_skill_level, target)
+                for name in optimizers:
+                    timed = _timed_optimize(name, inventory, activity, target, player_level, player_skill_level)
+                    if timed is None: continue
+                    gearset, seconds, _ = timed
+                    score = analytic_score(gearset, activity, player_skill_level, target)
+                    rows.append(BenchmarkRow(
+                        activity=activity.activity, target=target.name, seed=seed, inventory_size=len(inventory),
+                        optimizer=name, score=score, optimum=optimum, gap=(optimum - score) / optimum if optimum > 0 else 0.0,
+                        valid=exhaustive.is_valid(gearset), seconds=seconds, oracle_seconds=oracle_seconds,
+                    ))
+    return rows
+
+def summarize(rows: List[BenchmarkRow]) -> List[OptimizerSummary]:
+    by_optimizer: Dict[str, List[BenchmarkRow]] = {}
+    for row in rows:
+        by_optimizer.setdefault(row.optimizer, []).append(row)
+    summaries = []
+    for name, group in by_optimizer.items():
+        gaps = [row.gap for row in group if row.valid]
+        summaries.append(OptimizerSummary(
+            optimizer=name, cases=len(group), invalid=len(group) - len(gaps), optimal=sum(gap <= OPTIMAL_GAP for gap in gaps),
+            mean_gap=sum(gaps) / len(gaps) if gaps else 0.0, max_gap=max(gaps, default=0.0),
+            seconds=sum(row.seconds for row in group),
+        ))
+    return summaries
@@ -0,0 +1,76 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+from models import Activity
+from utils import calculate_steps
+
+MIN_STEPS = 10  # calculate_steps never goes below this
+
+
+class StepBreakpoint(BaseModel):
+    steps: int
+    # Pareto-minimal (gear work efficiency, percent step reduction, flat step reduction) reaching `steps`
+    requirements: List[Tuple[float, float, int]]
+
+
+class StepBreakpoints:
+    """
+    Steps per action are a staircase in work efficiency: ceil(base / (1 + eff) * (1 - pct)) - flat, at least 10.
+    For a percent and flat reduction, `steps` is reached from eff = base * (1 - pct) / (steps + flat) - 1 on
+    (minus the level's efficiency, capped by the activity). `min_efficiency` gives the exact float threshold,
+    so comparing a loadout's efficiency with it tells whether the loadout reaches a step count without
+    computing the steps or scoring the loadout.
+    """
+    def __init__(self, activity: Activity, player_skill_level: int):
+        self.activity = activity
+        self.player_skill_level = player_skill_level
+        level_diff = max(0, player_skill_level - activity.skill_level)
+        self.level_efficiency = min(0.25, level_diff * 0.0125)
+        self._thresholds: Dict[Tuple[int, float, int], Optional[float]] = {}
+
+    def steps(self, efficiency: float, pct: float = 0.0, flat: int = 0) -> int:
+        return calculate_steps(self.activity, self.player_skill_level, efficiency, flat, pct)
+
+    def min_efficiency(self, steps: int, pct: float = 0.0, flat: int = 0) -> Optional[float]:
+        """Smallest gear work efficiency giving at most `steps` per action, None if no efficiency reaches it."""
+        key = (steps, pct, flat)
+        if key not in self._thresholds:
+            self._thresholds[key] = self._min_efficiency(steps, pct, flat)
+        return self._thresholds[key]
+
+    def _min_efficiency(self, steps: int, pct: float, flat: int) -> Optional[float]:
+        if steps >= self.steps(0.0, pct, flat): return 0.0
+        if steps < MIN_STEPS or steps + flat <= 0: return None
+        # Every efficiency past the cap gives the same steps
+        if self.steps(self.activity.max_work_efficiency, pct, flat) > steps: return None
+        needed = self.activity.base_steps * (1.0 - pct) / (steps + flat) - 1.0 - self.level_efficiency
+        efficiency = max(0.0, needed)
+        # The closed form can be an ulp off the float staircase, walk to the exact smallest float
+        while self.steps(efficiency, pct, flat) > steps:
+            efficiency = math.nextafter(efficiency, math.inf)
+        while efficiency > 0.0 and self.steps(math.nextafter(efficiency, -math.inf), pct, flat) <= steps:
+            efficiency = math.nextafter(efficiency, -math.inf)
+        return efficiency
+
+    def next_breakpoint(self, efficiency: float, pct: float = 0.0, flat: int = 0) -> Optional[Tuple[int, float]]:
+        """(steps, gear efficiency) of the next lower step count with the same reductions, None at the bottom."""
+        steps = self.steps(efficiency, pct, flat)
+        threshold = self.min_efficiency(steps - 1, pct, flat)
+        return None if threshold is None else (steps - 1, threshold)
+
+    def table(self, reductions: Iterable[Tuple[float, int]] = ((0.0, 0),)) -> List[StepBreakpoint]:
+        """
+        Every step count reachable with one of the (percent, flat) reductions, from the slowest down, with the
+        combinations of efficiency and reduction that reach it (combinations needing more of everything dropped).
+        """
+        reductions = list(reductions)
+        slowest = max(self.steps(0.0, pct, flat) for pct, flat in reductions)
+        table = []
+        for steps in range(slowest, MIN_STEPS - 1, -1):
+            options = []
+            for pct, flat in reductions:
+                efficiency = self.min_efficiency(steps, pct, flat)
+                if efficiency is not None: options.append((efficiency, pct, flat))
+            front = [o for o in options if not any(p != o and p[0] <= o[0] and p[1] <= o[1] and p[2] <= o[2] for p in options)]
+            if front: table.append(StepBreakpoint(steps=steps, requirements=sorted(set(front))))
+        return table
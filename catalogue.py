@@ -0,0 +1,238 @@
+import io
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from models import Item, Activity
+from utils import parse_csv_rows, catalogue_version
+from gear_optimizer_q import is_candidate
+
+ItemKey = Tuple[str, Optional[str]]      # (Item, Skill) identifies an item row
+ActivityKey = Tuple[str, str]            # ("activity" | "recipe", name)
+
+
+class CatalogueChange(BaseModel):
+    version: str
+    previous_version: Optional[str] = None
+    items_added: List[ItemKey] = Field(default_factory=list)
+    items_changed: List[ItemKey] = Field(default_factory=list)
+    items_removed: List[ItemKey] = Field(default_factory=list)
+    activities_added: List[ActivityKey] = Field(default_factory=list)
+    activities_changed: List[ActivityKey] = Field(default_factory=list)
+    activities_removed: List[ActivityKey] = Field(default_factory=list)
+    # Old and new objects of every changed or removed row, to decide which cached results they affect
+    old_items: List[Item] = Field(default_factory=list)
+    new_items: List[Item] = Field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.items_added or self.items_changed or self.items_removed
+                    or self.activities_added or self.activities_changed or self.activities_removed)
+
+    @property
+    def touched_activities(self) -> set:
+        """Names of the activities whose rows changed or disappeared."""
+        return {name for _, name in self.activities_changed + self.activities_removed}
+
+
+class CatalogueSnapshot:
+    """
+    One consistent version of the catalogue with its indexes. Snapshots are never modified,
+    a reload builds a new one, so a request keeps working on the version it started with.
+    """
+    def __init__(self, version: str, items: List[Item], item_keys: List[ItemKey], activities: List[Activity], activity_keys: List[ActivityKey]):
+        self.version = version
+        self.items = items
+        self.activities = activities
+        self.items_by_key: Dict[ItemKey, Item] = dict(zip(item_keys, items))
+        self.activities_by_key: Dict[ActivityKey, Activity] = dict(zip(activity_keys, activities))
+        self.activities_by_name: Dict[str, Activity] = {a.activity: a for a in activities}
+        self.items_by_export_name: Dict[str, List[Item]] = {}
+        for item in items:
+            if item.export_name: self.items_by_export_name.setdefault(item.export_name, []).append(item)
+
+
+class _TableState:
+    """Raw rows and parsed objects of one catalogue table, keyed by row key, in file order."""
+    def __init__(self):
+        self.rows: Dict[Hashable, dict] = {}
+        self.objects: Dict[Hashable, Any] = {}
+
+
+class Catalogue:
+    """
+    items.csv, activities.csv and recipes.csv loaded once and kept up to date.
+    `check_for_changes` (or the polling thread from `watch`) diffs the files row by row: unchanged rows keep
+    their objects, only added and changed rows are parsed again. Listeners get a CatalogueChange per reload.
+    """
+    def __init__(self, items_file: str = "items.csv", activities_file: str = "activities.csv", recipes_file: str = "recipes.csv"):
+        self.items_file = items_file
+        self.activities_file = activities_file
+        self.recipes_file = recipes_file
+        self._items = _TableState()
+        self._activities = _TableState()
+        self._stamps = None
+        self._snapshot: Optional[CatalogueSnapshot] = None
+        self._listeners: List[Callable[[CatalogueChange], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[Exception] = None
+        self.reload()
+
+    # --- Reading ---
+    def snapshot(self) -> CatalogueSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    @property
+    def items(self) -> List[Item]:
+        return self._snapshot.items
+
+    @property
+    def activities(self) -> List[Activity]:
+        return self._snapshot.activities
+
+    def on_change(self, listener: Callable[[CatalogueChange], None]):
+        self._listeners.append(listener)
+
+    # --- Reloading ---
+    def _files(self) -> List[str]:
+        return [self.items_file, self.activities_file, self.recipes_file]
+
+    def _file_stamps(self) -> tuple:
+        stamps = []
+        for path in self._files():
+            stat = os.stat(path)
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+
+    def check_for_changes(self) -> Optional[CatalogueChange]:
+        """Reloads if any file was touched since the last load. Returns the change, or None if nothing changed."""
+        if self._file_stamps() == self._stamps: return None
+        change = self.reload()
+        return None if change.is_empty else change
+
+    def reload(self) -> CatalogueChange:
+        with self._lock:
+            stamps = self._file_stamps()
+            texts = []
+            for path in self._files():
+                with open(path, encoding="utf-8", newline="") as f:
+                    texts.append(f.read())
+            version = catalogue_version(texts)
+            previous = self._snapshot
+            if previous is not None and previous.version == version:
+                self._stamps = stamps
+                return CatalogueChange(version=version, previous_version=version)
+
+            items_text, activities_text, recipes_text = texts
+            item_rows = {(row["Item"], row.get("Skill")): row for row in parse_csv_rows(io.StringIO(items_text), "Item")}
+            activity_rows = {("activity", row["Activity"]): row for row in parse_csv_rows(io.StringIO(activities_text), "Activity")}
+            activity_rows.update({("recipe", row["Recipe"]): row for row in parse_csv_rows(io.StringIO(recipes_text), "Recipe")})
+
+            change = CatalogueChange(version=version, previous_version=previous.version if previous else None)
+            old_items = self._apply(self._items, item_rows, lambda key, row: Item.from_csv_row(row),
+                                    change.items_added, change.items_changed, change.items_removed)
+            self._apply(self._activities, activity_rows, _parse_activity,
+                        change.activities_added, change.activities_changed, change.activities_removed)
+            change.old_items = [old_items[key] for key in change.items_changed + change.items_removed]
+            change.new_items = [self._items.objects[key] for key in change.items_added + change.items_changed]
+
+            self._snapshot = CatalogueSnapshot(
+                version, list(self._items.objects.values()), list(self._items.objects.keys()),
+                list(self._activities.objects.values()), list(self._activities.objects.keys()),
+            )
+            self._stamps = stamps
+            listeners = list(self._listeners)
+
+        if previous is not None:
+            for listener in listeners:
+                listener(change)
+        return change
+
+    def _apply(self, table: _TableState, rows: Dict[Hashable, dict], parse: Callable, added: list, changed: list, removed: list):
+        """Brings `table` to `rows`, re-parsing only added and changed rows. Returns the previous objects."""
+        old_objects, old_rows = table.objects, table.rows
+        objects = {}
+        for key, row in rows.items():
+            old_row = old_rows.get(key)
+            if old_row == row:
+                objects[key] = old_objects[key]
+                continue
+            objects[key] = parse(key, row)
+            (added if old_row is None else changed).append(key)
+        removed.extend(key for key in old_rows if key not in rows)
+        table.objects, table.rows = objects, rows
+        return old_objects
+
+    # --- Watching ---
+    def watch(self, interval: float = 2.0):
+        """Starts a daemon thread that polls the files every `interval` seconds."""
+        if self._thread is not None and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, args=(interval,), name="catalogue-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check_for_changes()
+                self.last_error = None
+            except Exception as e:
+                # E.g. a file caught halfway through being rewritten, keep serving the last good version and retry
+                self.last_error = e
+
+
+def _parse_activity(key: ActivityKey, row: dict) -> Activity:
+    if key[0] == "recipe": return Activity.from_recipe_csv_row(row)
+    return Activity.from_activity_csv_row(row)
+
+
+class ResultCache:
+    """
+    Optimization results that survive catalogue reloads. Every entry remembers the activity it was computed
+    for, and a change only evicts entries whose activity changed or for which a changed item is a candidate.
+    """
+    def __init__(self, catalogue: Catalogue, max_entries: int = 1024):
+        self.catalogue = catalogue
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[Activity, Any]] = {}
+        self._lock = threading.Lock()
+        catalogue.on_change(self.invalidate)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def put(self, key: Hashable, activity: Activity, value: Any, version: str):
+        """`version` is the catalogue version the value was computed on, results of an outdated version are dropped."""
+        with self._lock:
+            if version != self.catalogue.version: return
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (activity, value)
+
+    def invalidate(self, change: CatalogueChange):
+        touched_activities = change.touched_activities
+        touched_items = change.old_items + change.new_items
+        with self._lock:
+            for key, (activity, _) in list(self._entries.items()):
+                if activity.activity in touched_activities or any(is_candidate(item, activity) for item in touched_items):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,225 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from models import Item, Activity, GearSet
+from utils import calculate_steps
+from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET, is_candidate
+if TYPE_CHECKING: from columnar import ColumnarCatalogue
+
+
+class ChainStage(BaseModel):
+    """
+    One node of an activity chain. `inputs` maps the name of an upstream stage
+    to the quantity of its output consumed by a single action of this stage.
+    """
+    activity: str
+    target: OPTIMAZATION_TARGET = OPTIMAZATION_TARGET.reward_rolls
+    output_per_action: float = 1.0
+    inputs: Dict[str, float] = Field(default_factory=dict)
+
+
+class ActivityChain(BaseModel):
+    """
+    DAG of stages, e.g. mine ore -> smelt bar -> smith pickaxe.
+    `goal` is the stage whose output we want `goal_quantity` of.
+    """
+    name: str
+    stages: Dict[str, ChainStage]
+    goal: str
+    goal_quantity: float = 1.0
+
+
+class StageLoadout(BaseModel):
+    activity: str
+    target: OPTIMAZATION_TARGET
+    skill_level: int
+    gearset: GearSet
+    stats: Dict[str, float]
+    steps_per_action: int
+
+
+class StagePlan(BaseModel):
+    stage: str
+    loadout: StageLoadout
+    quantity: float
+    actions: float
+    expected_steps: float
+
+
+class ChainPlan(BaseModel):
+    chain: str
+    stages: List[StagePlan]
+    total_steps: float
+
+
+def topological_order(chain: ActivityChain) -> List[str]:
+    """Returns the stages ordered so that every stage comes after its inputs."""
+    order = []
+    state = {}  # 1 = visiting, 2 = done
+
+    def visit(name: str):
+        if state.get(name) == 2: return
+        if state.get(name) == 1:
+            raise ValueError(f"Chain '{chain.name}' contains a cycle at stage '{name}'")
+        if name not in chain.stages:
+            raise ValueError(f"Chain '{chain.name}' references unknown stage '{name}'")
+        state[name] = 1
+        for input_name in chain.stages[name].inputs:
+            visit(input_name)
+        state[name] = 2
+        order.append(name)
+
+    for name in chain.stages:
+        visit(name)
+    return order
+
+
+def expected_actions(quantity: float, output_per_action: float, stats: Dict[str, float]) -> float:
+    """Actions needed for `quantity` outputs. Double rewards doubles the output of an action."""
+    return quantity / (output_per_action * (1.0 + stats["double_rewards"]))
+
+
+def expected_steps(actions: float, steps_per_action: int, stats: Dict[str, float]) -> float:
+    """Double action completes a second action for the steps of one."""
+    return actions * steps_per_action / (1.0 + stats["double_action"])
+
+
+def consumed_materials(actions: float, quantity_per_action: float, stats: Dict[str, float]) -> float:
+    """Same no-mats cap as the optimizer's materials target."""
+    return actions * quantity_per_action * (1.0 - min(0.99, stats["no_mats"]))
+
+
+# --- Worker side ---
+# Items are handed to each worker once through the initializer instead of with every stage,
+# or, with a columnar catalogue, mapped by the worker and materialized per stage from the rows it gets
+_worker_items: List[Item] = []
+_worker_columnar: Optional["ColumnarCatalogue"] = None
+
+def _init_worker(items: List[Item], columnar_path: Optional[str] = None):
+    global _worker_items, _worker_columnar
+    _worker_items = items
+    if columnar_path:
+        from columnar import ColumnarCatalogue
+        _worker_columnar = ColumnarCatalogue.open(columnar_path)
+
+def _optimize_stage(activity: Activity, target: OPTIMAZATION_TARGET, player_level: int, skill_level: int,
+                    rows: Optional[List[int]] = None) -> StageLoadout:
+    items = _worker_items if rows is None else _worker_columnar.items.get_many(rows)
+    return optimize_stage(items, activity, target, player_level, skill_level)
+
+
+def optimize_stage(items: List[Item], activity: Activity, target: OPTIMAZATION_TARGET, player_level: int, skill_level: int) -> StageLoadout:
+    optimizer = GearOptimizer(items)
+    gearset = optimizer.optimize(activity, player_level=player_level, player_skill_level=skill_level, optimazation_target=target)
+    stats = gearset.get_stats(activity.skill)
+    steps = calculate_steps(
+        activity, skill_level, stats["work_efficiency"],
+        stats["flat_step_reduction"], stats["percent_step_reduction"]
+    )
+    return StageLoadout(
+        activity=activity.activity,
+        target=target,
+        skill_level=skill_level,
+        gearset=gearset,
+        stats=stats,
+        steps_per_action=steps,
+    )
+
+
+class ChainPlanner:
+    """
+    Optimizes a gearset for every stage of one or more activity chains and
+    computes the total expected steps to reach each chain's goal.
+    Stage loadouts are cached by (activity, target, skill level), so an
+    activity shared between chains is only optimized once.
+    """
+    def __init__(self, items: List[Item], activities: List[Activity], player_level: int = 99,
+                 player_skill_level: int = 99, skill_levels: Optional[Dict[str, int]] = None, workers: int = 1,
+                 columnar: Optional["ColumnarCatalogue"] = None):
+        self.items = items
+        self.activities = {a.activity: a for a in activities}
+        self.player_level = player_level
+        self.player_skill_level = player_skill_level
+        self.skill_levels = skill_levels or {}
+        self.workers = workers
+        self.columnar = columnar
+        self.stage_results: Dict[Tuple[str, OPTIMAZATION_TARGET, int], StageLoadout] = {}
+
+    def _skill_level(self, activity: Activity) -> int:
+        return self.skill_levels.get(activity.skill, self.player_skill_level)
+
+    def _stage_key(self, stage: ChainStage) -> Tuple[str, OPTIMAZATION_TARGET, int]:
+        activity = self.activities.get(stage.activity)
+        if activity is None:
+            raise ValueError(f"Unknown activity or recipe '{stage.activity}'")
+        return (activity.activity, stage.target, self._skill_level(activity))
+
+    def optimize_stages(self, chains: List[ActivityChain]):
+        """
+        Optimizes every stage not already cached. Stage gearsets don't depend
+        on each other, so all missing stages are submitted to the pool at once.
+        """
+        missing = []
+        for chain in chains:
+            for stage in chain.stages.values():
+                key = self._stage_key(stage)
+                if key not in self.stage_results and key not in missing:
+                    missing.append(key)
+        if not missing: return
+
+        if self.workers <= 1 or len(missing) == 1:
+            for activity_name, target, skill_level in missing:
+                self.stage_results[(activity_name, target, skill_level)] = optimize_stage(
+                    self.items, self.activities[activity_name], target, self.player_level, skill_level
+                )
+            return
+
+        # Stage candidates as columnar rows, None if some item isn't in the columnar catalogue
+        stage_rows = {key: self._candidate_rows(self.activities[key[0]]) for key in missing}
+        if all(rows is not None for rows in stage_rows.values()):
+            initargs = ([], self.columnar.path)
+        else:
+            initargs, stage_rows = (self.items,), dict.fromkeys(missing)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(missing)), initializer=_init_worker, initargs=initargs) as pool:
+            futures = {
+                key: pool.submit(_optimize_stage, self.activities[key[0]], key[1], self.player_level, key[2], stage_rows[key])
+                for key in missing
+            }
+            for key, future in futures.items():
+                self.stage_results[key] = future.result()
+
+    def _candidate_rows(self, activity: Activity) -> Optional[List[int]]:
+        if self.columnar is None: return None
+        return self.columnar.item_rows([item for item in self.items if is_candidate(item, activity)])
+
+    def plan_chain(self, chain: ActivityChain) -> ChainPlan:
+        if chain.goal not in chain.stages:
+            raise ValueError(f"Goal '{chain.goal}' is not a stage of chain '{chain.name}'")
+        order = topological_order(chain)
+        self.optimize_stages([chain])
+
+        # Walk from the goal back to the raw materials, so every stage knows its full demand before it passes it on
+        needed = {name: 0.0 for name in order}
+        needed[chain.goal] = chain.goal_quantity
+        stage_plans = []
+        for name in reversed(order):
+            stage = chain.stages[name]
+            loadout = self.stage_results[self._stage_key(stage)]
+            actions = expected_actions(needed[name], stage.output_per_action, loadout.stats)
+            for input_name, quantity_per_action in stage.inputs.items():
+                needed[input_name] += consumed_materials(actions, quantity_per_action, loadout.stats)
+            stage_plans.append(StagePlan(
+                stage=name,
+                loadout=loadout,
+                quantity=needed[name],
+                actions=actions,
+                expected_steps=expected_steps(actions, loadout.steps_per_action, loadout.stats),
+            ))
+        stage_plans.reverse()
+        return ChainPlan(chain=chain.name, stages=stage_plans, total_steps=sum(s.expected_steps for s in stage_plans))
+
+    def plan(self, chains: List[ActivityChain]) -> List[ChainPlan]:
+        for chain in chains:
+            topological_order(chain)  # Fail fast on broken chains before optimizing anything
+        self.optimize_stages(chains)
+        return [self.plan_chain(chain) for chain in chains]
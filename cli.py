@@ -0,0 +1,513 @@
+"""
+Command line interface: `python cli.py <command> --help`.
+Only the standard library is imported up front. Each command imports the models and optimizers it uses,
+so listing activities never loads pydantic or numpy and a batch run never loads the optimizers it doesn't use.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from optimizers import OPTIMIZERS, make_optimizer
+
+CACHE_DIR = os.path.join(".cache", "cli")
+# Mirrors gear_optimizer_q.OPTIMAZATION_TARGET, kept as names so the parser doesn't import the optimizer
+TARGETS = ["reward_rolls", "xp", "chests", "materials", "fine", "collectibles", "quality", "gems", "bird_nests", "coin_pouches"]
+STORE_BATCH = 50  # Results a batch run buffers before writing them to the store
+
+
+# --- Catalogue cache ---
+def _stamps(args) -> list:
+    """(path, mtime_ns, size) of the three CSVs, a cache is valid while these match."""
+    stamps = []
+    for path in (args.items, args.activities, args.recipes):
+        stat = os.stat(path)
+        stamps.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+    return stamps
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def load_catalogue(args):
+    """(items, activities, catalogue version), unpickled from the cache or parsed from the CSVs and cached."""
+    import pickle
+    stamps = _stamps(args)
+    path = os.path.join(args.cache_dir, "catalogue.pickle")
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["stamps"] == stamps:
+            return cached["items"], cached["activities"], cached["version"]
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+
+    from utils import parse_csv_to_items, parse_csv_to_activities, catalogue_version
+    items = parse_csv_to_items(args.items)
+    activities = parse_csv_to_activities(activities_file_path=args.activities, recipes_file_path=args.recipes)
+    texts = []
+    for file_path in (args.items, args.activities, args.recipes):
+        with open(file_path, encoding="utf-8", newline="") as f:
+            texts.append(f.read())
+    version = catalogue_version(texts)  # Same version as catalogue.Catalogue, so the app and the CLI share stored results
+    cached = {"stamps": stamps, "items": items, "activities": activities, "version": version}
+    _write_atomic(path, pickle.dumps(cached, protocol=pickle.HIGHEST_PROTOCOL))
+    index = [{"activity": a.activity, "skill": a.skill, "skill_level": a.skill_level, "is_recipe": a.is_recipe} for a in activities]
+    _write_atomic(os.path.join(args.cache_dir, "activities.json"), json.dumps({"stamps": stamps, "activities": index}).encode("utf-8"))
+    return items, activities, version
+
+def load_activity_index(args) -> list:
+    """Name, skill, level and kind of every activity and recipe, from a JSON cache that needs no models."""
+    try:
+        with open(os.path.join(args.cache_dir, "activities.json"), encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["stamps"] == _stamps(args):
+            return cached["activities"]
+    except (OSError, ValueError, KeyError):
+        pass
+    load_catalogue(args)
+    return load_activity_index(args)
+
+
+# --- Helpers ---
+def load_inventory(path: str, items: list) -> list:
+    """Items owned according to a WalkScape user export, or a JSON list of item names / export names."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        names = set(data)
+        return [item for item in items if item.name in names or item.export_name in names]
+    if not data: return items  # Empty export, same as main.py: use everything
+    from utils import filter_owned_items
+    return filter_owned_items(items, data)
+
+def find_activity(activities: list, name: str):
+    activity = next((a for a in activities if a.activity == name), None)
+    if activity is None:
+        lowered = name.lower()
+        matches = [a for a in activities if lowered in a.activity.lower()]
+        if len(matches) == 1: return matches[0]
+        hint = f", did you mean one of: {', '.join(a.activity for a in matches[:5])}" if matches else ""
+        raise SystemExit(f"Unknown activity or recipe '{name}'{hint}")
+    return activity
+
+def open_store(args):
+    """The on-disk result store, None with --no-store."""
+    if args.no_store: return None
+    from result_store import ResultStore
+    return ResultStore(args.store)
+
+def run_stored(args, store, version: str, items: list, activity, target: str):
+    """run_optimizer behind the result store: (gearset, score, export string, True if it came from the store)."""
+    from result_store import StoreKey, optimize_with_store
+    from utils import inventory_fingerprint
+    key = StoreKey(catalogue_version=version, activity=activity.activity, target=target, level=args.level,
+                   skill_level=args.skill_level, inventory=inventory_fingerprint(items), optimizer=stored_optimizer_name(args))
+    items_by_key = {(item.name, item.skill): item for item in items}
+    result, hit = optimize_with_store(store, key, items_by_key, activity, lambda: run_optimizer(args, items, activity, target))
+    return result.gearset, result.score, result.export, hit
+
+def stored_optimizer_name(args) -> str:
+    """Multi-start and lns results depend on their budget and seed, they are stored per setting."""
+    starts = getattr(args, "starts", 1)
+    if args.optimizer == "lns":
+        budget = f"{args.time_limit}s" if args.time_limit is not None else f"it{args.iterations}"
+        return f"lns-{budget}-seed{args.seed}"
+    if args.optimizer != "q" or starts <= 1: return args.optimizer
+    return f"q-starts{starts}-seed{args.seed}"
+
+def run_optimizer(args, items: list, activity, target: str):
+    """`target` is a target name, or a weighted objective like "xp=0.7,chests=0.3"."""
+    optimizer, targets = make_optimizer(args.optimizer, items, workers=getattr(args, "workers", 1), iterations=getattr(args, "iterations", 2000),
+                                        time_limit=getattr(args, "time_limit", None), seed=getattr(args, "seed", 0),
+                                        max_states=getattr(args, "max_states", None))
+    if "=" in target and args.optimizer != "legacy":
+        from scoring import WeightedObjective
+        try: objective = WeightedObjective.parse(target)
+        except ValueError as e: raise SystemExit(f"Invalid weighted objective '{target}': {e}")
+    elif target in targets.__members__:
+        objective = targets[target]
+    else:
+        raise SystemExit(f"The {args.optimizer} optimizer has no target '{target}'")
+    if args.optimizer == "q" and getattr(args, "starts", 1) > 1:
+        result = optimizer.optimize_multi_start(activity, args.level, args.skill_level, objective, starts=args.starts, seed=args.seed)
+        print(f"{args.starts} starts, {result.distinct_loadouts} distinct results, scores {result.min_score:.6f} to "
+              f"{result.best.score:.6f} (mean {result.mean_score:.6f}), best from start {result.best_start}", file=sys.stderr)
+        return result.best.gearset, result.best.score
+    if args.optimizer == "legacy":
+        return optimizer.optimize(activity, player_level=args.level, player_skill_level=args.skill_level, optimazation_target=objective), None
+    result = optimizer.optimize_with_info(activity, player_level=args.level, player_skill_level=args.skill_level, optimazation_target=objective)
+    return result.gearset, result.score
+
+def gearset_summary(gearset, activity, skill_level: int) -> dict:
+    from utils import calculate_steps
+    stats = gearset.get_stats(activity.skill)
+    steps = calculate_steps(activity, skill_level, stats["work_efficiency"], stats["flat_step_reduction"], stats["percent_step_reduction"])
+    xp_per_action = ((activity.base_xp or 0.0) * (1.0 + stats["xp_percent"]) + stats["flat_xp"]) * (1.0 + stats["double_action"])
+    return {"steps": steps, "xp_per_action": xp_per_action, "stats": stats}
+
+def gearset_slots(gearset) -> dict:
+    from gear_optimizer_q import SINGLE_SLOTS
+    slots = {slot: getattr(gearset, slot).name for slot in SINGLE_SLOTS if getattr(gearset, slot)}
+    if gearset.rings: slots["rings"] = [i.name for i in gearset.rings]
+    if gearset.tools: slots["tools"] = [i.name for i in gearset.tools]
+    return slots
+
+
+# --- Commands ---
+def cmd_list_activities(args) -> int:
+    for entry in load_activity_index(args):
+        if args.skill and (entry["skill"] or "").lower() != args.skill.lower(): continue
+        if args.only_recipes and not entry["is_recipe"]: continue
+        if args.only_activities and entry["is_recipe"]: continue
+        level = entry["skill_level"] if entry["skill_level"] is not None else "-"
+        print(f"{entry['activity']}\t{entry['skill'] or '-'}\t{level}")
+    return 0
+
+def cmd_optimize(args) -> int:
+    items, activities, version = load_catalogue(args)
+    if args.inventory: items = load_inventory(args.inventory, items)
+    activity = find_activity(activities, args.activity)
+    target = args.target
+    if args.weights:
+        from scoring import WeightedObjective
+        # Stored under the canonical spelling, "xp=.7" and "xp=0.7" are the same objective
+        try: target = WeightedObjective.parse(args.weights).name
+        except ValueError as e: raise SystemExit(f"Invalid weighted objective '{args.weights}': {e}")
+    gearset, score, export, stored = run_stored(args, open_store(args), version, items, activity, target)
+    summary = gearset_summary(gearset, activity, args.skill_level)
+
+    if args.json:
+        print(json.dumps({"activity": activity.activity, "target": target, "score": score, "slots": gearset_slots(gearset),
+                          "steps": summary["steps"], "xp_per_action": summary["xp_per_action"], "export": export, "stored": stored}))
+        return 0
+
+    print(f"--- Optimization Result for {activity.activity} ({target}) ---")
+    for slot, names in gearset_slots(gearset).items():
+        print(f"{slot.capitalize()}: {', '.join(names) if isinstance(names, list) else names}")
+    stats, steps = summary["stats"], summary["steps"]
+    print("\n--- Projected Stats ---")
+    print(f"Steps per Action: {steps} (Base: {activity.base_steps})")
+    from breakpoints import StepBreakpoints
+    following = StepBreakpoints(activity, args.skill_level).next_breakpoint(
+        stats["work_efficiency"], stats["percent_step_reduction"], stats["flat_step_reduction"])
+    if following: print(f"Next Breakpoint:  {following[0]} steps at {following[1]*100:.2f}% work efficiency")
+    print(f"XP per Action:    {summary['xp_per_action']:.2f}")
+    print(f"XP per Step:      {summary['xp_per_action'] / steps:.4f}")
+    if score is not None: print(f"Score:            {score:.6f}")
+    print("\n--- Modifiers ---")
+    print(f"Work Eff: {stats['work_efficiency']*100:.1f}%")
+    print(f"XP Bonus: {stats['xp_percent']*100:.1f}%")
+    print(f"Dbl Act:  {stats['double_action']*100:.1f}%")
+    print("\n--- Export Code ---")
+    print(export)
+    if stored: print("\n(from the result store)")
+    return 0
+
+def parse_route(activities: list, stops: list):
+    """A Route from "Activity name=share" terms, the share defaults to 1."""
+    from scoring import Route, RouteStop
+    parsed = []
+    for stop in stops:
+        name, sep, share = stop.rpartition("=")
+        if not sep: name, share = stop, ""
+        activity = find_activity(activities, name.strip())
+        try: parsed.append(RouteStop(activity=activity, share=float(share) if share.strip() else 1.0))
+        except ValueError: raise SystemExit(f"Invalid share in '{stop}'")
+    try: return Route(stops=parsed)
+    except ValueError as e: raise SystemExit(f"Invalid route: {e}")
+
+def cmd_route(args) -> int:
+    """One loadout for a rotation of activities, scored by their time shares. Results aren't stored."""
+    items, activities, _ = load_catalogue(args)
+    if args.inventory: items = load_inventory(args.inventory, items)
+    route = parse_route(activities, args.stop)
+    target = args.target
+    if args.weights:
+        from scoring import WeightedObjective
+        try: target = WeightedObjective.parse(args.weights).name
+        except ValueError as e: raise SystemExit(f"Invalid weighted objective '{args.weights}': {e}")
+    gearset, score = run_optimizer(args, items, route, target)
+    from export import export_gearset
+    export = export_gearset(gearset)
+    stops = [{"activity": activity.activity, "share": share, "steps": gearset_summary(gearset, activity, args.skill_level)["steps"]}
+             for activity, share in zip(route.activities, route.shares)]
+
+    if args.json:
+        print(json.dumps({"route": stops, "target": target, "score": score, "slots": gearset_slots(gearset), "export": export}))
+        return 0
+
+    print(f"--- Optimization Result for the route ({target}) ---")
+    for slot, names in gearset_slots(gearset).items():
+        print(f"{slot.capitalize()}: {', '.join(names) if isinstance(names, list) else names}")
+    print("\n--- Steps per Action ---")
+    for stop in stops:
+        print(f"{stop['activity']} ({stop['share']:.0%}): {stop['steps']}")
+    print(f"\nScore per route step: {score:.6f}")
+    print("\n--- Export Code ---")
+    print(export)
+    return 0
+
+def _batch_activities(args, activities: list) -> list:
+    if args.all: return activities
+    names = list(args.activity)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            names += [line.strip() for line in f if line.strip()]
+    selected = [find_activity(activities, name) for name in names]
+    if args.skill:
+        selected += [a for a in activities if (a.skill or "").lower() == args.skill.lower()]
+    if not selected: raise SystemExit("No activities given, use names, --file, --skill or --all")
+    return selected
+
+def cmd_batch(args) -> int:
+    """
+    One JSON line per (activity, target), written as soon as it is computed. Results already in the store
+    are not recomputed, new ones are written to it in bulk.
+    """
+    items, activities, version = load_catalogue(args)
+    if args.inventory: items = load_inventory(args.inventory, items)
+    from export import gearset_encoder
+    from result_store import StoreKey, StoredResult
+    from utils import inventory_fingerprint
+    store = open_store(args)
+    inventory = inventory_fingerprint(items)
+    items_by_key = {(item.name, item.skill): item for item in items}
+    encode = gearset_encoder()
+    fresh = []
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for activity in _batch_activities(args, activities):
+            for target in args.target:
+                start = time.perf_counter()
+                key = StoreKey(catalogue_version=version, activity=activity.activity, target=target, level=args.level,
+                               skill_level=args.skill_level, inventory=inventory, optimizer=stored_optimizer_name(args))
+                result = store.get(key, items_by_key) if store else None
+                if result is None:
+                    gearset, score = run_optimizer(args, items, activity, target)
+                    result = StoredResult(key=key, gearset=gearset, stats=gearset.get_stats(activity.skill), export=encode(gearset), score=score)
+                    fresh.append(result)
+                summary = gearset_summary(result.gearset, activity, args.skill_level)
+                out.write(json.dumps({
+                    "activity": activity.activity, "target": target, "score": result.score, "steps": summary["steps"],
+                    "slots": gearset_slots(result.gearset), "export": result.export,
+                    "seconds": round(time.perf_counter() - start, 3),
+                }) + "\n")
+                out.flush()
+                if store and len(fresh) >= STORE_BATCH:
+                    store.put_many(fresh)
+                    fresh = []
+    finally:
+        if store and fresh: store.put_many(fresh)
+        if out is not sys.stdout: out.close()
+    return 0
+
+def cmd_guild(args) -> int:
+    """Many user exports at once, identical inventories and queries are optimized once. One JSON line per player and query."""
+    items, activities, version = load_catalogue(args)
+    from guild import GuildBatch, Profile
+    from gear_optimizer_q import OPTIMAZATION_TARGET
+    from export import gearset_encoder
+    profiles = []
+    for path in args.profile:
+        with open(path, encoding="utf-8") as f:
+            profiles.append(Profile.from_user_export(json.load(f), name=os.path.splitext(os.path.basename(path))[0]))
+    names = [find_activity(activities, name).activity for name in args.activity]
+    report = GuildBatch(items, activities, workers=args.workers, optimizer=args.optimizer,
+                        store=open_store(args), catalogue_version=version).run(
+        profiles, names, [OPTIMAZATION_TARGET[t] for t in args.target])
+    encode = gearset_encoder()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in report.results:
+            out.write(json.dumps({
+                "player": result.player, "activity": result.activity, "target": result.target.name, "level": result.level,
+                "skill_level": result.skill_level, "score": result.score, "slots": gearset_slots(result.gearset),
+                "export": encode(result.gearset), "reused": result.reused_from is not None,
+            }) + "\n")
+    finally:
+        if out is not sys.stdout: out.close()
+    print(f"{len(profiles)} profiles, {report.unique_inventories} inventories, {report.unique_jobs} unique jobs: "
+          f"{report.computed_jobs} optimized, {report.reused_jobs} reused, {report.stored_jobs} from the store in {report.seconds:.1f}s", file=sys.stderr)
+    return 0
+
+def cmd_export(args) -> int:
+    """Export string of a loadout given by item names, or with --decode the loadouts of export strings."""
+    items, activities, _ = load_catalogue(args)
+    if args.decode:
+        from export import build_uuid_index, decode_gearsets
+        activity = find_activity(activities, args.activity) if args.activity else None
+        from gear_optimizer_q import OPTIMAZATION_TARGET
+        for gearset in decode_gearsets(args.item, build_uuid_index(items), activity, target=OPTIMAZATION_TARGET[args.target]):
+            print(json.dumps(gearset_slots(gearset)))
+        return 0
+    from models import GearSet
+    by_name = {}
+    for item in items:
+        by_name.setdefault(item.name, item)
+    gearset = GearSet()
+    for name in args.item:
+        item = by_name.get(name)
+        if item is None: raise SystemExit(f"Unknown item '{name}'")
+        if item.slot == "Ring": gearset.rings.append(item)
+        elif item.slot == "Tool": gearset.tools.append(item)
+        else: setattr(gearset, item.slot.lower(), item)
+    from export import export_gearset
+    print(export_gearset(gearset))
+    return 0
+
+def cmd_store(args) -> int:
+    from result_store import ResultStore
+    store = ResultStore(args.store)
+    if args.action == "prune":
+        _, _, version = load_catalogue(args)
+        print(f"{store.prune(version)} results of older catalogue versions deleted")
+    print(f"{len(store)} results stored")
+    return 0
+
+def cmd_bench(args) -> int:
+    """Runtime and score of each optimizer on a sample of activities."""
+    items, activities, _ = load_catalogue(args)
+    if args.inventory: items = load_inventory(args.inventory, items)
+    if args.activity:
+        sample = [find_activity(activities, name) for name in args.activity]
+    else:
+        step = max(1, len(activities) // args.sample)
+        sample = activities[::step][:args.sample]
+    if args.oracle: return _bench_oracle(args, items, sample)
+    from simulator import analytic_score
+    from gear_optimizer_q import OPTIMAZATION_TARGET
+
+    print("activity\ttarget\t" + "\t".join(f"{name} score\t{name} s" for name in args.optimizer))
+    for activity in sample:
+        for target in args.target:
+            cells = []
+            for name in args.optimizer:
+                run_args = argparse.Namespace(**{**vars(args), "optimizer": name})
+                start = time.perf_counter()
+                gearset, _ = run_optimizer(run_args, items, activity, target)
+                seconds = time.perf_counter() - start
+                score = analytic_score(gearset, activity, args.skill_level, OPTIMAZATION_TARGET[target])
+                cells += [f"{score:.6f}", f"{seconds:.2f}"]
+            print(f"{activity.activity}\t{target}\t" + "\t".join(cells))
+    return 0
+
+
+def _bench_oracle(args, items: list, sample: list) -> int:
+    """Optimality gap of each optimizer against the exhaustive optimum, on sampled small inventories."""
+    from benchmark import run_benchmark, summarize
+    from gear_optimizer_q import OPTIMAZATION_TARGET
+    rows = run_benchmark(items, sample, [OPTIMAZATION_TARGET[t] for t in args.target], args.optimizer,
+                         inventory_size=args.inventory_size, seeds=range(args.seeds),
+                         player_level=args.level, player_skill_level=args.skill_level)
+    print("activity\ttarget\tseed\titems\toptimizer\tscore\toptimum\tgap\tvalid\ts\toracle s")
+    for row in rows:
+        print(f"{row.activity}\t{row.target}\t{row.seed}\t{row.inventory_size}\t{row.optimizer}\t{row.score:.6f}\t"
+              f"{row.optimum:.6f}\t{row.gap:.4%}\t{row.valid}\t{row.seconds:.3f}\t{row.oracle_seconds:.3f}")
+    print()
+    for summary in summarize(rows):
+        print(f"{summary.optimizer}: {summary.optimal}/{summary.cases} optimal, {summary.invalid} invalid, "
+              f"mean gap {summary.mean_gap:.4%}, max gap {summary.max_gap:.4%}, {summary.seconds:.2f}s")
+    return 0
+
+
+# --- Parser ---
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="walkscape-gear", description="WalkScape gearset optimizer")
+    parser.add_argument("--items", default="items.csv")
+    parser.add_argument("--activities", default="activities.csv")
+    parser.add_argument("--recipes", default="recipes.csv")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="where the parsed catalogue is cached")
+    parser.add_argument("--store", default=os.path.join(".cache", "results.sqlite"), help="result store (SQLite)")
+    parser.add_argument("--no-store", action="store_true", help="neither read nor write stored results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_run_arguments(p, many_targets: bool = False):
+        p.add_argument("--target", choices=TARGETS, nargs="+" if many_targets else None,
+                       default=["reward_rolls"] if many_targets else "reward_rolls")
+        p.add_argument("--level", type=int, default=99, help="character level, decides the tool slots")
+        p.add_argument("--skill-level", type=int, default=99)
+        p.add_argument("--inventory", help="user export JSON (bank, inventory, gear) or JSON list of item names")
+        p.add_argument("--workers", type=int, default=1, help="processes per optimize call (q optimizer)")
+        p.add_argument("--starts", type=int, default=1, help="local searches from random start points, best kept (q optimizer)")
+        p.add_argument("--seed", type=int, default=0, help="seed of the start points (q) or of the search (lns)")
+        p.add_argument("--iterations", type=int, default=2000, help="moves of the lns optimizer")
+        p.add_argument("--time-limit", type=float, help="seconds of the lns optimizer, instead of --iterations")
+        p.add_argument("--max-states", type=int, help="loadouts the dp optimizer keeps per slot, e.g. 5000: a faster beam search "
+                                                      "that can miss the optimum (exact without it)")
+
+    p = commands.add_parser("optimize", help="best gearset for one activity")
+    p.add_argument("activity")
+    add_run_arguments(p)
+    p.add_argument("--optimizer", choices=OPTIMIZERS, default="q")
+    p.add_argument("--weights", help="weighted objective instead of --target, e.g. xp=0.7,chests=0.3")
+    p.add_argument("--json", action="store_true", help="print the result as one JSON object")
+    p.set_defaults(func=cmd_optimize)
+
+    p = commands.add_parser("route", help="one gearset for a rotation of activities, e.g. gathering and crafting")
+    p.add_argument("stop", nargs="+", help='activities with their share of the time, e.g. "Hut Jumping=2" "Tree Climbing=1"')
+    add_run_arguments(p)
+    p.add_argument("--optimizer", choices=["q", "dp", "lns"], default="q")
+    p.add_argument("--weights", help="weighted objective instead of --target, e.g. xp=0.7,chests=0.3")
+    p.add_argument("--json", action="store_true", help="print the result as one JSON object")
+    p.set_defaults(func=cmd_route)
+
+    p = commands.add_parser("batch", help="optimize many activities, one JSON line each")
+    p.add_argument("activity", nargs="*")
+    p.add_argument("--file", help="file with one activity name per line")
+    p.add_argument("--skill", help="every activity of this skill")
+    p.add_argument("--all", action="store_true", help="every activity and recipe")
+    p.add_argument("--output", "-o", help="JSON lines file, default stdout")
+    add_run_arguments(p, many_targets=True)
+    p.add_argument("--optimizer", choices=OPTIMIZERS, default="q")
+    p.set_defaults(func=cmd_batch)
+
+    p = commands.add_parser("list-activities", help="names, skills and levels of activities and recipes")
+    p.add_argument("--skill")
+    kind = p.add_mutually_exclusive_group()
+    kind.add_argument("--only-recipes", action="store_true")
+    kind.add_argument("--only-activities", action="store_true")
+    p.set_defaults(func=cmd_list_activities)
+
+    p = commands.add_parser("guild", help="optimize for many user exports, deduplicating shared inventories")
+    p.add_argument("profile", nargs="+", help="user export JSON files, the file name is the player name")
+    p.add_argument("--activity", "-a", nargs="+", required=True)
+    p.add_argument("--target", choices=TARGETS, nargs="+", default=["reward_rolls"])
+    p.add_argument("--workers", type=int, default=1, help="processes across unique jobs")
+    p.add_argument("--optimizer", choices=["q", "dp"], default="q")
+    p.add_argument("--output", "-o", help="JSON lines file, default stdout")
+    p.set_defaults(func=cmd_guild)
+
+    p = commands.add_parser("export", help="export string of a loadout given by item names")
+    p.add_argument("item", nargs="+", help="item names, or export strings with --decode")
+    p.add_argument("--decode", action="store_true", help="print the loadout of each export string")
+    p.add_argument("--activity", help="with --decode, pick the item variants usable for this activity")
+    p.add_argument("--target", choices=TARGETS, default="reward_rolls", help="with --activity, pick the variants the optimizer keeps for this target")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("store", help="inspect or prune the result store")
+    p.add_argument("action", choices=["count", "prune"], help="prune deletes results of other catalogue versions")
+    p.set_defaults(func=cmd_store)
+
+    p = commands.add_parser("bench", help="runtime and score of the optimizers on sample activities")
+    p.add_argument("activity", nargs="*")
+    p.add_argument("--sample", type=int, default=5, help="activities spread over the catalogue when none are given")
+    add_run_arguments(p, many_targets=True)
+    p.add_argument("--optimizer", choices=OPTIMIZERS, nargs="+", default=["q", "dp"])
+    p.add_argument("--oracle", action="store_true", help="compare against the exhaustive optimum on sampled small inventories")
+    p.add_argument("--inventory-size", type=int, default=20, help="with --oracle, candidate items sampled per inventory")
+    p.add_argument("--seeds", type=int, default=3, help="with --oracle, sampled inventories per activity")
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+import tempfile
+import typing
+from typing import Dict, Iterable, List, Optional, Type
+import numpy as np
+from pydantic import BaseModel
+from models import Item, Activity
+
+MANIFEST = "manifest.json"
+LIST_SEPARATOR = "\x1f"  # Joins list fields (keywords, locations) into one string cell
+
+
+def _field_kind(annotation) -> str:
+    """'str', 'list', 'bool' or 'number' for a model field, Optional[...] unwrapped."""
+    if typing.get_origin(annotation) is typing.Union:
+        annotation = next(a for a in typing.get_args(annotation) if a is not type(None))
+    if typing.get_origin(annotation) in (list, List): return "list"
+    if annotation is bool: return "bool"
+    if annotation in (int, float): return "number"
+    return "str"
+
+
+class _Schema:
+    """How the fields of one model map to columns: strings and lists get a column each, numbers and flags share a matrix."""
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.strings: List[str] = []
+        self.lists: List[str] = []
+        self.flags: List[str] = []
+        self.numbers: List[str] = []
+        self.integers = set()
+        for name, field in model.model_fields.items():
+            kind = _field_kind(field.annotation)
+            {"str": self.strings, "list": self.lists, "bool": self.flags, "number": self.numbers}[kind].append(name)
+            if kind == "number" and int in (typing.get_args(field.annotation) or (field.annotation,)):
+                self.integers.add(name)
+
+
+class ColumnarTable:
+    """
+    One model table (items or activities) as read-only memory-mapped columns. Rows are turned into
+    model objects only when asked for, and each row at most once per process.
+    """
+    def __init__(self, path: str, prefix: str, model: Type[BaseModel], count: int):
+        self.schema = _Schema(model)
+        self.count = count
+        load = lambda name: np.load(os.path.join(path, f"{prefix}.{name}.npy"), mmap_mode="r")
+        self.columns: Dict[str, np.ndarray] = {name: load(name) for name in self.schema.strings + self.schema.lists}
+        self.numbers = load("numbers")  # (rows, number fields) float64, NaN = None
+        self.flags = load("flags")      # (rows, bool fields)
+        self._objects: Dict[int, BaseModel] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def column(self, name: str) -> np.ndarray:
+        """A column as a memory-mapped array, for vectorized filters that don't need the objects."""
+        if name in self.columns: return self.columns[name]
+        if name in self.schema.numbers: return self.numbers[:, self.schema.numbers.index(name)]
+        return self.flags[:, self.schema.flags.index(name)]
+
+    def get(self, row: int) -> BaseModel:
+        obj = self._objects.get(row)
+        if obj is None:
+            obj = self._objects[row] = self._materialize(row)
+        return obj
+
+    def get_many(self, rows: Iterable[int]) -> list:
+        return [self.get(int(row)) for row in rows]
+
+    def all(self) -> list:
+        return self.get_many(range(self.count))
+
+    def _materialize(self, row: int) -> BaseModel:
+        schema = self.schema
+        values = {}
+        for name in schema.strings:
+            value = str(self.columns[name][row])
+            values[name] = value if value else None
+        for name in schema.lists:
+            value = str(self.columns[name][row])
+            values[name] = value.split(LIST_SEPARATOR) if value else []
+        for name, value in zip(schema.numbers, self.numbers[row].tolist()):
+            if value != value: values[name] = None  # NaN
+            else: values[name] = int(value) if name in schema.integers else value
+        for name, value in zip(schema.flags, self.flags[row].tolist()):
+            values[name] = value
+        return schema.model(**values)
+
+
+def _write_table(path: str, prefix: str, model: Type[BaseModel], objects: List[BaseModel]):
+    schema = _Schema(model)
+    for name in schema.strings:
+        cells = [getattr(obj, name) or "" for obj in objects]
+        np.save(os.path.join(path, f"{prefix}.{name}.npy"), np.array(cells, dtype=f"<U{max(1, max(map(len, cells), default=1))}"))
+    for name in schema.lists:
+        cells = [LIST_SEPARATOR.join(getattr(obj, name)) for obj in objects]
+        np.save(os.path.join(path, f"{prefix}.{name}.npy"), np.array(cells, dtype=f"<U{max(1, max(map(len, cells), default=1))}"))
+    numbers = np.array([[np.nan if getattr(obj, name) is None else getattr(obj, name) for name in schema.numbers] for obj in objects],
+                       dtype=np.float64).reshape(len(objects), len(schema.numbers))
+    flags = np.array([[bool(getattr(obj, name)) for name in schema.flags] for obj in objects],
+                     dtype=np.bool_).reshape(len(objects), len(schema.flags))
+    np.save(os.path.join(path, f"{prefix}.numbers.npy"), numbers)
+    np.save(os.path.join(path, f"{prefix}.flags.npy"), flags)
+
+
+class ColumnarCatalogue:
+    """
+    Items and activities written once as .npy columns and opened with mmap_mode="r". Any number of
+    processes can open the same directory: the OS shares the pages, so a worker costs neither a
+    copy of the catalogue nor a parse of it, and only materializes the rows it uses.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.path = path
+        self.version: Optional[str] = manifest["version"]
+        self.items = ColumnarTable(path, "items", Item, manifest["items"])
+        self.activities = ColumnarTable(path, "activities", Activity, manifest["activities"])
+        self._item_rows: Optional[Dict[tuple, int]] = None
+
+    @classmethod
+    def open(cls, path: str) -> "ColumnarCatalogue":
+        return cls(path)
+
+    @classmethod
+    def build(cls, path: str, items: List[Item], activities: List[Activity], version: Optional[str] = None) -> "ColumnarCatalogue":
+        """Writes the tables to `path`, replacing what was there. The files are written next to it and moved in at once."""
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix=".columnar-")
+        try:
+            _write_table(staging, "items", Item, items)
+            _write_table(staging, "activities", Activity, activities)
+            with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"version": version, "items": len(items), "activities": len(activities)}, f)
+            if os.path.isdir(path): shutil.rmtree(path)
+            os.replace(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls(path)
+
+    @classmethod
+    def for_catalogue(cls, catalogue, root: str = os.path.join(".cache", "columnar")) -> "ColumnarCatalogue":
+        """The columnar copy of a catalogue.Catalogue's current snapshot, built only if this version isn't on disk yet."""
+        snapshot = catalogue.snapshot()
+        path = os.path.join(root, snapshot.version)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            return cls(path)
+        return cls.build(path, snapshot.items, snapshot.activities, snapshot.version)
+
+    def item_row(self, item: Item) -> Optional[int]:
+        """Row of an item by its (name, skill) key, or None if it isn't in this catalogue."""
+        if self._item_rows is None:
+            names, skills = self.items.column("name"), self.items.column("skill")
+            self._item_rows = {(str(n), str(s) or None): row for row, (n, s) in enumerate(zip(names, skills))}
+        return self._item_rows.get((item.name, item.skill))
+
+    def item_rows(self, items: List[Item]) -> Optional[List[int]]:
+        """Rows of all `items`, or None if any of them isn't in this catalogue (e.g. edited after the build)."""
+        rows = []
+        for item in items:
+            row = self.item_row(item)
+            if row is None or self.items.get(row) != item: return None
+            rows.append(row)
+        return rows
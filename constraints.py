@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from models import Activity, Item
+
+DIVING_KEYWORD = "diving"
+UNDERWATER_DIVING_PIECES = 3  # Diving head, chest and legs
+
+
+class Requirements:
+    """
+    Hard requirements of an activity on a loadout: a number of items per keyword (one per required keyword,
+    UNDERWATER_DIVING_PIECES diving items under water), and no item above the player's level. An item's
+    min_level is a level of its skill (e.g. Mining 40 for a Tarsilium Pickaxe), checked against the skill level
+    of the activity, and the character level for items without a skill.
+    `missing` gives what a partial loadout still lacks, so a search can drop a branch as soon as the slots it
+    has left can't make up for it instead of scoring it.
+    """
+    def __init__(self, needed: Optional[Dict[str, int]] = None, player_level: Optional[int] = None,
+                 player_skill_level: Optional[int] = None):
+        self.needed: Dict[str, int] = dict(needed or {})
+        self.player_level = player_level
+        self.player_skill_level = player_skill_level
+
+    @classmethod
+    def for_activity(cls, activity: Activity, player_level: int, player_skill_level: int) -> "Requirements":
+        needed = {keyword: 1 for keyword in activity.required_keywords}
+        if activity.is_underwater: needed[DIVING_KEYWORD] = max(needed.get(DIVING_KEYWORD, 0), UNDERWATER_DIVING_PIECES)
+        return cls(needed, player_level, player_skill_level)
+
+    @classmethod
+    def for_activities(cls, activities: Iterable[Activity], player_level: int, player_skill_level: int) -> "Requirements":
+        """The requirements of one loadout worn for all the activities (e.g. a route): the highest count per keyword."""
+        needed: Dict[str, int] = {}
+        for activity in activities:
+            for keyword, count in cls.for_activity(activity, player_level, player_skill_level).needed.items():
+                needed[keyword] = max(needed.get(keyword, 0), count)
+        return cls(needed, player_level, player_skill_level)
+
+    def allows(self, item: Item) -> bool:
+        if item.min_level is None: return True
+        level = self.player_skill_level if item.skill else self.player_level
+        return level is None or item.min_level <= level
+
+    def keywords_of(self, item: Item) -> Tuple[str, ...]:
+        """The required keywords the item counts towards."""
+        return tuple(keyword for keyword in self.needed if keyword in item.keywords)
+
+    def missing(self, items: Iterable[Item]) -> Dict[str, int]:
+        """Items still needed per keyword, empty when the loadout meets every requirement."""
+        if not self.needed: return {}
+        missing = dict(self.needed)
+        for item in items:
+            for keyword in item.keywords:
+                if keyword in missing: missing[keyword] -= 1
+        return {keyword: count for keyword, count in missing.items() if count > 0}
+
+    def is_satisfied(self, items: Iterable[Item]) -> bool:
+        return not self.missing(items)
+
+    def covers(self, missing: Dict[str, int], items: Iterable[Item]) -> bool:
+        """Whether the items make up for everything in `missing`."""
+        left = dict(missing)
+        for item in items:
+            for keyword in item.keywords:
+                if keyword in left: left[keyword] -= 1
+        return all(count <= 0 for count in left.values())
+
+    def achievable(self, candidates: Dict[str, List[Item]], tool_slots: int) -> Tuple["Requirements", Dict[str, int]]:
+        """
+        (the requirements the candidates can meet, {keyword: items missing} for the others). Counts at most one
+        item per single slot, two rings and `tool_slots` tools, so a requirement kept here may still be unreachable
+        when one item would have to fill two of them.
+        """
+        kept, unmet = {}, {}
+        for keyword, count in self.needed.items():
+            available = 0
+            for slot, items in candidates.items():
+                carriers = len({item.clean_item_name or item.name for item in items if keyword in item.keywords})
+                if slot == "Ring": available += min(2, carriers)
+                elif slot == "Tool": available += min(tool_slots, carriers)
+                elif carriers: available += 1
+            if available >= count: kept[keyword] = count
+            else: unmet[keyword] = count - available
+        return Requirements(kept, self.player_level, self.player_skill_level), unmet
+
+    def without(self, keywords: Iterable[str]) -> "Requirements":
+        keywords = set(keywords)
+        return Requirements({k: v for k, v in self.needed.items() if k not in keywords}, self.player_level, self.player_skill_level)
@@ -0,0 +1,116 @@
+import numpy as np
+from typing import Dict, List, Optional
+from models import Activity, GearSet
+
+DROP_TYPES = ["chests", "gems", "collectibles", "fine"]
+
+# Stat from get_stats that boosts each drop type
+DROP_BONUS_STAT = {
+    "chests": "chest_finding",
+    "gems": "gem_finding",
+    "collectibles": "collectible_percent",
+    "fine": "fine_material",
+}
+
+STAT_COLUMNS = [
+    "work_efficiency", "flat_step_reduction", "percent_step_reduction",
+    "double_action", "double_rewards",
+    "chest_finding", "gem_finding", "collectible_percent", "fine_material",
+]
+_COL = {name: i for i, name in enumerate(STAT_COLUMNS)}
+
+
+def base_drop_rates(activity: Activity, fine_base_chance: Optional[float] = None) -> Dict[str, float]:
+    """
+    Expected drops per action without any gear bonus.
+    Derived from the sheet's "Steps/X" columns, which are computed for its reference loadout
+    taking "Current Steps" per action, so Current Steps / Steps per X is the chance per action.
+    The sheet has no fine material column: fine materials only get a rate when the caller passes their
+    base chance per action (`fine_base_chance`), otherwise they are 0 and their steps per drop inf.
+    """
+    def _from_sheet(steps_per_drop: Optional[float]) -> float:
+        if not activity.reference_steps or not steps_per_drop: return 0.0
+        return activity.reference_steps / steps_per_drop
+
+    gems = _from_sheet(activity.steps_per_gem)
+    if gems == 0.0 and activity.has_gem_table:
+        gems = activity.base_gem_drop_rate or 0.0
+
+    return {
+        "chests": _from_sheet(activity.steps_per_chest),
+        "gems": gems,
+        "collectibles": _from_sheet(activity.steps_per_collectible),
+        "fine": 0.0 if activity.is_recipe or fine_base_chance is None else fine_base_chance,
+    }
+
+
+def stats_matrix(stats_list: List[Dict[str, float]]) -> np.ndarray:
+    """Packs get_stats dicts into a (loadouts x STAT_COLUMNS) array."""
+    mat = np.zeros((len(stats_list), len(STAT_COLUMNS)))
+    for row, stats in enumerate(stats_list):
+        for col, name in enumerate(STAT_COLUMNS):
+            mat[row, col] = stats.get(name, 0.0)
+    return mat
+
+
+def batch_calculate_steps(stats: np.ndarray, activities: List[Activity], player_skill_level) -> np.ndarray:
+    """
+    Vectorized utils.calculate_steps over (loadouts x activities).
+    `stats` is (loadouts x activities x STAT_COLUMNS) or (loadouts x STAT_COLUMNS) if shared by all activities.
+    `player_skill_level` is a scalar or one level per activity.
+    """
+    if stats.ndim == 2:
+        stats = stats[:, None, :]
+    skill_level = np.array([a.skill_level or 0 for a in activities], dtype=float)
+    base_steps = np.array([a.base_steps if a.base_steps is not None else np.nan for a in activities], dtype=float)
+    max_eff = np.array([a.max_work_efficiency or 0.0 for a in activities], dtype=float)
+    player_level = np.broadcast_to(np.asarray(player_skill_level, dtype=float), skill_level.shape)
+
+    # Same operation order as calculate_steps so both give identical step counts
+    level_eff = np.minimum(0.25, np.maximum(0, player_level - skill_level) * 0.0125)
+    effective_eff = np.minimum(level_eff + stats[..., _COL["work_efficiency"]], max_eff)
+    step_multiplier = 1.0 - stats[..., _COL["percent_step_reduction"]]
+    steps = np.ceil((base_steps / (1.0 + effective_eff)) * step_multiplier) - stats[..., _COL["flat_step_reduction"]]
+    return np.maximum(10, steps)
+
+
+def batch_steps_per_drop(gearsets: List[GearSet], activities: List[Activity], player_skill_level=99,
+                         fine_base_chance: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Expected steps per drop for every (loadout, activity) pair, keyed by drop type.
+    Each array is (loadouts x activities); drops an activity can't roll are inf.
+    Stats are aggregated once per distinct activity skill rather than once per pair.
+    """
+    skills = sorted({a.skill or "" for a in activities})
+    per_skill = {skill: stats_matrix([g.get_stats(skill or None) for g in gearsets]) for skill in skills}
+    stats = np.stack([per_skill[a.skill or ""] for a in activities], axis=1)
+    return _steps_per_drop(stats, activities, player_skill_level, fine_base_chance)
+
+
+def _steps_per_drop(stats: np.ndarray, activities: List[Activity], player_skill_level, fine_base_chance: Optional[float]) -> Dict[str, np.ndarray]:
+    steps = batch_calculate_steps(stats, activities, player_skill_level)
+    multiplier = (1.0 + stats[..., _COL["double_action"]]) * (1.0 + stats[..., _COL["double_rewards"]])
+    rates = [base_drop_rates(a, fine_base_chance) for a in activities]
+
+    result = {}
+    for drop in DROP_TYPES:
+        base = np.array([r[drop] for r in rates], dtype=float)
+        drops_per_action = base * (1.0 + stats[..., _COL[DROP_BONUS_STAT[drop]]]) * multiplier
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[drop] = np.where(drops_per_action > 0, steps / drops_per_action, np.inf)
+    return result
+
+
+def steps_per_drop(stats: Dict[str, float], activity: Activity, player_skill_level: int,
+                   fine_base_chance: Optional[float] = None) -> Dict[str, float]:
+    """Expected steps per drop for a single get_stats result."""
+    result = _steps_per_drop(stats_matrix([stats])[:, None, :], [activity], player_skill_level, fine_base_chance)
+    return {drop: float(values[0, 0]) for drop, values in result.items()}
+
+
+def steps_to_goal(stats: Dict[str, float], activity: Activity, player_skill_level: int, drop: str, quantity: int,
+                  fine_base_chance: Optional[float] = None) -> float:
+    """Expected steps to collect `quantity` drops of one type."""
+    if drop not in DROP_TYPES:
+        raise ValueError(f"Unknown drop type '{drop}', expected one of {DROP_TYPES}")
+    return quantity * steps_per_drop(stats, activity, player_skill_level, fine_base_chance)[drop]
@@ -1,75 +1,239 @@
 import gzip
 import base64
 import json
-from models import GearSet
+import re
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple, Union
+from models import Activity, GearSet, Item, STAT_FIELDS
+from scoring import OPTIMAZATION_TARGET, Objective
+
+# Define the output order strictly matching the JS "outputOrder" and "indices"
+# Format: (TypeName, Index)
+SLOT_ORDER = [
+    ("head", 0), ("cape", 0), ("back", 0), ("chest", 0), ("primary", 0), ("secondary", 0),
+    ("hands", 0), ("legs", 0), ("neck", 0), ("feet", 0),
+    # Rings (Indices 0, 1)
+    ("ring", 0), ("ring", 1),
+    # Tools (Indices 0-5)
+    ("tool", 0), ("tool", 1), ("tool", 2), ("tool", 3), ("tool", 4), ("tool", 5),
+]
+
+# Crafted items have one sheet row per quality tier, e.g. "Amulet of Eel (T6-Eternal)", all with the same uuid
+QUALITY_TIER = re.compile(r"\(T\d-(\w+)\)")
+
+def _item_quality(item: Item) -> str:
+    match = QUALITY_TIER.search(item.name)
+    # Default to "Normal" if quality is missing (required field)
+    return match.group(1) if match else "Normal"
+
+def _slot_items(gearset: GearSet) -> List[Optional[Item]]:
+    """Items of a gearset in SLOT_ORDER, None for empty slots."""
+    items = []
+    for type_name, idx in SLOT_ORDER:
+        if type_name == "ring": items.append(gearset.rings[idx] if len(gearset.rings) > idx else None)
+        elif type_name == "tool": items.append(gearset.tools[idx] if len(gearset.tools) > idx else None)
+        else: items.append(getattr(gearset, type_name))
+    return items
+
+def _item_value(item: Optional[Item]) -> str:
+    """The content of an entry's "item" key: a stringified JSON object, or "null"."""
+    if not (item and item.uuid):
+        # Matches JS behavior: fill("\"null\"")
+        return "null"
+    inner_data = {"id": item.uuid, "quality": _item_quality(item), "tag": None}
+    # Serialize inner object to string (e.g., '{"id":"...","quality":"..."}')
+    return json.dumps(inner_data, separators=(',', ':'))
+
+def _encode_values(values: List[str]) -> str:
+    json_entries = [
+        {"type": type_name, "index": idx, "item": value, "errors": []}
+        for (type_name, idx), value in zip(SLOT_ORDER, values)
+    ]
+    # Wrap in root object and serialize to standard JSON
+    json_str = json.dumps({"items": json_entries}, separators=(',', ':'))
+    # Compress (Gzip, mtime 0 so the same loadout always gives the same string) and encode (Base64)
+    compressed_data = gzip.compress(json_str.encode('utf-8'), mtime=0)
+    return base64.b64encode(compressed_data).decode('utf-8')
 
 def export_gearset(gearset: GearSet) -> str:
     """
-    Exports a GearSet to a Gzipped, Base64-encoded JSON string compatible 
+    Exports a GearSet to a Gzipped, Base64-encoded JSON string compatible
     with the Walkscape spreadsheet import format.
     """
-    
-    # Define the output order strictly matching the JS "outputOrder" and "indices"
-    # Format: (TypeName, Index, GetterFunction)
-    slots_map = [
-        ("head", 0, lambda g: g.head),
-        ("cape", 0, lambda g: g.cape),
-        ("back", 0, lambda g: g.back),
-        ("chest", 0, lambda g: g.chest),
-        ("primary", 0, lambda g: g.primary),
-        ("secondary", 0, lambda g: g.secondary),
-        ("hands", 0, lambda g: g.hands),
-        ("legs", 0, lambda g: g.legs),
-        ("neck", 0, lambda g: g.neck),
-        ("feet", 0, lambda g: g.feet),
-        # Rings (Indices 0, 1)
-        ("ring", 0, lambda g: g.rings[0] if len(g.rings) > 0 else None),
-        ("ring", 1, lambda g: g.rings[1] if len(g.rings) > 1 else None),
-        # Tools (Indices 0-5)
-        ("tool", 0, lambda g: g.tools[0] if len(g.tools) > 0 else None),
-        ("tool", 1, lambda g: g.tools[1] if len(g.tools) > 1 else None),
-        ("tool", 2, lambda g: g.tools[2] if len(g.tools) > 2 else None),
-        ("tool", 3, lambda g: g.tools[3] if len(g.tools) > 3 else None),
-        ("tool", 4, lambda g: g.tools[4] if len(g.tools) > 4 else None),
-        ("tool", 5, lambda g: g.tools[5] if len(g.tools) > 5 else None),
-    ]
+    return _encode_values([_item_value(item) for item in _slot_items(gearset)])
+
+
+# --- Bulk codec ---
+CODE_CACHE_SIZE = 1024  # Distinct loadouts whose string is kept while encoding a stream
+
+def gearset_encoder():
+    """
+    An export_gearset for many gearsets: item values are serialized once per uuid and quality, recently seen
+    loadouts aren't compressed again, which is most of the work in a sweep.
+    """
+    values_cache: Dict[Optional[Tuple[str, str]], str] = {}
+    codes: Dict[Tuple[str, ...], str] = {}
+    def encode(gearset: GearSet) -> str:
+        values = []
+        for item in _slot_items(gearset):
+            key = (item.uuid, _item_quality(item)) if item else None
+            value = values_cache.get(key)
+            if value is None:
+                value = values_cache[key] = _item_value(item)
+            values.append(value)
+        key = tuple(values)
+        code = codes.get(key)
+        if code is None:
+            if len(codes) >= CODE_CACHE_SIZE: codes.clear()
+            code = codes[key] = _encode_values(values)
+        return code
+    return encode
+
+def iter_encoded(gearsets: Iterable[GearSet]) -> Iterator[str]:
+    """Export strings of many gearsets, produced one at a time."""
+    encode = gearset_encoder()
+    for gearset in gearsets:
+        yield encode(gearset)
+
+def encode_gearsets(gearsets: Iterable[GearSet]) -> List[str]:
+    return list(iter_encoded(gearsets))
+
+def build_uuid_index(items: List[Item]) -> Dict[str, List[Item]]:
+    """
+    Items by export uuid. One game item can be several sheet rows (skill variants like "(Glo)",
+    set bonus variants like "(2 Set)"), so each uuid maps to all of them in file order.
+    """
+    index: Dict[str, List[Item]] = {}
+    for item in items:
+        if item.uuid: index.setdefault(item.uuid, []).append(item)
+    return index
+
+def decode_entries(code: str) -> List[Optional[Tuple[str, str]]]:
+    """(uuid, quality) of every slot in SLOT_ORDER, None for empty slots."""
+    data = json.loads(gzip.decompress(base64.b64decode(code)))
+    positions = {slot: i for i, slot in enumerate(SLOT_ORDER)}
+    entries: List[Optional[Tuple[str, str]]] = [None] * len(SLOT_ORDER)
+    for entry in data["items"]:
+        position = positions.get((entry["type"], entry["index"]))
+        if position is None: raise ValueError(f"Unknown slot {entry['type']} {entry['index']}")
+        value = entry.get("item")
+        if value and value != "null":
+            inner = json.loads(value)
+            entries[position] = (inner["id"], inner.get("quality") or "Normal")
+    return entries
+
+def _pick_variants(variants: List[Item], quality: str, activity: Optional[Activity], optimizer) -> List[Item]:
+    """Variants of the exported quality tier usable for the activity, narrowing only where something is left, best first."""
+    tiered = [item for item in variants if QUALITY_TIER.search(item.name)]
+    if tiered:
+        variants = [item for item in tiered if _item_quality(item) == quality] or variants
+    if activity is not None:
+        from gear_optimizer_q import is_candidate
+        variants = [item for item in variants if is_candidate(item, activity)] or variants
+    return _best_first(variants, optimizer)
+
+def _best_first(variants: List[Item], optimizer) -> List[Item]:
+    """
+    The variants with the best plain one first (e.g. "Omni-tool (200+)" before "Omni-tool (Base)"): by the optimizer's
+    best-version rule (_keep_best_versions) when there is an activity, else the first one at least as good as every
+    other in every stat. Set bonus variants keep their place, decode_gearset picks those by the pieces worn.
+    """
+    plain = [item for item in variants if not item.has_set_attr]
+    if len(plain) < 2: return variants
+    if optimizer is not None:
+        best = optimizer._keep_best_versions({plain[0].slot: plain}, optimizer.activity)[plain[0].slot]
+    else:
+        best = [item for item in plain if all(_at_least(item, other) for other in plain)][:1]
+    return best + [item for item in variants if all(item is not b for b in best)]
+
+def _at_least(item: Item, other: Item) -> bool:
+    return all((getattr(item, field) or 0) >= (getattr(other, field) or 0) for field in STAT_FIELDS.values())
+
+def _variant_optimizer(activity: Optional[Activity], target: Objective):
+    """An optimizer bound to the activity to score variants with, at level 99 like the precomputed results."""
+    if activity is None: return None
+    from gear_optimizer_q import GearOptimizer
+    return GearOptimizer([]).bind(activity, player_level=99, player_skill_level=99, optimazation_target=target)
+
+def decode_gearset(code: str, index: Dict[str, List[Item]], activity: Optional[Activity] = None, strict: bool = True,
+                   target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> GearSet:
+    """
+    Rebuilds a GearSet from an export string. Of the rows sharing a uuid, the best one of the exported quality tier
+    usable for `activity` is taken, the one the optimizer keeps for `target` (see _best_first), except for set bonus
+    variants: those get the variant with the most pieces the decoded loadout actually has. Unknown uuids raise
+    ValueError, or leave the slot empty if not `strict`.
+    """
+    return _decode(code, index, activity, strict, _variant_optimizer(activity, target))
+
+def _decode(code: str, index: Dict[str, List[Item]], activity: Optional[Activity], strict: bool, optimizer) -> GearSet:
+    from gear_optimizer_q import SetTracker
+    variants_per_slot: List[Optional[List[Item]]] = []
+    for entry in decode_entries(code):
+        if entry is None:
+            variants_per_slot.append(None)
+            continue
+        uuid, quality = entry
+        variants = index.get(uuid)
+        if variants is None:
+            if strict: raise ValueError(f"Unknown item id {uuid}")
+            variants_per_slot.append(None)
+            continue
+        variants_per_slot.append(_pick_variants(variants, quality, activity, optimizer))
+
+    # Set pieces are fixed by the plain variants, then each set bonus item takes the best variant they activate
+    chosen = [variants[0] if variants else None for variants in variants_per_slot]
+    pieces = SetTracker([item for item in chosen if item is not None]).pieces
+    for i, variants in enumerate(variants_per_slot):
+        if not variants or not any(item.has_set_attr for item in variants): continue
+        active = [item for item in variants if not item.has_set_attr or pieces.get(item.set_name, 0) >= item.set_count]
+        if active: chosen[i] = max(active, key=lambda item: item.set_count or 0)
+
+    gearset = GearSet()
+    for (type_name, _), item in zip(SLOT_ORDER, chosen):
+        if item is None: continue
+        if type_name == "ring": gearset.rings.append(item)
+        elif type_name == "tool": gearset.tools.append(item)
+        else: setattr(gearset, type_name, item)
+    return gearset
+
+def decode_gearsets(codes: Iterable[str], index: Dict[str, List[Item]], activity: Optional[Activity] = None, strict: bool = True,
+                    target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> List[GearSet]:
+    """decode_gearset for many strings. Each distinct string is decoded once, repeats share the GearSet."""
+    optimizer = _variant_optimizer(activity, target)
+    decoded: Dict[str, GearSet] = {}
+    gearsets = []
+    for code in codes:
+        gearset = decoded.get(code)
+        if gearset is None:
+            gearset = decoded[code] = _decode(code, index, activity, strict, optimizer)
+        gearsets.append(gearset)
+    return gearsets
+
+
+# --- Streaming to and from files, one "label<TAB>code" (or bare code) per line ---
+def write_gearsets(file: Union[str, IO[str]], records: Iterable[Union[GearSet, Tuple[str, GearSet]]]) -> int:
+    """Writes gearsets, or (label, gearset) pairs, as they come from `records`. Returns the number of lines."""
+    if isinstance(file, str):
+        with open(file, "w", encoding="utf-8") as f:
+            return write_gearsets(f, records)
+    encode = gearset_encoder()
+    count = 0
+    for record in records:
+        label, gearset = record if isinstance(record, tuple) else (None, record)
+        code = encode(gearset)
+        file.write(f"{label}\t{code}\n" if label is not None else f"{code}\n")
+        count += 1
+    return count
 
-    json_entries = []
-
-    for type_name, idx, getter in slots_map:
-        item = getter(gearset)
-        
-        # Determine the content of the "item" key
-        if item and item.uuid:
-            # Construct the inner JSON string for the item data
-            inner_data = {
-                "id": item.uuid,
-                # Default to "Normal" if quality is missing (required field)
-                "quality": "Normal", # item.quality_rarity or "Normal", 
-                "tag": None
-            }
-            # Serialize inner object to string (e.g., '{"id":"...","quality":"..."}')
-            item_value_str = json.dumps(inner_data, separators=(',', ':'))
-        else:
-            # Matches JS behavior: fill("\"null\"")
-            item_value_str = "null"
-
-        entry = {
-            "type": type_name,
-            "index": idx,
-            "item": item_value_str, # This is a stringified JSON or "null" string
-            "errors": []
-        }
-        json_entries.append(entry)
-
-    # Wrap in root object
-    final_obj = {"items": json_entries}
-    
-    # Serialize to standard JSON
-    json_str = json.dumps(final_obj, separators=(',', ':'))
-    
-    # Compress (Gzip)
-    compressed_data = gzip.compress(json_str.encode('utf-8'))
-    
-    # Encode (Base64)
-    return base64.b64encode(compressed_data).decode('utf-8')
\ No newline at end of file
+def read_gearsets(file: Union[str, IO[str]], index: Dict[str, List[Item]], activity: Optional[Activity] = None,
+                  strict: bool = True, target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> Iterator[Tuple[Optional[str], GearSet]]:
+    """(label, gearset) per line of a file written by write_gearsets, label None for bare codes."""
+    if isinstance(file, str):
+        with open(file, encoding="utf-8") as f:
+            yield from read_gearsets(f, index, activity, strict, target)
+        return
+    optimizer = _variant_optimizer(activity, target)
+    for line in file:
+        line = line.strip()
+        if not line: continue
+        label, _, code = line.rpartition("\t")
+        yield (label or None), _decode(code, index, activity, strict, optimizer)
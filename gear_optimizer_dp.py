@@ -0,0 +1,325 @@
+import math
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from models import Item, GearSet, cap_stats, stat_name
+from gear_optimizer_q import GearOptimizer, RESTRICTED_TOOL_KEYWORDS, SINGLE_SLOTS, CONVERGENCE_REASON, OptimizationResult
+
+# Stats are summed as integer multiples of 1/RESOLUTION, the sheet has at most two decimals on percentages
+RESOLUTION = 10000
+
+# Stats where anything above the cap is wasted, caps are applied by get_stats/calculate_steps/calculate_score_for_set
+STAT_CAPS = {"double_action": 1.0, "double_rewards": 1.0, "no_mats": 0.99}
+
+
+
+class DPGearOptimizer(GearOptimizer):
+    """
+    Dynamic-programming solver over (efficiency, % step reduction, flat step reduction) buckets.
+    Slots are added one at a time. Loadouts landing in the same bucket (same tool count and restricted
+    tool keywords) only keep their Pareto-best secondary stats, e.g. (double action, double rewards).
+    Efficiency past the activity's cap (the highest of a route's activities of that skill) is merged into one bucket,
+    since it can't lower the steps any further. A route across skills has the step stats of every skill in the bucket.
+    Set pieces are counted in the bucket key, and loadouts whose set bonuses can no longer get enough
+    pieces from the remaining slots are dropped. Required keywords and diving pieces (constraints.Requirements)
+    are counted the same way, as sets whose bonus is always needed.
+    On top of that, loadouts beaten in every stat by another bucket, or that can't beat the best loadout
+    found so far even with the best remaining items, are dropped. None of this loses the optimum.
+    By default every remaining loadout is kept and the result is the optimum. `max_states` opts into a beam:
+    when more loadouts than that are left after a slot, only the best scoring ones (as complete loadouts with
+    the remaining slots empty) are kept, so the run time is about slots x options x max_states, but the
+    optimum can be missed.
+    """
+    def __init__(self, all_items: List[Item], max_states: Optional[int] = None, **kwargs):
+        super().__init__(all_items, **kwargs)
+        self.max_states = max_states
+
+    def search(self) -> OptimizationResult:
+        """One pass, exact unless max_states caps it, there is no local search to converge."""
+        gearset = self._solve()
+        return OptimizationResult(gearset=gearset, score=self.calculate_score_for_set(gearset), iterations=1,
+                                  reason=CONVERGENCE_REASON.converged, unmet_requirements=dict(self.unmet_requirements))
+
+    def _solve(self) -> GearSet:
+        activity = self.activity
+        candidates = self._keep_best_versions(self._get_candidates(), activity)
+        self._set_requirements(candidates)
+
+        kernel = self.score_kernel()
+        self.primary_dims = sorted(kernel.step_stats)
+        self.secondary_dims = sorted(kernel.stats - kernel.step_stats)
+        dims = self.primary_dims + self.secondary_dims
+
+        self.set_names = self._sets_with_bonus(candidates)
+        self.required_keywords = sorted(self.requirements.needed)
+        groups = self._slot_groups(candidates, dims)
+        limits = self._bucket_limits(groups, dims)
+        pieces_left, bonus_left = self._set_pieces_left(groups)
+        optimistic = self._optimistic_gains(groups, dims)
+        n_primary = len(self.primary_dims)
+        self._empty_stats = GearSet().get_stats(self.context.skills, capped=False)
+        # The fallback loadout meets the requirements, so its score bounds the search before any state does
+        best_score = self.calculate_score_for_set(self._required_start) if self.requirements.needed else float("-inf")
+        best_chosen = None
+
+        # key: (primary stats, tools used, restricted keyword mask, (set pieces, set pieces needed) per set and required keyword)
+        # value: Pareto front of [(secondary stats, chosen items)], chosen items as a linked list (item, rest)
+        zero = tuple(0 for _ in dims)
+        no_sets = tuple((0, 0) for _ in self.set_names) + tuple((0, self.requirements.needed[k]) for k in self.required_keywords)
+        states = {(zero[:n_primary], 0, 0, no_sets): [(zero[n_primary:], None)]}
+        for group_index, (slot, options) in enumerate(groups):
+            limit = limits[group_index]
+            new_states = {}
+            for (primary, tools_used, mask, set_state), front in states.items():
+                for item, vector, tool_mask, set_vector in options:
+                    if item is None:
+                        new_key = (primary, tools_used, mask, set_state)
+                        for secondary, chosen in front:
+                            self._insert(new_states, new_key, secondary, chosen)
+                        continue
+                    new_set_state = self._add_set_pieces(set_state, set_vector, pieces_left[group_index], bonus_left[group_index])
+                    if new_set_state is None: continue
+                    # A piece nothing needs any more is only worse than leaving the slot empty
+                    if new_set_state == set_state and not any(vector): continue
+                    if slot == "Tool":
+                        if tools_used >= self.tool_slots or mask & tool_mask: continue
+                        new_key = (self._clamp(primary, vector, limit, 0), tools_used + 1, mask | tool_mask, new_set_state)
+                    else:
+                        new_key = (self._clamp(primary, vector, limit, 0), tools_used, mask, new_set_state)
+                    for secondary, chosen in front:
+                        self._insert(new_states, new_key, self._clamp(secondary, vector, limit, n_primary), (item, chosen))
+            # Leaving a slot empty can also make a set bonus unreachable
+            states = {key: front for key, front in new_states.items()
+                      if self._add_set_pieces(key[3], None, pieces_left[group_index], bonus_left[group_index]) is not None}
+            states = self._drop_dominated(states)
+
+            # Every state is a complete loadout with the remaining slots left empty, so the best valid one is
+            # a lower bound. States that can't beat it even with the best remaining item in every slot are dropped.
+            for (primary, _, _, set_state), front in states.items():
+                if any(pieces < needed for pieces, needed in set_state): continue
+                for secondary, chosen in front:
+                    score = self.calculate_score_for_stats(self._to_stats(primary + secondary, dims))
+                    if score > best_score:
+                        best_score = score
+                        best_chosen = chosen
+            if group_index + 1 < len(groups):
+                states = self._prune_by_bound(states, optimistic[group_index + 1], best_score, dims)
+
+        if best_chosen is None: return self._required_start.model_copy(update={"rings": list(self._required_start.rings), "tools": list(self._required_start.tools)})
+        return self._build_set(best_chosen)
+
+    def _drop_dominated(self, states: dict) -> dict:
+        """
+        Drops loadouts that a loadout of another bucket beats in every stat with the same tools, keywords and set pieces.
+        Loadouts are checked by descending stat sum, so each one is only compared to possible dominators.
+        """
+        by_slots = {}
+        for key, front in states.items():
+            rows = by_slots.setdefault(key[1:], [])
+            rows.extend((key[0] + secondary, key, secondary, chosen) for secondary, chosen in front)
+        kept_states = {}
+        for rows in by_slots.values():
+            rows.sort(key=lambda row: sum(row[0]), reverse=True)
+            kept = np.empty((len(rows), len(rows[0][0])), dtype=np.int64)
+            n_kept = 0
+            for values, key, secondary, chosen in rows:
+                if n_kept and (kept[:n_kept] >= values).all(axis=1).any(): continue
+                kept[n_kept] = values
+                n_kept += 1
+                kept_states.setdefault(key, []).append((secondary, chosen))
+        return kept_states
+
+    def _prune_by_bound(self, states: dict, optimistic: List[tuple], best_score: float, dims: List[str]) -> dict:
+        """Drops loadouts whose optimistic bound can't reach `best_score`, then keeps the max_states best scoring ones."""
+        bounded = []
+        for key, front in states.items():
+            gains = optimistic[self.tool_slots - key[1]]
+            primary = key[0]
+            for secondary, chosen in front:
+                bound = self.calculate_score_for_stats(self._to_stats(tuple(v + g for v, g in zip(primary + secondary, gains)), dims))
+                if bound < best_score: continue
+                bounded.append((self.calculate_score_for_stats(self._to_stats(primary + secondary, dims)), key, secondary, chosen))
+        if self.max_states is not None and len(bounded) > self.max_states:
+            bounded.sort(key=lambda row: row[0], reverse=True)
+            del bounded[self.max_states:]
+        pruned = {}
+        for _, key, secondary, chosen in bounded:
+            pruned.setdefault(key, []).append((secondary, chosen))
+        return pruned
+
+    def _optimistic_gains(self, groups, dims: List[str]) -> List[List[tuple]]:
+        """
+        Per decision and number of free tool slots, the most each stat can still grow from that decision on:
+        the best value of every remaining slot, and of the best remaining tools for as many tools as still fit.
+        """
+        optimistic = [None] * (len(groups) + 1)
+        slot_gain = [0] * len(dims)
+        tool_values = [[] for _ in dims]
+        for group_index in range(len(groups), -1, -1):
+            if group_index < len(groups):
+                slot, options = groups[group_index]
+                for k in range(len(dims)):
+                    best = max(0, max(vector[k] for _, vector, _, _ in options))
+                    if slot == "Tool": tool_values[k].append(best)
+                    else: slot_gain[k] += best
+            top_tools = [sorted(values, reverse=True)[:self.tool_slots] for values in tool_values]
+            optimistic[group_index] = [
+                tuple(slot_gain[k] + sum(top_tools[k][:free]) for k in range(len(dims)))
+                for free in range(self.tool_slots + 1)
+            ]
+        return optimistic
+
+    def _sets_with_bonus(self, candidates: Dict[str, List[Item]]) -> List[str]:
+        return sorted({item.set_name for items in candidates.values() for item in items if item.has_set_attr})
+
+    def _slot_groups(self, candidates: Dict[str, List[Item]], dims: List[str]):
+        """
+        The decisions of the DP in order: one per single slot, two ring slots and one per tool.
+        Every option is (item or None, integer stat vector, restricted keyword bits, set vector), where the
+        set vector holds (piece, bonus piece count) per set and then (piece, 0) per required keyword.
+        Items without any stat the target uses are dropped unless they count towards a set bonus or a
+        requirement, leaving the slot empty is never worse.
+        """
+        keywords = sorted(RESTRICTED_TOOL_KEYWORDS)
+        empty = (None, tuple(0 for _ in dims), 0, None)
+        def options_for(items):
+            options = [empty]
+            for item in items:
+                stats = self._stats_of(item)
+                vector = tuple(round(stats[d] * RESOLUTION) for d in dims)
+                set_vector = None
+                if item.set_name in self.set_names or self.requirements.keywords_of(item):
+                    set_vector = tuple(
+                        (int(item.is_part_of_set), item.set_count if item.has_set_attr else 0) if name == item.set_name else (0, 0)
+                        for name in self.set_names
+                    ) + tuple((int(keyword in item.keywords), 0) for keyword in self.required_keywords)
+                if not any(vector) and set_vector is None: continue
+                tool_mask = 0
+                for bit, keyword in enumerate(keywords):
+                    if keyword in item.keywords: tool_mask |= 1 << bit
+                options.append((item, vector, tool_mask, set_vector))
+            return options
+
+        def without_dominated(options, keep):
+            # An item can only be part of the optimum if fewer than `keep` other items of the slot beat it
+            # in every stat without taking more restricted tool keywords. Equal items keep the earlier one.
+            kept = [options[0]]
+            for i, (item, vector, tool_mask, set_vector) in enumerate(options[1:], 1):
+                dominated_by = 0
+                for j, (_, other, other_mask, other_set_vector) in enumerate(options[1:], 1):
+                    if i == j or set_vector is not None or other_set_vector is not None: continue
+                    if other_mask & ~tool_mask: continue
+                    if all(o >= v for o, v in zip(other, vector)) and (other != vector or j < i):
+                        dominated_by += 1
+                        if dominated_by >= keep: break
+                if dominated_by < keep: kept.append(options[i])
+            return kept
+
+        groups = []
+        for slot_attr in SINGLE_SLOTS:
+            slot_key = slot_attr.capitalize()
+            options = without_dominated(options_for(candidates.get(slot_key, [])), 1)
+            if len(options) > 1: groups.append((slot_attr, options))
+        ring_options = without_dominated(options_for(candidates.get("Ring", [])), 2)
+        if len(ring_options) > 1:
+            groups.append(("Ring", ring_options))
+            groups.append(("Ring", ring_options))
+        # Required tools first, then the strongest, so valid loadouts (and with them the score bound) are found early
+        # and loadouts still lacking a required tool run out of options soon
+        tools = sorted(candidates.get("Tool", []), key=lambda tool: (bool(self.requirements.keywords_of(tool)), self._score_single_item(tool)), reverse=True)
+        for option in without_dominated(options_for(tools), self.tool_slots)[1:]:
+            groups.append(("Tool", [empty, option]))
+        return groups
+
+    def _set_pieces_left(self, groups) -> Tuple[List[tuple], List[tuple]]:
+        """
+        Per decision and set, how many more pieces the later decisions could add at most,
+        and the largest piece count a set bonus of the later decisions could still ask for.
+        """
+        counted = len(self.set_names) + len(self.required_keywords)
+        pieces_left = [None] * len(groups)
+        bonus_left = [None] * len(groups)
+        pieces = [0] * counted
+        bonus = [0] * counted
+        for group_index in range(len(groups) - 1, -1, -1):
+            pieces_left[group_index] = tuple(pieces)
+            bonus_left[group_index] = tuple(bonus)
+            _, options = groups[group_index]
+            for k in range(counted):
+                set_vectors = [set_vector[k] for _, _, _, set_vector in options if set_vector]
+                if any(piece for piece, _ in set_vectors): pieces[k] += 1
+                bonus[k] = max([bonus[k]] + [count for _, count in set_vectors])
+        return pieces_left, bonus_left
+
+    def _add_set_pieces(self, set_state: tuple, set_vector: Optional[tuple], pieces_left: tuple, bonus_left: tuple) -> Optional[tuple]:
+        """New (pieces, needed) per set, or None if a set bonus can't get enough pieces any more."""
+        if set_vector is None:
+            set_vector = tuple((0, 0) for _ in set_state)
+        new_state = []
+        for (pieces, needed), (piece, count), left, bonus in zip(set_state, set_vector, pieces_left, bonus_left):
+            needed = max(needed, count)
+            pieces += piece
+            if pieces + left < needed: return None
+            # Pieces beyond what any bonus could still ask for don't matter, merge those buckets
+            new_state.append((min(pieces, max(needed, bonus)), needed))
+        return tuple(new_state)
+
+    def _bucket_limits(self, groups, dims: List[str]) -> List[Tuple[Optional[int], ...]]:
+        """
+        Per decision, the value above which a stat can't change the result any more.
+        Caps are rounded up, a bucket just below the cap would give one step more after the ceil in calculate_steps.
+        A capped stat can still lose the negative stats of later decisions, so its limit is the cap
+        plus everything the remaining decisions could take away.
+        """
+        caps = {d: STAT_CAPS[stat_name(d)] for d in dims if stat_name(d) in STAT_CAPS}
+        # On a route, efficiency still counts up to the highest cap of its activities of the skill
+        for activity in self.context.activities:
+            key = self.context.stat_key(activity, "work_efficiency")
+            cap = (activity.max_work_efficiency or 0.0) - min(0.25, max(0, self.player_skill_level - (activity.skill_level or 0)) * 0.0125)
+            caps[key] = max(caps.get(key, cap), cap)
+
+        limits = [None] * len(groups)
+        remaining_negative = [0] * len(dims)
+        for group_index in range(len(groups) - 1, -1, -1):
+            limits[group_index] = tuple(
+                math.ceil(caps[d] * RESOLUTION) - remaining_negative[k] if d in caps else None
+                for k, d in enumerate(dims)
+            )
+            _, options = groups[group_index]
+            for k in range(len(dims)):
+                remaining_negative[k] += min(0, min(vector[k] for _, vector, _, _ in options))
+        return limits
+
+    def _clamp(self, values: tuple, vector: tuple, limit: tuple, offset: int) -> tuple:
+        result = []
+        for k, value in enumerate(values):
+            value += vector[offset + k]
+            cap = limit[offset + k]
+            if cap is not None and value > cap: value = cap
+            result.append(value)
+        return tuple(result)
+
+    def _insert(self, states: dict, key: tuple, secondary: tuple, chosen):
+        """Adds a loadout to its bucket unless another loadout there has at least the same secondary stats."""
+        front = states.get(key)
+        if front is None:
+            states[key] = [(secondary, chosen)]
+            return
+        for other, _ in front:
+            if all(o >= s for o, s in zip(other, secondary)): return
+        front[:] = [(other, c) for other, c in front if not all(s >= o for o, s in zip(other, secondary))]
+        front.append((secondary, chosen))
+
+    def _to_stats(self, values: tuple, dims: List[str]) -> Dict[str, float]:
+        stats = dict(self._empty_stats)
+        for d, value in zip(dims, values):
+            stats[d] = value / RESOLUTION
+        return cap_stats(stats)
+
+    def _build_set(self, chosen) -> GearSet:
+        best_set = GearSet()
+        while chosen is not None:
+            item, chosen = chosen
+            if item.slot == "Ring": best_set.rings.insert(0, item)
+            elif item.slot == "Tool": best_set.tools.insert(0, item)
+            else: setattr(best_set, item.slot.lower(), item)
+        return best_set
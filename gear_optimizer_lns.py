@@ -0,0 +1,270 @@
+import math
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from models import Item, GearSet, cap_stats
+from gear_optimizer_q import (GearOptimizer, RESTRICTED_TOOL_KEYWORDS, SINGLE_SLOTS,
+                              CONVERGENCE_REASON, OptimizationResult, SetTracker)
+
+RING_SHORTLIST = 8  # Rings kept for the pair search of a repair, by their score on the rest of the loadout
+
+
+class _Loadout:
+    """A loadout with its summed target stats and set pieces, updated item by item."""
+    def __init__(self, dims: int):
+        self.single: Dict[str, Optional[Item]] = {slot: None for slot in SINGLE_SLOTS}
+        self.rings: List[Item] = []
+        self.tools: List[Item] = []
+        self.values = [0.0] * dims
+        self.tracker = SetTracker()
+
+    def copy(self) -> "_Loadout":
+        other = _Loadout(0)
+        other.single = dict(self.single)
+        other.rings = list(self.rings)
+        other.tools = list(self.tools)
+        other.values = list(self.values)
+        other.tracker = SetTracker(self.items())
+        return other
+
+    def items(self) -> List[Item]:
+        return [item for item in self.single.values() if item is not None] + self.rings + self.tools
+
+    def gearset(self) -> GearSet:
+        gearset = GearSet(rings=list(self.rings), tools=list(self.tools))
+        for slot, item in self.single.items():
+            if item is not None: setattr(gearset, slot, item)
+        return gearset
+
+
+class LNSGearOptimizer(GearOptimizer):
+    """
+    Large-neighbourhood search for big inventories. Starts from one greedy pass, then repeatedly destroys
+    2-4 units of the loadout and repairs them greedily: a unit is a single slot, the ring pair, the tool of
+    one restricted keyword (RESTRICTED_TOOL_KEYWORDS) or the unrestricted tools, and some moves place one of
+    the top sets instead. Candidates are scored from the summed stats of the rest of the loadout plus their
+    own (delta scoring), never from the whole gearset. A worse repair is still accepted with the simulated
+    annealing probability, the best loadout seen is returned. A move that loses a required item is completed
+    for the activity's requirements (constraints.Requirements) before it is scored.
+    The budget is `iterations` moves, or `time_limit` seconds if given; the same seed and iteration budget
+    always give the same result.
+    """
+    def __init__(self, all_items: List[Item], iterations: int = 2000, time_limit: Optional[float] = None, seed: int = 0,
+                 temperature: float = 0.02, set_move_rate: float = 0.1, **kwargs):
+        super().__init__(all_items, **kwargs)
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.seed = seed
+        # Starting acceptance scale, as a share of the current score, cooled linearly to 0 over the budget
+        self.temperature = temperature
+        self.set_move_rate = set_move_rate
+
+    def search(self) -> OptimizationResult:
+        activity = self.activity
+        self._vectors = {}
+        self._empty_stats = GearSet().get_stats(self.context.skills, capped=False)
+        self._dims = sorted(self.score_kernel().stats)
+        rng = random.Random(self.seed)
+
+        self._candidates = self._keep_best_versions(self._get_candidates(), activity)
+        self._set_requirements(self._candidates)
+        self._top_set_items = self._top_sets(self._candidates) if self.set_move_rate > 0 else []
+        units = self._units()
+
+        current = _Loadout(len(self._dims))
+        self._repair(current, units, rng, noise=0.0)
+        self._restore_requirements(current)
+        current_score = self._score(current.values)
+        best, best_score = current.copy(), current_score
+        deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        iteration = 0
+        # Without any unit to destroy there is nothing to search
+        reason = CONVERGENCE_REASON.converged
+        while units:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    reason = CONVERGENCE_REASON.time_limit
+                    break
+                progress = 1.0 - (deadline - time.perf_counter()) / self.time_limit
+            else:
+                if iteration >= self.iterations:
+                    reason = CONVERGENCE_REASON.max_iterations
+                    break
+                progress = iteration / self.iterations
+            iteration += 1
+
+            candidate = current.copy()
+            if self._top_set_items and rng.random() < self.set_move_rate:
+                if not self._place_top_set(candidate, rng.choice(self._top_set_items)): continue
+            else:
+                destroyed = rng.sample(units, min(len(units), rng.randint(2, 4)))
+                self._destroy(candidate, destroyed)
+                self._repair(candidate, destroyed, rng, noise=0.2)
+                if not self._fix_sets(candidate, rng): continue
+            self._restore_requirements(candidate)
+            score = self._score(candidate.values)
+
+            # Annealing: gains are always taken, losses with a probability shrinking with the loss and the cooling
+            delta = score - current_score
+            temperature = self.temperature * (1.0 - progress) * abs(current_score)
+            if delta >= 0 or (temperature > 0 and rng.random() < math.exp(delta / temperature)):
+                current, current_score = candidate, score
+                if score > best_score:
+                    best, best_score = candidate.copy(), score
+
+        gearset = best.gearset()
+        return OptimizationResult(gearset=gearset, score=self.calculate_score_for_set(gearset), iterations=iteration,
+                                  reason=reason, unmet_requirements=dict(self.unmet_requirements))
+
+    # --- Units ---
+    def _units(self) -> List[Tuple[str, Optional[str]]]:
+        """("slot", slot), ("rings", None), ("tool", keyword) per restricted keyword and ("tool", None) for the other tools."""
+        units = [("slot", slot) for slot in SINGLE_SLOTS if self._candidates.get(slot.capitalize())]
+        if self._candidates.get("Ring"): units.append(("rings", None))
+        tools = self._candidates.get("Tool", [])
+        for keyword in sorted(RESTRICTED_TOOL_KEYWORDS):
+            if any(keyword in tool.keywords for tool in tools): units.append(("tool", keyword))
+        if any(self._tool_keyword(tool) is None for tool in tools): units.append(("tool", None))
+        return units
+
+    def _tool_keyword(self, tool: Item) -> Optional[str]:
+        return next((k for k in tool.keywords if k in RESTRICTED_TOOL_KEYWORDS), None)
+
+    def _destroy(self, loadout: _Loadout, units: list) -> List[Item]:
+        removed = []
+        for kind, key in units:
+            if kind == "slot":
+                if loadout.single[key] is not None: removed.append(loadout.single[key])
+                loadout.single[key] = None
+            elif kind == "rings":
+                removed += loadout.rings
+                loadout.rings = []
+            else:
+                removed += [tool for tool in loadout.tools if self._tool_keyword(tool) == key]
+                loadout.tools = [tool for tool in loadout.tools if self._tool_keyword(tool) != key]
+        for item in removed:
+            self._remove(loadout, item)
+        return removed
+
+    def _repair(self, loadout: _Loadout, units: list, rng: random.Random, noise: float) -> List[Item]:
+        """Refills the units in random order, each with its best item given the rest (or the runner-up with probability `noise`)."""
+        added = []
+        for kind, key in rng.sample(units, len(units)):
+            if kind == "slot":
+                item = self._pick(loadout, self._candidates.get(key.capitalize(), []), rng, noise)
+                if item is not None:
+                    loadout.single[key] = item
+                    self._add(loadout, item)
+                    added.append(item)
+            elif kind == "rings":
+                rings = self._best_rings(loadout)
+                loadout.rings = list(rings)
+                for ring in rings: self._add(loadout, ring)
+                added += rings
+            else:
+                tools = [t for t in self._candidates.get("Tool", []) if self._tool_keyword(t) == key]
+                # One tool of a restricted keyword, as many unrestricted ones as help
+                while len(loadout.tools) < self.tool_slots:
+                    fitting = [t for t in tools if self._is_valid_tool_set(loadout.tools + [t])]
+                    tool = self._pick(loadout, fitting, rng, noise)
+                    if tool is None: break
+                    loadout.tools.append(tool)
+                    self._add(loadout, tool)
+                    added.append(tool)
+                    if key is not None: break
+        return added
+
+    def _fix_sets(self, loadout: _Loadout, rng: random.Random, rounds: int = 3) -> bool:
+        """Destroys and repairs the units of set bonus items that lost their pieces, False if the loadout stays invalid."""
+        for _ in range(rounds):
+            broken = [item for item in loadout.items() if item.has_set_attr and not loadout.tracker.is_active(item)]
+            if not broken: return True
+            units = []
+            for item in broken:
+                if item.slot == "Ring": unit = ("rings", None)
+                elif item.slot == "Tool": unit = ("tool", self._tool_keyword(item))
+                else: unit = ("slot", item.slot.lower())
+                if unit not in units: units.append(unit)
+            self._destroy(loadout, units)
+            self._repair(loadout, units, rng, noise=0.0)
+        return loadout.tracker.all_satisfied(loadout.items())
+
+    def _pick(self, loadout: _Loadout, items: List[Item], rng: random.Random, noise: float) -> Optional[Item]:
+        """The item adding the most to the loadout, None if none adds anything. Set bonus items need their pieces."""
+        base = self._score(loadout.values)
+        scored = []
+        for item in items:
+            if item.has_set_attr and not self._bonus_reachable(loadout, item): continue
+            score = self._score_with(loadout.values, self._vector(item))
+            if score > base or (score == base and item.set_name is not None): scored.append((score, item))
+        if not scored: return None
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        if len(scored) > 1 and rng.random() < noise: return scored[1][1]
+        return scored[0][1]
+
+    def _best_rings(self, loadout: _Loadout) -> List[Item]:
+        """Best of no ring, one ring or a pair (a ring can be worn twice) among the shortlisted rings."""
+        rings = [r for r in self._candidates.get("Ring", []) if not r.has_set_attr or self._bonus_reachable(loadout, r)]
+        scored = sorted(((self._score_with(loadout.values, self._vector(r)), i) for i, r in enumerate(rings)), reverse=True)
+        shortlist = [rings[i] for _, i in scored[:RING_SHORTLIST]]
+        best, best_score = [], self._score(loadout.values)
+        for i, first in enumerate(shortlist):
+            options = [[first]] + [[first, second] for second in shortlist[i:]]
+            for option in options:
+                values = loadout.values
+                for ring in option:
+                    values = [v + d for v, d in zip(values, self._vector(ring))]
+                score = self._score(values)
+                if score > best_score: best, best_score = option, score
+        return best
+
+    def _place_top_set(self, loadout: _Loadout, set_items: List[Item]) -> bool:
+        """Places a top set with place_set and takes its rings and tools, False if that breaks a set bonus."""
+        _, placed = self.place_set(loadout.gearset(), set_items)
+        if placed is None or not SetTracker(placed.all_items).all_satisfied(placed.all_items): return False
+        self._load(loadout, placed)
+        return True
+
+    def _restore_requirements(self, loadout: _Loadout):
+        """Completes the loadout for the requirements, or swaps in the fallback loadout if it can't be completed."""
+        if self.requirements.is_satisfied(loadout.items()): return
+        self._load(loadout, self._feasible_start(loadout.gearset(), self._candidates))
+
+    def _load(self, loadout: _Loadout, gearset: GearSet):
+        """Replaces the loadout's items with the gearset's."""
+        for item in loadout.items():
+            self._remove(loadout, item)
+        loadout.single = {slot: getattr(gearset, slot) for slot in SINGLE_SLOTS}
+        loadout.rings = list(gearset.rings)
+        loadout.tools = list(gearset.tools)
+        for item in loadout.items():
+            self._add(loadout, item)
+
+    def _bonus_reachable(self, loadout: _Loadout, item: Item) -> bool:
+        pieces = loadout.tracker.pieces.get(item.set_name, 0) + (1 if item.is_part_of_set else 0)
+        return pieces >= item.set_count
+
+    # --- Delta scoring ---
+    def _add(self, loadout: _Loadout, item: Item):
+        loadout.values = [v + d for v, d in zip(loadout.values, self._vector(item))]
+        loadout.tracker.equip(item)
+
+    def _remove(self, loadout: _Loadout, item: Item):
+        loadout.values = [v - d for v, d in zip(loadout.values, self._vector(item))]
+        loadout.tracker.unequip(item)
+
+    def _vector(self, item: Item) -> tuple:
+        vector = self._vectors.get(id(item))
+        if vector is None:
+            stats = self._stats_of(item)
+            vector = self._vectors[id(item)] = tuple(stats[d] for d in self._dims)
+        return vector
+
+    def _score_with(self, values: List[float], vector: tuple) -> float:
+        return self._score([v + d for v, d in zip(values, vector)])
+
+    def _score(self, values) -> float:
+        stats = dict(self._empty_stats)
+        for d, value in zip(self._dims, values):
+            stats[d] = value
+        return self.calculate_score_for_stats(cap_stats(stats))
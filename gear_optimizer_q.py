@@ -1,114 +1,333 @@
-import itertools
 import copy
-from typing import Dict, List
-from models import Item, Activity, GearSet
-from utils import calculate_steps, calculate_quality_probabilities
+import itertools
+import heapq
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Union
+from pydantic import BaseModel, ConfigDict, Field
+from models import Item, Activity, GearSet, add_stats, cap_stats, skill_stat
 from enum import Enum
+from breakpoints import StepBreakpoints
+from scoring import OPTIMAZATION_TARGET, Objective, Route, ScoreKernel, compile_kernel
+from constraints import Requirements
+if TYPE_CHECKING: from columnar import ColumnarCatalogue  # numpy is only imported when a columnar catalogue is used
 
 RESTRICTED_TOOL_KEYWORDS = {"pickaxe", "hatchet", "fishingTool", "lure", "hammer", "splitter"} # need to add more
-OPTIMAZATION_TARGET = Enum("OPTIMAZATION_TARGET", ["reward_rolls", "xp", "chests", "materials", "fine", "collectibles", "quality"])
+# Why the local search stopped
+CONVERGENCE_REASON = Enum("CONVERGENCE_REASON", ["converged", "cycle", "plateau", "max_iterations", "time_limit"])
 
-class GearOptimizer:
-    activity: Activity
+SINGLE_SLOTS = ["head", "chest", "legs", "feet", "cape", "back", "neck", "hands", "primary", "secondary", "pet", "consumable"]
+
+MAX_ITERATIONS = 100
+SCORE_TOLERANCE = 1e-12  # Relative gains below this are float noise from summing the same stats in another order
+
+
+def tool_slots_for(player_level: int) -> int:
+    if player_level >= 80: return 6
+    if player_level >= 50: return 5
+    if player_level >= 20: return 4
+    return 3
+
+def is_candidate(item: Item, activity: Activity) -> bool:
+    """Whether the item can be worn for the activity at all."""
+    item_skills = item.skill.split(',') if item.skill else []
+    if item.skill is not None and activity.skill not in item_skills and not item.is_part_of_set: return False
+    if item.region and item.region != activity.region: return False
+    if item.underwater_only and not activity.is_underwater: return False
+    return True
+
+class SetTracker:
+    """
+    Counts the equipped pieces of every set and the piece counts the equipped set bonuses need.
+    Updated on equip/unequip so set bonus checks don't rescan the loadout.
+    """
+    def __init__(self, items: List[Item] = ()):
+        self.pieces: Dict[str, int] = {}
+        self.required: Dict[str, Dict[int, int]] = {}
+        for item in items:
+            self.equip(item)
+
+    def equip(self, item: Item):
+        if item is None or item.set_name is None: return
+        if item.is_part_of_set:
+            self.pieces[item.set_name] = self.pieces.get(item.set_name, 0) + 1
+        if item.has_set_attr:
+            counts = self.required.setdefault(item.set_name, {})
+            counts[item.set_count] = counts.get(item.set_count, 0) + 1
+
+    def unequip(self, item: Item):
+        if item is None or item.set_name is None: return
+        if item.is_part_of_set:
+            self.pieces[item.set_name] -= 1
+        if item.has_set_attr:
+            counts = self.required[item.set_name]
+            counts[item.set_count] -= 1
+            if counts[item.set_count] == 0: del counts[item.set_count]
+
+    def is_active(self, item: Item) -> bool:
+        """True if enough pieces of the item's set are equipped for its set bonus."""
+        return self.pieces.get(item.set_name, 0) >= item.set_count
+
+    def is_satisfied(self, set_name: str) -> bool:
+        """True if every equipped set bonus of this set has enough pieces."""
+        counts = self.required.get(set_name)
+        if not counts: return True
+        return self.pieces.get(set_name, 0) >= max(counts)
+
+    def all_satisfied(self, items: List[Item]) -> bool:
+        """Checks the sets of the given (just swapped) items only."""
+        for item in items:
+            if item is not None and item.set_name is not None and not self.is_satisfied(item.set_name):
+                return False
+        return True
+
+class OptimizeContext(BaseModel):
+    """The inputs of one optimize call. Frozen, so nothing in a call can change them."""
+    model_config = ConfigDict(frozen=True)
+    activity: Activity  # The first activity of a route
     player_level: int
     player_skill_level: int
+    optimazation_target: Objective
     tool_slots: int
-    optimazation_target: OPTIMAZATION_TARGET
-    locked_slots: set[str]
-    locked_tools: list[Item]
-    locked_rings: list[Item]
-    
-    def __init__(self, all_items: List[Item]):
+    route: Optional[Route] = None
+
+    @classmethod
+    def create(cls, activity: Union[Activity, Route], player_level: int, player_skill_level: int,
+               optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> "OptimizeContext":
+        route = activity if isinstance(activity, Route) else None
+        return cls(activity=route.activities[0] if route else activity, player_level=player_level, player_skill_level=player_skill_level,
+                   optimazation_target=optimazation_target, tool_slots=tool_slots_for(player_level), route=route)
+
+    @property
+    def activities(self) -> List[Activity]:
+        """Every activity the loadout is worn for."""
+        return self.route.activities if self.route is not None else [self.activity]
+
+    @property
+    def skills(self) -> List[Optional[str]]:
+        """The skills the item stats are summed for, get_stats keys are per skill when there are several."""
+        return self.route.skills if self.route is not None else [self.activity.skill]
+
+    def stat_key(self, activity: Activity, stat: str) -> str:
+        """The get_stats key of one activity's stat."""
+        return stat if len(self.skills) == 1 else skill_stat(activity.skill, stat)
+
+
+class OptimizationResult(BaseModel):
+    gearset: GearSet
+    score: float
+    iterations: int
+    reason: CONVERGENCE_REASON
+    # Items per required keyword the candidates can't provide, the loadout ignores these requirements
+    unmet_requirements: Dict[str, int] = Field(default_factory=dict)
+
+
+class MultiStartResult(BaseModel):
+    best: OptimizationResult
+    best_start: int
+    scores: List[float]  # final score of every start, in start order
+    distinct_loadouts: int  # local optima the starts ended in
+
+    @property
+    def min_score(self) -> float:
+        return min(self.scores)
+
+    @property
+    def mean_score(self) -> float:
+        return statistics.fmean(self.scores)
+
+    @property
+    def stdev_score(self) -> float:
+        return statistics.pstdev(self.scores)
+
+
+class ConvergenceMonitor:
+    """
+    Watches the passes of the local search. Loadouts are fingerprinted after every pass, and the search
+    stops as soon as a pass leaves the loadout as it was (converged), returns to a loadout an earlier pass
+    ended on (cycle), changes it without a real gain (plateau, e.g. swapping equally good items), or the
+    pass limit is reached.
+    """
+    def __init__(self, start: tuple, max_iterations: int = MAX_ITERATIONS):
+        self.max_iterations = max_iterations
+        self.iterations = 0
+        self.reason: Optional[CONVERGENCE_REASON] = None
+        self._last = start
+        self._visited: Set[tuple] = {start}
+
+    def step(self, fingerprint: tuple, pre_score: float, score: float) -> Optional[CONVERGENCE_REASON]:
+        """Records a finished pass, returns the reason to stop or None to go on."""
+        self.iterations += 1
+        if fingerprint == self._last: self.reason = CONVERGENCE_REASON.converged
+        elif fingerprint in self._visited: self.reason = CONVERGENCE_REASON.cycle
+        elif score - pre_score <= SCORE_TOLERANCE * abs(pre_score): self.reason = CONVERGENCE_REASON.plateau
+        elif self.iterations >= self.max_iterations: self.reason = CONVERGENCE_REASON.max_iterations
+        self._last = fingerprint
+        self._visited.add(fingerprint)
+        return self.reason
+
+
+class GearOptimizer:
+    """
+    An optimizer holds the catalogue data and is never changed by an optimize call, so one instance can serve
+    many calls at once (e.g. from a thread pool). Every call runs on `bind`, a copy that shares the items and
+    adds the call's OptimizeContext and its own caches; scoring and the search methods need a bound optimizer.
+    """
+    def __init__(self, all_items: List[Item], workers: int = 1, columnar: Optional["ColumnarCatalogue"] = None):
         self.all_items = all_items
-        self.player_level = 0
-        self.player_skill_level = 0
-        self.tool_slots = 3
-        self.optimazation_target = OPTIMAZATION_TARGET.reward_rolls
-        self.locked_slots = set()
-        self.locked_tools = []
-        self.locked_rings = []
-
-    def optimize(self, activity: Activity, player_level: int, player_skill_level: int, optimazation_target: OPTIMAZATION_TARGET = OPTIMAZATION_TARGET.reward_rolls):
-        self.activity = activity
-        self.player_level = player_level
-        self.player_skill_level = player_skill_level
-        self.optimazation_target = optimazation_target
-        if player_level >= 80: self.tool_slots = 6
-        elif player_level >= 50: self.tool_slots = 5
-        elif player_level >= 20: self.tool_slots = 4
-        else: self.tool_slots = 3
-
-        candidates = self._get_candidates(activity)
+        self.context: Optional[OptimizeContext] = None
+        # Processes for the tool subset, set scoring and set placement batches of one optimize call, 1 = serial
+        self.workers = workers
+        # With a columnar copy of the catalogue, workers map it instead of unpickling the candidates
+        self.columnar = columnar
+
+    def bind(self, activity: Union[Activity, Route], player_level: int, player_skill_level: int,
+             optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> "GearOptimizer":
+        """
+        A copy for one optimize call, e.g. to score loadouts for an activity or to inspect a call afterwards.
+        With a route, one loadout is searched for all of its activities.
+        """
+        return self.with_context(OptimizeContext.create(activity, player_level, player_skill_level, optimazation_target))
+
+    def with_context(self, context: OptimizeContext) -> "GearOptimizer":
+        bound = copy.copy(self)
+        bound.context = context
+        bound._kernel = compile_kernel(context.optimazation_target, context.route or context.activity, context.player_skill_level)
+        bound._item_stats = {}
+        bound._step_only = {}
+        bound.requirements = Requirements()
+        bound.unmet_requirements = {}
+        bound._required_start = GearSet()
+        return bound
+
+    def _bound(self) -> OptimizeContext:
+        if self.context is None: raise RuntimeError("The optimizer isn't bound to an optimize call, use bind()")
+        return self.context
+
+    @property
+    def activity(self) -> Activity:
+        return self._bound().activity
+
+    @property
+    def player_level(self) -> int:
+        return self._bound().player_level
+
+    @property
+    def player_skill_level(self) -> int:
+        return self._bound().player_skill_level
+
+    @property
+    def optimazation_target(self) -> Objective:
+        return self._bound().optimazation_target
+
+    @property
+    def tool_slots(self) -> int:
+        return self._bound().tool_slots
+
+    def optimize(self, activity: Union[Activity, Route], player_level: int, player_skill_level: int, optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls):
+        return self.optimize_with_info(activity, player_level, player_skill_level, optimazation_target).gearset
+
+    def optimize_with_info(self, activity: Union[Activity, Route], player_level: int, player_skill_level: int,
+                           optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls) -> OptimizationResult:
+        """Like optimize, with the score, the number of passes and why the search stopped."""
+        return self.bind(activity, player_level, player_skill_level, optimazation_target).search()
+
+    def search(self) -> OptimizationResult:
+        """The search of a bound optimizer, optimizers override this."""
+        activity = self.activity
+        candidates = self._get_candidates()
 
         candidates = self._keep_best_versions(candidates, activity)
+        self._set_requirements(candidates)
 
-        best_set = GearSet()
+        if self.workers <= 1:
+            return self._optimize(candidates)
+        # Workers get the candidate table once, batches only pass item indexes
+        table = CandidateTable(candidates)
+        initargs = (self._worker_items_source(table.items), table.slots, self.context, self.requirements)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=initargs) as pool:
+            return self._optimize(candidates, pool, table)
+
+    def _worker_items_source(self, items: List[Item]):
+        """The items themselves, or (columnar path, rows) if all of them are rows of the columnar catalogue."""
+        if self.columnar is None: return items
+        rows = self.columnar.item_rows(items)
+        return items if rows is None else (self.columnar.path, rows)
+
+    def _optimize(self, candidates: Dict[str, List[Item]], pool: Optional[ProcessPoolExecutor] = None, table: "CandidateTable" = None,
+                  start: Optional[GearSet] = None, slot_order: Optional[List[str]] = None,
+                  top_sets: Optional[List[List[Item]]] = None) -> OptimizationResult:
+        """
+        The local search from `start` (a valid loadout, empty by default), sweeping the single slots in
+        `slot_order` (SINGLE_SLOTS by default). `top_sets` skips scoring the sets when the caller already has them.
+        """
+        best_set = self._feasible_start(start if start is not None else GearSet(), candidates)
+        tracker = SetTracker(best_set.all_items)
         base_score = self.calculate_score_for_set(best_set)
 
 
-        single_slots = ["head", "chest", "legs", "feet", "cape", "back", "neck", "hands", "primary", "secondary", "pet", "consumable"]
+        single_slots = slot_order or SINGLE_SLOTS
         
         #sets
-        set_names = self.get_all_sets()
-        set_data = self.preprocessing_sets(set_names, candidates)
-        scored_sets = self.score_sets_on_empty_gear_set(set_names, set_data)
-        scored_sets.sort(key=lambda x: x[0], reverse=True)
-        top_sets = [x[1] for x in scored_sets[:15]]
+        if top_sets is None: top_sets = self._top_sets(candidates, pool, table)
         
-        changed = True
-        changed_iter = 0
-        while changed:
-            changed = False
-            changed_iter += 1
-            if changed_iter > 100: # Exit condition in case of flip-flopping gear
-                print("Optimization loop exited after 100 loops. Potentially not optimal solution")
-                break
+        # Every activity's breakpoints, with the keys of its skill's step stats
+        self._breakpoints = [
+            (StepBreakpoints(activity, self.player_skill_level),
+             tuple(self.context.stat_key(activity, stat) for stat in ("work_efficiency", "percent_step_reduction", "flat_step_reduction")))
+            for activity in self.context.activities
+        ]
+        last_ring_search = None
+        monitor = ConvergenceMonitor(self._loadout_fingerprint(best_set))
+        while monitor.reason is None:
             pre_iter_score = base_score
             
             for slot_attr in single_slots:
-                if slot_attr in self.locked_slots:
-                    continue
-                best_item = getattr(best_set, slot_attr)
+                current_item = getattr(best_set, slot_attr)
+                best_item = current_item
                 max_slot_score = base_score 
                 slot_key = slot_attr.capitalize()
                 if slot_attr == "primary": slot_key = "Primary" 
                 
+                tracker.unequip(current_item)
+                # Step totals of the rest of the loadout, to see whether a step-only item reaches a lower step count
+                setattr(best_set, slot_attr, None)
+                rest = best_set.get_stats(self.context.skills, capped=False)
+                best_steps = self._steps_with(rest, current_item)
+                # What the rest lacks for the requirements, only items making up for it can take the slot
+                rest_missing = self.requirements.missing(best_set.all_items)
                 for item in candidates.get(slot_key, []):
+                    if rest_missing and not self.requirements.covers(rest_missing, (item,)):
+                        continue
+                    if self._is_step_only(item) and not self._crosses_breakpoint(rest, item, best_steps):
+                        continue
                     setattr(best_set, slot_attr, item)
-                    if item.set_name != None and not self._check_for_set_conditions(item, best_set): continue
-                    score = self.calculate_score_for_set(best_set)
-                    
-                    if score > max_slot_score:
-                        max_slot_score = score
-                        best_item = item
-                    setattr(best_set, slot_attr, None) # Unequip
+                    tracker.equip(item)
+                    # A swap must keep the bonus of the new item and of every set the old item counted towards
+                    if tracker.all_satisfied((item, current_item)):
+                        score = self.calculate_score_for_set(best_set)
+                        if score > max_slot_score:
+                            max_slot_score = score
+                            best_item = item
+                            best_steps = self._steps_with(rest, item)
+                    tracker.unequip(item)
                 
                 setattr(best_set, slot_attr, best_item)
+                tracker.equip(best_item)
                 base_score = max_slot_score
 
             ring_items = candidates.get("Ring", [])
             if ring_items:
-                best_rings = best_set.rings
-                max_r_score = base_score
-                open_slots = 2 - len(self.locked_rings)
-                if open_slots == 0: best_rings = self.locked_rings
-                for subset_rings in itertools.combinations_with_replacement(ring_items, open_slots):
-                    Set_conditions_fulfilled = True
-                    for ring in subset_rings:
-                        if ring.set_name != None and not self._check_for_set_conditions(ring, best_set):
-                            Set_conditions_fulfilled = False
-                    if not Set_conditions_fulfilled: continue
-                    best_set.rings = list(subset_rings) + self.locked_rings
-                    score = self.calculate_score_for_set(best_set)
-                    if score > max_r_score:
-                        max_r_score = score
-                        best_rings = list(subset_rings) + self.locked_rings
-                best_set.rings = best_rings
-                base_score = max_r_score
+                # The best pair only depends on the rest of the loadout, skip the search if nothing changed since the last one
+                if self._loadout_fingerprint(best_set) != last_ring_search:
+                    best_set.rings, base_score = self._search_rings(best_set, ring_items, tracker, base_score)
+                    last_ring_search = self._loadout_fingerprint(best_set)
             
             tool_items = candidates.get("Tool", [])
             if tool_items:
-                best_tools = best_set.tools
+                old_tools = best_set.tools
+                best_tools = old_tools
                 max_t_score = base_score
                 
                 scored_tools = []
@@ -117,84 +336,325 @@ class GearOptimizer:
                     scored_tools.append( (self.calculate_score_for_set(best_set), t) )
                 scored_tools.sort(key=lambda x: x[0], reverse=True)
                 top_tools = [x[1] for x in scored_tools[:20]]
+                rest_missing = self.requirements.missing(best_set.model_copy(update={"tools": []}).all_items)
+                if rest_missing:
+                    # Tools a requirement needs are tried even when they add nothing to the score
+                    top_ids = {id(t) for t in top_tools}
+                    top_tools += [t for t in tool_items if id(t) not in top_ids and any(k in rest_missing for k in t.keywords)]
                 
-                best_set.tools = []
-                for r in range(1, self.tool_slots - len(self.locked_tools) + 1):
-                    for subset in itertools.combinations(top_tools, r):
-                        used_tools = subset + tuple(self.locked_tools)
-                        if self._is_valid_tool_set(used_tools):
-                            best_set.tools = list(used_tools)
-                            score = self.calculate_score_for_set(best_set)
-                            if score > max_t_score:
-                                max_t_score = score
-                                best_tools = list(used_tools)
+                for tool in old_tools: tracker.unequip(tool)
+                subsets = [
+                    subset for r in range(1, self.tool_slots + 1)
+                    for subset in itertools.combinations(top_tools, r)
+                    if self._is_valid_tool_set(subset) and (not rest_missing or self.requirements.covers(rest_missing, subset))
+                ]
+                if pool is None:
+                    score, pos = self._best_tool_subset(best_set, subsets, tracker, old_tools)
+                else:
+                    score, pos = self._parallel_best_tool_subset(pool, table, best_set, subsets, old_tools)
+                if score > max_t_score:
+                    max_t_score = score
+                    best_tools = list(subsets[pos])
                 best_set.tools = best_tools
+                for tool in best_tools: tracker.equip(tool)
+                base_score = max_t_score
                 
-            #Set consideration
-            set_with_most_improvement = []
-            improved = False
-            saved_set = copy.deepcopy(best_set)
-            max_score = self.calculate_score_for_set(best_set)
-            
-            for considered_set_items in top_sets:
-                score = self.process_set(copy.deepcopy(saved_set), considered_set_items)
-                if score > max_score:
-                    max_score = score
-                    improved = True
-                    set_with_most_improvement = considered_set_items
-            if improved:
-                #Apply set to best set
-                rings = []
-                tools = []
-                for item in set_with_most_improvement:
-                    slot_attr = item.slot
-                    if slot_attr == "Ring":
-                        rings.append(item)
-                    elif slot_attr == "Tool":
-                        tools.append(item)
-                    else:
-                        setattr(best_set, slot_attr.lower(), item)
-                if len(rings) > 0: best_set.rings = rings
-                if len(tools) > 0: best_set.tools = tools
-                #Lock slots of the best set to ensure that set items are not replaced
-                for item in set_with_most_improvement:
-                    slot_attr = item.slot
-                    if slot_attr == "Ring":
-                        if slot_attr + "1" not in self.locked_slots:
-                            self.locked_slots.add(slot_attr + "1")
-                        elif slot_attr + "2" not in self.locked_slots:
-                            self.locked_slots.add(slot_attr + "2")
-                        self.locked_rings.append(item)
-                        continue
-                    if slot_attr == "Tool":
-                        i = 1
-                        while True:
-                            if slot_attr + str(i) not in self.locked_slots:
-                                self.locked_slots.add(slot_attr + str(i))
-                                break
-                            i += 1
-                        self.locked_tools.append(item)
-                        continue
-                    if slot_attr.lower() not in self.locked_slots:
-                        self.locked_slots.add(slot_attr.lower())
+            #Set consideration: every top set is a move of the search, placed as a group on the current loadout
+            best_group_set = None
+            max_g_score = base_score
+            if pool is None:
+                for considered_set_items in top_sets:
+                    score, group_set = self.place_set(best_set, considered_set_items)
+                    if group_set is None or score <= max_g_score: continue
+                    if not SetTracker(group_set.all_items).all_satisfied(group_set.all_items): continue
+                    if not self.requirements.is_satisfied(group_set.all_items): continue
+                    max_g_score = score
+                    best_group_set = group_set
+            else:
+                # Workers only return the scores, the winning placement is redone here so the loadout holds our items
+                best_pos = None
+                for pos, score in enumerate(self._parallel_set_placements(pool, table, best_set, top_sets)):
+                    if score > max_g_score:
+                        max_g_score = score
+                        best_pos = pos
+                if best_pos is not None:
+                    best_group_set = self.place_set(best_set, top_sets[best_pos])[1]
+            if best_group_set is not None:
+                best_set = best_group_set
+                tracker = SetTracker(best_set.all_items)
+                base_score = max_g_score
                 
             #Iterative consideration
-            base_score = self.calculate_score_for_set(best_set)
-            if pre_iter_score < base_score:
-                changed = True
-                print(f"Optimization loop {changed_iter} yielded improvement")
-            pass
-        
-        return best_set
+            monitor.step(self._loadout_fingerprint(best_set), pre_iter_score, base_score)
+
+        return OptimizationResult(gearset=best_set, score=base_score, iterations=monitor.iterations, reason=monitor.reason,
+                                  unmet_requirements=dict(self.unmet_requirements))
+
+    def _top_sets(self, candidates: Dict[str, List[Item]], pool: Optional[ProcessPoolExecutor] = None, table: "CandidateTable" = None) -> List[List[Item]]:
+        set_names = self.get_all_sets()
+        set_data = self.preprocessing_sets(set_names, candidates)
+        return [x[1] for x in self.score_sets_on_empty_gear_set(set_names, set_data, top_k=15, pool=pool, table=table)]
+
+    # --- Multi-start ---
+    def optimize_multi_start(self, activity: Union[Activity, Route], player_level: int, player_skill_level: int,
+                             optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls,
+                             starts: int = 16, seed: int = 0) -> "MultiStartResult":
+        """
+        Runs the local search from `starts` start points and keeps the best result. The first start is the plain
+        search (empty loadout, default slot order), so the result is never worse than optimize. Up to a quarter
+        are the top sets placed on an empty loadout, the rest random loadouts of set-free items, each with a
+        random slot order. Starts come from `seed` and ties go to the earlier start, so a seed always gives the
+        same result. With workers > 1 the starts run in parallel, one per process at a time.
+        """
+        return self.bind(activity, player_level, player_skill_level, optimazation_target)._multi_start(starts, seed)
+
+    def _multi_start(self, starts: int, seed: int) -> "MultiStartResult":
+        activity = self.activity
+        candidates = self._keep_best_versions(self._get_candidates(), activity)
+        self._set_requirements(candidates)
+        top_sets = self._top_sets(candidates)
+        start_points = [(self._feasible_start(start, candidates), order)
+                        for start, order in self._start_points(candidates, top_sets, starts, random.Random(seed))]
+
+        if self.workers <= 1:
+            results = [self._optimize(candidates, start=start, slot_order=order, top_sets=top_sets) for start, order in start_points]
+        else:
+            table = CandidateTable(candidates)
+            initargs = (self._worker_items_source(table.items), table.slots, self.context, self.requirements)
+            encoded_sets = [table.encode_items(set_items) for set_items in top_sets]
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=initargs) as pool:
+                jobs = [(table.encode_set(start), order, encoded_sets) for start, order in start_points]
+                results = [
+                    OptimizationResult(gearset=table.decode_set(gearset), score=score, iterations=iterations, reason=CONVERGENCE_REASON[reason],
+                                       unmet_requirements=dict(self.unmet_requirements))
+                    for gearset, score, iterations, reason in pool.map(_local_search_job, jobs)
+                ]
+
+        best = 0
+        for i, result in enumerate(results):
+            if result.score > results[best].score: best = i
+        return MultiStartResult(
+            best=results[best], best_start=best, scores=[result.score for result in results],
+            distinct_loadouts=len({self._loadout_fingerprint(result.gearset) for result in results}),
+        )
+
+    def _start_points(self, candidates: Dict[str, List[Item]], top_sets: List[List[Item]], starts: int, rng: random.Random):
+        """(start loadout, slot order) of every start, see optimize_multi_start."""
+        points = [(GearSet(), list(SINGLE_SLOTS))]
+        for set_items in top_sets[:max(0, starts // 4)]:
+            if len(points) >= starts: break
+            _, placed = self.place_set(GearSet(), set_items)
+            if placed is None or not SetTracker(placed.all_items).all_satisfied(placed.all_items): continue
+            points.append((placed, rng.sample(SINGLE_SLOTS, len(SINGLE_SLOTS))))
+        while len(points) < starts:
+            points.append((self._random_loadout(candidates, rng), rng.sample(SINGLE_SLOTS, len(SINGLE_SLOTS))))
+        return points[:starts]
 
-    def _get_candidates(self, activity: Activity) -> Dict[str, List[Item]]:
+    def _random_loadout(self, candidates: Dict[str, List[Item]], rng: random.Random) -> GearSet:
+        """Every slot filled or left empty at random. Items with a set bonus are left out, so the loadout is always valid."""
+        def pool_of(slot_key):
+            return [item for item in candidates.get(slot_key, []) if not item.has_set_attr]
+        gearset = GearSet()
+        for slot_attr in SINGLE_SLOTS:
+            items = pool_of(slot_attr.capitalize())
+            if items and rng.random() < 0.5: setattr(gearset, slot_attr, rng.choice(items))
+        rings = pool_of("Ring")
+        if rings: gearset.rings = [rng.choice(rings) for _ in range(rng.randint(0, 2))]
+        tools = pool_of("Tool")
+        rng.shuffle(tools)
+        for tool in tools[:rng.randint(0, self.tool_slots)]:
+            if self._is_valid_tool_set(gearset.tools + [tool]): gearset.tools.append(tool)
+        return gearset
+
+    def _is_step_only(self, item: Item) -> bool:
+        """True if the item adds no target stat other than step stats, so it can only help by lowering the steps."""
+        step_only = self._step_only.get(id(item))
+        if step_only is None:
+            stats = self._stats_of(item)
+            kernel = self.score_kernel()
+            step_only = self._step_only[id(item)] = all(stats[k] == 0 for k in kernel.stats - kernel.step_stats)
+        return step_only
+
+    def _steps_with(self, rest: Dict[str, float], item: Optional[Item]) -> tuple:
+        """Steps per action of every activity of the call."""
+        stats = self._stats_of(item) if item is not None else None
+        return tuple(
+            breakpoints.steps(*(rest[key] + (stats[key] if stats else 0) for key in keys))
+            for breakpoints, keys in self._breakpoints
+        )
+
+    def _crosses_breakpoint(self, rest: Dict[str, float], item: Item, best_steps: tuple) -> bool:
+        """
+        Whether the rest of the loadout plus `item` gets below `best_steps` in any activity. A step-only item that
+        doesn't can't beat the slot's best: the score only grows with the other target stats and shrinks with the steps.
+        """
+        if not self.score_kernel().step_stats: return False
+        stats = self._stats_of(item)
+        for (breakpoints, keys), steps in zip(self._breakpoints, best_steps):
+            efficiency, pct, flat = (rest[key] + stats[key] for key in keys)
+            threshold = breakpoints.min_efficiency(steps - 1, pct, flat)
+            if threshold is not None and efficiency >= threshold: return True
+        return False
+
+    def _stats_of(self, item: Item) -> Dict[str, float]:
+        """Uncapped stats of an item for the current activity (or route skills), cached for the optimize call."""
+        stats = self._item_stats.get(id(item))
+        if stats is None:
+            stats = self._item_stats[id(item)] = item.get_stats(self.context.skills)
+        return stats
+
+    def _loadout_fingerprint(self, current_set: GearSet) -> tuple:
+        single = (current_set.head, current_set.chest, current_set.legs, current_set.feet, current_set.cape, current_set.back,
+                  current_set.neck, current_set.hands, current_set.primary, current_set.secondary, current_set.pet, current_set.consumable)
+        return tuple(id(i) for i in single), tuple(id(i) for i in current_set.rings), tuple(id(i) for i in current_set.tools)
+
+    def _search_rings(self, current_set: GearSet, ring_items: List[Item], tracker: SetTracker, base_score: float):
+        """
+        Best ring pair for the rest of the loadout, returns (rings, score).
+        Pairs are scored from summed stats instead of the whole gearset. Each ring gets an upper bound for
+        any pair it is in: its own stats plus the best value of every stat over all rings. Rings are visited
+        by bound, and the search stops once no remaining bound can beat the incumbent.
+        """
+        rest_set = current_set.model_copy(update={"rings": []})
+        rest = rest_set.get_stats(self.context.skills, capped=False)
+        rest_missing = self.requirements.missing(rest_set.all_items)
+        ring_stats = [self._stats_of(r) for r in ring_items]
+        best_single = {k: max(stats[k] for stats in ring_stats) for k in rest}
+        bounds = [self.calculate_score_for_stats(cap_stats(add_stats(rest, stats, best_single))) for stats in ring_stats]
+        order = sorted(range(len(ring_items)), key=lambda i: bounds[i], reverse=True)
+
+        old_rings = current_set.rings
+        best_rings = old_rings
+        max_r_score = base_score
+        for ring in old_rings: tracker.unequip(ring)
+        for pos, i in enumerate(order):
+            if bounds[i] <= max_r_score: break
+            for j in order[pos:]:
+                # The pair is also bounded by the second ring's bound, which only decreases from here
+                if bounds[j] <= max_r_score: break
+                if rest_missing and not self.requirements.covers(rest_missing, (ring_items[i], ring_items[j])): continue
+                score = self.calculate_score_for_stats(cap_stats(add_stats(rest, ring_stats[i], ring_stats[j])))
+                if score <= max_r_score: continue
+                subset_rings = (ring_items[i], ring_items[j])
+                for ring in subset_rings: tracker.equip(ring)
+                if tracker.all_satisfied(subset_rings) and tracker.all_satisfied(old_rings):
+                    max_r_score = score
+                    best_rings = list(subset_rings)
+                for ring in subset_rings: tracker.unequip(ring)
+        for ring in best_rings: tracker.equip(ring)
+        return best_rings, max_r_score
+
+    def _best_tool_subset(self, current_set: GearSet, subsets: List[tuple], tracker: SetTracker, old_tools: List[Item]):
+        """
+        First best (score, position) of the tool subsets with the rest of the loadout fixed, (-inf, None) if none is allowed.
+        `tracker` counts the loadout without its tools.
+        """
+        original_tools = current_set.tools
+        max_score, best_pos = float("-inf"), None
+        for pos, subset in enumerate(subsets):
+            for tool in subset: tracker.equip(tool)
+            if tracker.all_satisfied(subset) and tracker.all_satisfied(old_tools):
+                current_set.tools = list(subset)
+                score = self.calculate_score_for_set(current_set)
+                if score > max_score:
+                    max_score, best_pos = score, pos
+            for tool in subset: tracker.unequip(tool)
+        current_set.tools = original_tools
+        return max_score, best_pos
+
+    def _parallel_best_tool_subset(self, pool: ProcessPoolExecutor, table: "CandidateTable", current_set: GearSet,
+                                   subsets: List[tuple], old_tools: List[Item]):
+        """Same result as _best_tool_subset, with the subsets split into contiguous chunks over the pool."""
+        rest = table.encode_set(current_set.model_copy(update={"tools": []}))
+        old = table.encode_items(old_tools)
+        chunks = _chunks(subsets, self.workers * 4)
+        futures = [pool.submit(_best_tool_subset_job, rest, old, [table.encode_items(s) for s in chunk]) for _, chunk in chunks]
+        max_score, best_pos = float("-inf"), None
+        # Chunks are reduced in order with a strict comparison, so ties resolve to the first subset like the serial loop
+        for (offset, _), future in zip(chunks, futures):
+            score, pos = future.result()
+            if score > max_score:
+                max_score, best_pos = score, offset + pos
+        return max_score, best_pos
+
+    def _parallel_set_placements(self, pool: ProcessPoolExecutor, table: "CandidateTable", current_set: GearSet, top_sets: List[List[Item]]) -> List[float]:
+        """place_set score of every top set, -inf where the placement breaks a set bonus."""
+        current = table.encode_set(current_set)
+        chunks = _chunks([table.encode_items(set_items) for set_items in top_sets], self.workers)
+        futures = [pool.submit(_set_placements_job, current, chunk) for _, chunk in chunks]
+        return [score for future in futures for score in future.result()]
+
+    # --- Requirements ---
+    def _set_requirements(self, candidates: Dict[str, List[Item]]):
+        """
+        The activity's requirements the candidates can meet, and a loadout meeting them that the searches fall
+        back to. Requirements no loadout of the candidates meets are left out and reported in unmet_requirements.
+        """
+        self.requirements, self.unmet_requirements = Requirements.for_activities(
+            self.context.activities, self.player_level, self.player_skill_level).achievable(candidates, self.tool_slots)
+        while True:
+            start = self._meet_requirements(GearSet(), candidates)
+            # The fill gets stuck when one slot would have to hold two requirements or a set bonus is in the way
+            missing = self.requirements.missing(start.all_items)
+            if not missing: break
+            self.requirements = self.requirements.without(missing)
+            self.unmet_requirements.update(missing)
+        self._required_start = start
+
+    def _feasible_start(self, start: GearSet, candidates: Dict[str, List[Item]]) -> GearSet:
+        """A copy of `start` completed for the requirements, the fallback loadout if that fails."""
+        start = self._meet_requirements(start, candidates)
+        if not self.requirements.is_satisfied(start.all_items):
+            start = self._required_start
+        return start.model_copy(update={"rings": list(start.rings), "tools": list(start.tools)})
+
+    def _meet_requirements(self, gearset: GearSet, candidates: Dict[str, List[Item]]) -> GearSet:
+        """
+        Adds what the loadout lacks for the requirements, one item at a time: the best scoring item with a
+        missing keyword, in an empty slot or in place of an item no requirement needs. Stops when nothing fits.
+        """
+        gearset = gearset.model_copy(update={"rings": list(gearset.rings), "tools": list(gearset.tools)})
+        missing = self.requirements.missing(gearset.all_items)
+        while missing:
+            best_score, best_set = float("-inf"), None
+            for items in candidates.values():
+                for item in items:
+                    if not any(keyword in missing for keyword in item.keywords): continue
+                    for placed in self._placements(gearset, item):
+                        if not SetTracker(placed.all_items).all_satisfied(placed.all_items): continue
+                        score = self.calculate_score_for_set(placed)
+                        if score > best_score: best_score, best_set = score, placed
+            if best_set is None: break
+            gearset = best_set
+            missing = self.requirements.missing(gearset.all_items)
+        return gearset
+
+    def _placements(self, gearset: GearSet, item: Item):
+        """Copies of the loadout with `item` in an empty slot or in place of an item no requirement needs."""
+        def replaceable(other: Item) -> bool:
+            return not self.requirements.keywords_of(other)
+        if item.slot == "Ring":
+            rings = gearset.rings
+            options = [rings + [item]] if len(rings) < 2 else [rings[:i] + [item] + rings[i + 1:] for i, r in enumerate(rings) if replaceable(r)]
+            for option in options: yield gearset.model_copy(update={"rings": option, "tools": list(gearset.tools)})
+        elif item.slot == "Tool":
+            tools = gearset.tools
+            options = [tools + [item]] if len(tools) < self.tool_slots else [tools[:i] + tools[i + 1:] + [item] for i, t in enumerate(tools) if replaceable(t)]
+            for option in options:
+                if self._is_valid_tool_set(option): yield gearset.model_copy(update={"rings": list(gearset.rings), "tools": option})
+        else:
+            current = getattr(gearset, item.slot.lower())
+            if current is None or replaceable(current):
+                yield gearset.model_copy(update={item.slot.lower(): item, "rings": list(gearset.rings), "tools": list(gearset.tools)})
+
+    def _get_candidates(self) -> Dict[str, List[Item]]:
+        """Items of the bound call's slots, usable for every activity of at least one of its skills."""
+        activities = self._bound().activities
+        requirements = Requirements.for_activities(activities, self.player_level, self.player_skill_level)
+        by_skill = [[activity for activity in activities if activity.skill == skill] for skill in self.context.skills]
         slots = {}
         for item in self.all_items:
-            item_skills = item.skill.split(',') if item.skill else []
-
-            if item.skill is not None and activity.skill not in item_skills and not item.is_part_of_set: continue
-            if item.region and item.region != activity.region: continue
-            if item.underwater_only and not activity.is_underwater: continue
+            if not any(all(is_candidate(item, activity) for activity in group) for group in by_skill) or not requirements.allows(item): continue
             
             if item.slot not in slots: slots[item.slot] = []
             slots[item.slot].append(item)
@@ -233,47 +693,17 @@ class GearOptimizer:
         return cleaned_candidates
     
     def calculate_score_for_set(self, current_set: GearSet) -> float:
-        stats = current_set.get_stats(self.activity.skill)
-        steps = calculate_steps(
-            activity=self.activity,
-            player_skill_level=self.player_skill_level, 
-            player_work_efficiency=stats["work_efficiency"],
-            player_minus_steps=stats["flat_step_reduction"],
-            player_minus_steps_percent=stats["percent_step_reduction"]
-        )
-        da_mult = 1.0 + stats["double_action"]
-        dr_mult = 1.0 + stats["double_rewards"]
-        nmc_mult = 1.0 / (1.0 - min(0.99, stats["no_mats"]))
-        
-        
-        if self.optimazation_target == OPTIMAZATION_TARGET.reward_rolls:
-            return (da_mult * dr_mult) / steps
-        elif self.optimazation_target == OPTIMAZATION_TARGET.xp:
-            base_xp = self.activity.base_xp or 0
-            xp_mult = 1.0 + stats["xp_percent"]
-            flat_xp = stats["flat_xp"]
-            return ((base_xp * xp_mult + flat_xp) * da_mult) / steps
-        elif self.optimazation_target == OPTIMAZATION_TARGET.chests:
-            return ((1.0 + stats["chest_finding"]) * da_mult * dr_mult) / steps
-        elif self.optimazation_target == OPTIMAZATION_TARGET.materials:
-            return  (dr_mult * nmc_mult)
-        elif self.optimazation_target == OPTIMAZATION_TARGET.fine:
-            return ((1.0 + stats["fine_material"]) * da_mult * dr_mult) / steps
-        elif self.optimazation_target == OPTIMAZATION_TARGET.collectibles:
-            return ((1.0 + stats["collectible_percent"]) * da_mult * dr_mult) / steps
-        elif self.optimazation_target == OPTIMAZATION_TARGET.quality:
-            flat_quality_bonus = stats["quality_outcome"]
-            
-            probs = calculate_quality_probabilities(
-                activity_min_level=self.activity.skill_level or 0,
-                player_skill_level=self.player_skill_level,
-                quality_bonus=flat_quality_bonus
-            )
-            
-            return probs.get("Eternal", 0.0) * dr_mult * nmc_mult
-        else:
-            return 0.0
-    
+        return self.score_kernel().score_set(current_set)
+
+    def calculate_score_for_stats(self, stats: Dict[str, float]) -> float:
+        """Score of capped stats, e.g. from GearSet.get_stats or cap_stats(add_stats(...))."""
+        return self.score_kernel().score(stats)
+
+    def score_kernel(self) -> ScoreKernel:
+        """The objective's kernel for the bound activity and skill level, compiled once per call by bind."""
+        self._bound()
+        return self._kernel
+
     def _is_valid_tool_set(self, tools: List[Item]) -> bool:
         seen_keywords = set()
         for t in tools:
@@ -286,12 +716,8 @@ class GearOptimizer:
         return True
     
     def _check_for_set_conditions(self, check_item: Item, current_set: GearSet) -> bool:
-        set_count_goal = check_item.set_count
-        set_count_current = 0
-        for i in current_set.all_items:
-            if i.set_name == check_item.set_name and i.is_part_of_set:
-                set_count_current += 1
-        return bool(set_count_current >= set_count_goal)
+        """One-off check for a loadout without a tracker, the search itself uses SetTracker."""
+        return SetTracker(current_set.all_items).is_active(check_item)
     
     def get_all_sets(self) -> set[str]:
         sets = set()
@@ -303,91 +729,89 @@ class GearOptimizer:
     
     def preprocessing_sets(self, set_names, candidates):
         set_data = {}
-        for ind_set in set_names:
-            ind_set_data = {}
-            items_in_set = list()
+        temp_set = GearSet()
+        zero_score = self.calculate_score_for_set(temp_set)
+        for ind_set in sorted(set_names):
+            items_in_set = []
+            items_without_set_attr = []
+            items_without_set_attr_without_adv = []
             for slot,items in candidates.items():
                 for item in items:
-                    if item.set_name == ind_set:
+                    if item.set_name != ind_set: continue
+                    if item.has_set_attr:
                         items_in_set.append(item)
-            
-            #Take out items that are part of the set but without set attr
-            items_without_set_attr = []
-            for item in items_in_set[:]:
-                if not item.has_set_attr:
-                    items_in_set.remove(item)
-                    items_without_set_attr.append(item)
-            
-            #Take out items without set attributes that don't give an advantage for the activity
-            #Those might still be useful to achieve the necessary count of a set item
-            items_without_set_attr_without_adv = []
-            temp_set = GearSet()
-            zero_score = self.calculate_score_for_set(temp_set)
-            for item in items_without_set_attr[:]:
-                temp_set = GearSet()
-                slot_attr = item.slot
-                if slot_attr == "Ring":
-                    temp_set.rings = [item]
-                elif slot_attr == "Tool":
-                    temp_set.tools = [item]
-                else:
-                    setattr(temp_set, slot_attr.lower(), item)
-                temp_score = self.calculate_score_for_set(temp_set)
-                if abs(temp_score - zero_score) > 0.000001: continue
-                items_without_set_attr_without_adv.append(item)
-                items_without_set_attr.remove(item)
+                        continue
+                    #Items that are part of the set but without set attr
+                    #Those without an advantage for the activity might still be useful to achieve the necessary count of a set item
+                    if abs(self._score_single_item(item) - zero_score) > 0.000001:
+                        items_without_set_attr.append(item)
+                    else:
+                        items_without_set_attr_without_adv.append(item)
             
             #Seperate all items into set_counts
             grouped = {}
             for item in items_in_set:
-                key = item.set_count
-                if key not in grouped:
-                    grouped[key] = []
-                grouped[key].append(item)
+                grouped.setdefault(item.set_count, []).append(item)
                 
-            ind_set_data["items_without_set_attr"] = items_without_set_attr
-            ind_set_data["items_without_set_attr_without_adv"] = items_without_set_attr_without_adv
-            ind_set_data["grouped"] = grouped
-            set_data[ind_set] = ind_set_data
-        return set_data                        
+            set_data[ind_set] = {
+                "items_without_set_attr": items_without_set_attr,
+                "items_without_set_attr_without_adv": items_without_set_attr_without_adv,
+                "grouped": grouped,
+            }
+        return set_data
+
+    def _score_single_item(self, item: Item) -> float:
+        temp_set = GearSet()
+        slot_attr = item.slot
+        if slot_attr == "Ring":
+            temp_set.rings = [item]
+        elif slot_attr == "Tool":
+            temp_set.tools = [item]
+        else:
+            setattr(temp_set, slot_attr.lower(), item)
+        return self.calculate_score_for_set(temp_set)
                 
     def process_tools(self, tools, current_set):
+        """Best score of adding `tools` to the current tools, keeping as many current tools as fit."""
+        return self._place_tools(tools, current_set)[0]
+
+    def _place_tools(self, tools, current_set):
         original_tools = current_set.tools
-        count_of_non_replaced_tools = len(original_tools) - len(tools) - len(self.locked_tools)
+        count_of_kept_tools = min(len(original_tools), self.tool_slots - len(tools))
         current_max_score = float("-inf")
-        if count_of_non_replaced_tools <= 0:
-            current_set.tools = list(tools)
-            current_max_score = self.calculate_score_for_set(current_set)
-            current_set.tools = original_tools
-        else:
-            for subset_current_tools in itertools.combinations(original_tools, count_of_non_replaced_tools):
-                tools_used = list(subset_current_tools) + tools + self.locked_tools
-                if self._is_valid_tool_set(tools_used):
-                    current_set.tools = list(tools_used)
-                    score = self.calculate_score_for_set(current_set)
-                    current_set.tools = original_tools
-                    if score > current_max_score:
-                        current_max_score = score
-        return current_max_score
+        best_tools = None
+        for subset_current_tools in itertools.combinations(original_tools, count_of_kept_tools):
+            tools_used = list(subset_current_tools) + list(tools)
+            if self._is_valid_tool_set(tools_used):
+                current_set.tools = tools_used
+                score = self.calculate_score_for_set(current_set)
+                if score > current_max_score:
+                    current_max_score = score
+                    best_tools = tools_used
+        current_set.tools = original_tools
+        return current_max_score, best_tools
     
     def process_set(self, current_set, set_items: List[Item]) -> float:
-        set_can_be_equipped = True
+        return self.place_set(current_set, set_items)[0]
+
+    def place_set(self, current_set: GearSet, set_items: List[Item]):
+        """
+        Places a group of set items on a copy of `current_set`, filling the remaining ring and tool
+        slots with the best of the current rings/tools. Returns (score, gearset) or (-inf, None).
+        """
+        current_set = current_set.model_copy()
         rings = []
         tools = []
         for item in set_items:
             slot_attr = item.slot
-            if slot_attr.lower() in self.locked_slots:
-                set_can_be_equipped = False
-                break
             if slot_attr == "Tool":
                 tools.append(item)
             elif slot_attr == "Ring":
                 rings.append(item)
             else:
                 setattr(current_set, slot_attr.lower(), item)
-        if not set_can_be_equipped: return float("-inf")
-        if len(rings) > 2 - len(self.locked_rings): return float("-inf")
-        if len(tools) > self.tool_slots - len(self.locked_tools): return float("-inf")
+        if len(rings) > 2: return float("-inf"), None
+        if len(tools) > self.tool_slots: return float("-inf"), None
         old_rings = current_set.rings
         ring_candidates = []
     
@@ -407,49 +831,204 @@ class GearOptimizer:
         else:  # len(rings) == 0
             ring_candidates.append(old_rings)
     
-        scores = []
+        best_score = float("-inf")
+        best_set = None
         for rs in ring_candidates:
             current_set.rings = rs
-            scores.append(self.process_tools(tools, current_set))
+            score, best_tools = self._place_tools(tools, current_set)
+            if score > best_score:
+                best_score = score
+                best_set = current_set.model_copy(update={"rings": list(rs), "tools": best_tools})
     
-        return max(scores)
+        return best_score, best_set
     
-    def score_sets_on_empty_gear_set(self, set_names, set_data):
-        scored_sets = []
-        for ind_set in set_names:
-            items_without_set_attr = set_data[ind_set]["items_without_set_attr"]
-            items_without_set_attr_without_adv = set_data[ind_set]["items_without_set_attr_without_adv"]
-            grouped = set_data[ind_set]["grouped"]
-
-            #For each set count try out all possibilities and check if they have a better score
-            for count,items in grouped.items():
-                #Duplicate any rings
-                for item in items[:]:
-                    if item.slot == "Ring":
-                        items.append(item)
-                #Add items that don't have a set attribute but are part of the set
-                items.extend(items_without_set_attr)
-                #Remove items that have a set attribute but are not part of the set
-                items_not_part_of_set= []
-                for item in items[:]:
-                    if not item.is_part_of_set:
-                        items.remove(item)
-                        items_not_part_of_set.append(item)
-                #If the amount of set items is too low to achieve the count add items enough items that are part of the set but don't give any advantage
-                if len(items) < count:
-                    count_items_needed = count - len(items)
-                    items.extend(items_without_set_attr_without_adv[:count_items_needed])
-                if len(items) < count: continue
-                #Checking the set without any items that are not part of the set
-                for subset in itertools.combinations(items, count):
-                    score =  self.process_set(GearSet(), list(subset))
-                    scored_sets.append((score, list(subset)))
-                #Adding every combination of set item that are not part of the set and calculate the score of each
-                for i in range(1,len(items_not_part_of_set)+1):
-                    for subset_att_items in itertools.combinations(items_not_part_of_set, i):                        
-                        for subset in itertools.combinations(items, count):
-                            considered_set_items = list(subset) + list(subset_att_items)
-                            score =  self.process_set(GearSet(), list(considered_set_items))
-                            scored_sets.append((score, list(considered_set_items)))
-        
-        return scored_sets
\ No newline at end of file
+    def _slot_capacity(self, slot: str) -> int:
+        if slot == "Ring": return 2
+        if slot == "Tool": return self.tool_slots
+        return 1
+
+    def _feasible_subsets(self, items: List[Item], count: int, used_slots: Dict[str, int], start: int = 0, chosen: List[Item] = None):
+        """
+        Yields every combination of `count` items that fits into the gear slots.
+        `items` must have duplicates (rings that can be worn twice) next to each other, each distinct combination is yielded once.
+        """
+        chosen = chosen if chosen is not None else []
+        if count == 0:
+            yield list(chosen)
+            return
+        for idx in range(start, len(items) - count + 1):
+            item = items[idx]
+            if idx > start and item is items[idx - 1]: continue
+            if used_slots.get(item.slot, 0) >= self._slot_capacity(item.slot): continue
+            used_slots[item.slot] = used_slots.get(item.slot, 0) + 1
+            chosen.append(item)
+            yield from self._feasible_subsets(items, count - 1, used_slots, idx + 1, chosen)
+            chosen.pop()
+            used_slots[item.slot] -= 1
+
+    def _improving_completions(self, base: List[Item], base_score: float, extras: List[Item], used_slots: Dict[str, int], start: int = 0):
+        """
+        Yields the set completions with items that have set attributes but are not part of the set.
+        A completion is only extended further if it improved on the items it was built from, so
+        non-improving branches are cut instead of enumerating the whole power set.
+        """
+        for idx in range(start, len(extras)):
+            item = extras[idx]
+            if idx > start and item is extras[idx - 1]: continue
+            if used_slots.get(item.slot, 0) >= self._slot_capacity(item.slot): continue
+            considered_set_items = base + [item]
+            score = self.process_set(GearSet(), considered_set_items)
+            if score <= base_score: continue
+            yield score, considered_set_items
+            used_slots[item.slot] = used_slots.get(item.slot, 0) + 1
+            yield from self._improving_completions(considered_set_items, score, extras, used_slots, idx + 1)
+            used_slots[item.slot] -= 1
+
+    def score_sets_on_empty_gear_set(self, set_names, set_data, top_k: int = 15,
+                                     pool: Optional[ProcessPoolExecutor] = None, table: "CandidateTable" = None):
+        """
+        Returns the top_k (score, set items) combinations of all sets, best first.
+        Only a heap of top_k entries is kept, ties keep the enumeration order.
+        With a pool every (set, set count) group is scored by a worker, the results are pushed in the serial order.
+        """
+        heap = []
+        seq = 0
+        def push(score, set_items):
+            nonlocal seq
+            seq += 1
+            if score == float("-inf"): return
+            entry = (score, -seq, set_items)
+            if len(heap) < top_k: heapq.heappush(heap, entry)
+            elif entry > heap[0]: heapq.heapreplace(heap, entry)
+
+        #For each set count try out all possibilities and check if they have a better score
+        groups = [(ind_set, count) for ind_set in sorted(set_names) for count in set_data[ind_set]["grouped"]]
+        if pool is None:
+            for ind_set, count in groups:
+                for score, set_items in self._score_set_group(set_data[ind_set], count):
+                    push(score, set_items)
+        else:
+            for scored in pool.map(_score_set_group_job, groups):
+                for score, indexes in scored:
+                    push(score, table.decode_items(indexes))
+
+        return [(score, set_items) for score, _, set_items in sorted(heap, reverse=True)]
+
+    def _score_set_group(self, set_info: Dict, count: int):
+        """Yields (score, set items) of every combination reaching `count` pieces of one set, in enumeration order."""
+        def with_ring_duplicates(items):
+            #Rings can be worn twice, duplicates are kept next to each other
+            result = []
+            for item in items:
+                result.append(item)
+                if item.slot == "Ring": result.append(item)
+            return result
+
+        group_items = set_info["grouped"][count]
+        #Items with a set attribute that are not part of the set can only complete it
+        items = [i for i in group_items if i.is_part_of_set] + set_info["items_without_set_attr"]
+        items_not_part_of_set = with_ring_duplicates([i for i in group_items if not i.is_part_of_set])
+        #If the amount of set items is too low to achieve the count add items enough items that are part of the set but don't give any advantage
+        if len(items) < count:
+            items += set_info["items_without_set_attr_without_adv"][:count - len(items)]
+        if len(items) < count: return
+        items = with_ring_duplicates(items)
+
+        used_slots = {}
+        for subset in self._feasible_subsets(items, count, used_slots):
+            score = self.process_set(GearSet(), subset)
+            yield score, subset
+            if score == float("-inf"): continue
+            yield from self._improving_completions(subset, score, items_not_part_of_set, used_slots)
+
+
+class CandidateTable:
+    """
+    Flat, index-addressed copy of the candidates of one optimize call.
+    Worker processes get it once through the pool initializer, batches and results refer to items by index.
+    """
+    def __init__(self, candidates: Dict[str, List[Item]]):
+        self.items: List[Item] = []
+        self.slots: Dict[str, List[int]] = {}
+        for slot, items in candidates.items():
+            self.slots[slot] = list(range(len(self.items), len(self.items) + len(items)))
+            self.items.extend(items)
+        self.index = {id(item): i for i, item in enumerate(self.items)}
+
+    def encode_items(self, items) -> tuple:
+        return tuple(self.index[id(item)] for item in items)
+
+    def decode_items(self, indexes) -> List[Item]:
+        return [self.items[i] for i in indexes]
+
+    def encode_set(self, gearset: GearSet) -> tuple:
+        single = tuple(-1 if getattr(gearset, slot) is None else self.index[id(getattr(gearset, slot))] for slot in SINGLE_SLOTS)
+        return single, self.encode_items(gearset.rings), self.encode_items(gearset.tools)
+
+    def decode_set(self, encoded: tuple) -> GearSet:
+        single, rings, tools = encoded
+        gearset = GearSet(rings=self.decode_items(rings), tools=self.decode_items(tools))
+        for slot, i in zip(SINGLE_SLOTS, single):
+            if i >= 0: setattr(gearset, slot, self.items[i])
+        return gearset
+
+
+def _chunks(values: list, n: int) -> List[tuple]:
+    """Splits `values` into at most n contiguous (offset, chunk) parts."""
+    size = max(1, -(-len(values) // max(1, n)))
+    return [(start, values[start:start + size]) for start in range(0, len(values), size)]
+
+
+# --- Worker side ---
+# Each worker scores with its own optimizer over the same candidate table as the parent
+_worker_optimizer: Optional[GearOptimizer] = None
+_worker_table: Optional[CandidateTable] = None
+_worker_set_data: Optional[Dict] = None
+
+def load_worker_items(source) -> List[Item]:
+    """Items handed to a worker: a list, or (columnar path, rows) materialized from the memory-mapped catalogue."""
+    if isinstance(source, list): return source
+    from columnar import ColumnarCatalogue
+    path, rows = source
+    return ColumnarCatalogue.open(path).items.get_many(rows)
+
+def _init_worker(source, slots: Dict[str, List[int]], context: OptimizeContext, requirements: Requirements):
+    global _worker_optimizer, _worker_table, _worker_set_data
+    items = load_worker_items(source)
+    _worker_table = CandidateTable({slot: [items[i] for i in indexes] for slot, indexes in slots.items()})
+    _worker_optimizer = GearOptimizer(items).with_context(context)
+    _worker_optimizer.requirements = requirements
+    _worker_set_data = None
+
+def _best_tool_subset_job(rest: tuple, old_tools: tuple, subsets: List[tuple]):
+    current_set = _worker_table.decode_set(rest)
+    tracker = SetTracker(current_set.all_items)
+    subsets = [tuple(_worker_table.decode_items(s)) for s in subsets]
+    return _worker_optimizer._best_tool_subset(current_set, subsets, tracker, _worker_table.decode_items(old_tools))
+
+def _set_placements_job(current: tuple, top_sets: List[tuple]) -> List[float]:
+    current_set = _worker_table.decode_set(current)
+    scores = []
+    for indexes in top_sets:
+        score, group_set = _worker_optimizer.place_set(current_set, _worker_table.decode_items(indexes))
+        if (group_set is None or not SetTracker(group_set.all_items).all_satisfied(group_set.all_items)
+                or not _worker_optimizer.requirements.is_satisfied(group_set.all_items)):
+            score = float("-inf")
+        scores.append(score)
+    return scores
+
+def _local_search_job(job: tuple) -> tuple:
+    start, slot_order, top_sets = job
+    candidates = {slot: [_worker_table.items[i] for i in indexes] for slot, indexes in _worker_table.slots.items()}
+    result = _worker_optimizer._optimize(candidates, start=_worker_table.decode_set(start), slot_order=slot_order,
+                                         top_sets=[_worker_table.decode_items(indexes) for indexes in top_sets])
+    return _worker_table.encode_set(result.gearset), result.score, result.iterations, result.reason.name
+
+def _score_set_group_job(group: tuple) -> List[tuple]:
+    global _worker_set_data
+    ind_set, count = group
+    if _worker_set_data is None:
+        candidates = {slot: [_worker_table.items[i] for i in indexes] for slot, indexes in _worker_table.slots.items()}
+        _worker_set_data = _worker_optimizer.preprocessing_sets(_worker_optimizer.get_all_sets(), candidates)
+    return [(score, _worker_table.encode_items(set_items))
+            for score, set_items in _worker_optimizer._score_set_group(_worker_set_data[ind_set], count)]
@@ -0,0 +1,263 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from models import Item, Activity, GearSet
+from utils import get_owned_item_names, inventory_fingerprint, calculate_level_from_xp, calculate_char_level_from_steps
+from gear_optimizer_q import OPTIMAZATION_TARGET, SINGLE_SLOTS, is_candidate
+from optimizers import make_optimizer
+if TYPE_CHECKING:
+    from columnar import ColumnarCatalogue
+    from result_store import ResultStore
+
+
+class Profile(BaseModel):
+    """One player: levels and owned items. `owned` holds export names, None means every item."""
+    name: str
+    level: int = 99
+    skill_levels: Dict[str, int] = Field(default_factory=dict)  # lowercase skill -> level
+    default_skill_level: int = 99
+    owned: Optional[List[str]] = None
+
+    @classmethod
+    def from_user_export(cls, data: dict, name: Optional[str] = None):
+        """A WalkScape user export (the app's settings JSON). An empty export means all items at level 99, like main.py."""
+        if not data:
+            return cls(name=name or "Player")
+        skills = data.get("skills")
+        return cls(
+            name=name or data.get("name", "Player"),
+            level=calculate_char_level_from_steps(data["steps"]) if "steps" in data else 99,
+            skill_levels={skill.lower(): calculate_level_from_xp(xp) for skill, xp in (skills or {}).items()},
+            # Same as the app: a skill missing from an export with skills has 0 xp
+            default_skill_level=calculate_level_from_xp(0) if skills is not None else 99,
+            owned=sorted(get_owned_item_names(data)),
+        )
+
+    def skill_level(self, activity: Activity) -> int:
+        if not activity.skill: return self.default_skill_level
+        return self.skill_levels.get(activity.skill.lower(), self.default_skill_level)
+
+
+class PlayerResult(BaseModel):
+    player: str
+    activity: str
+    target: OPTIMAZATION_TARGET
+    level: int
+    skill_level: int
+    gearset: GearSet
+    score: float
+    inventory: str                   # inventory fingerprint
+    reused_from: Optional[str] = None  # fingerprint of the larger inventory whose result was reused
+
+
+class GuildReport(BaseModel):
+    results: List[PlayerResult]
+    unique_inventories: int
+    unique_jobs: int
+    computed_jobs: int
+    reused_jobs: int
+    stored_jobs: int = 0  # found in the result store
+    seconds: float
+
+
+JobKey = Tuple[str, str, str, int, int]  # (inventory fingerprint, activity, target name, level, skill level)
+
+
+class _Inventory:
+    def __init__(self, items: List[Item]):
+        self.items = items
+        self.fingerprint = inventory_fingerprint(items)
+        self.keys: FrozenSet[Tuple[str, Optional[str]]] = frozenset((i.name, i.skill) for i in items)
+
+
+class GuildBatch:
+    """
+    Optimizes many profiles at once. Profiles are grouped by inventory fingerprint, and every unique
+    (inventory, activity, target, level, skill level) is optimized once and fanned back out to its players.
+    A job whose inventory is contained in a larger one with the same query reuses that job's loadout
+    when it only uses items the smaller inventory has: it is then feasible for the smaller inventory
+    and no search over fewer items can beat it (exact with the DP optimizer, which runs without a state cap
+    here, the local optimum with q).
+    """
+    def __init__(self, items: List[Item], activities: List[Activity], workers: int = 1, optimizer: str = "q",
+                 reuse_nested: bool = True, columnar: Optional["ColumnarCatalogue"] = None,
+                 store: Optional["ResultStore"] = None, catalogue_version: Optional[str] = None):
+        self.items = items
+        self.activities = {a.activity: a for a in activities}
+        self.workers = workers
+        self.optimizer = optimizer
+        self.reuse_nested = reuse_nested
+        self.columnar = columnar
+        # Jobs are looked up in the store first and what is computed is written back, needs the catalogue version
+        self.store = store if catalogue_version is not None else None
+        self.catalogue_version = catalogue_version
+        self._item_index = {id(item): i for i, item in enumerate(items)}
+        self._inventories: Dict[Optional[FrozenSet[str]], _Inventory] = {}
+
+    def inventory(self, profile: Profile) -> _Inventory:
+        """The profile's owned items, filtered once per distinct set of owned names."""
+        owned = frozenset(profile.owned) if profile.owned is not None else None
+        inventory = self._inventories.get(owned)
+        if inventory is None:
+            items = self.items if owned is None else [i for i in self.items if i.export_name in owned]
+            inventory = self._inventories[owned] = _Inventory(items)
+        return inventory
+
+    def run(self, profiles: List[Profile], activity_names: List[str],
+            targets: List[OPTIMAZATION_TARGET] = (OPTIMAZATION_TARGET.reward_rolls,)) -> GuildReport:
+        start = time.perf_counter()
+        for name in activity_names:
+            if name not in self.activities: raise ValueError(f"Unknown activity or recipe '{name}'")
+
+        # Unique jobs and the players waiting for each
+        jobs: Dict[JobKey, _Inventory] = {}
+        players: List[Tuple[Profile, JobKey]] = []
+        for profile in profiles:
+            inventory = self.inventory(profile)
+            for name in activity_names:
+                activity = self.activities[name]
+                for target in targets:
+                    key = (inventory.fingerprint, name, target.name, profile.level, profile.skill_level(activity))
+                    jobs[key] = inventory
+                    players.append((profile, key))
+
+        results, reused_from, stored = self._solve(jobs)
+
+        report = [
+            PlayerResult(player=profile.name, activity=key[1], target=OPTIMAZATION_TARGET[key[2]], level=key[3],
+                         skill_level=key[4], gearset=results[key][0], score=results[key][1], inventory=key[0],
+                         reused_from=reused_from.get(key))
+            for profile, key in players
+        ]
+        return GuildReport(
+            results=report,
+            unique_inventories=len({inventory.fingerprint for inventory in jobs.values()}),
+            unique_jobs=len(jobs),
+            computed_jobs=len(jobs) - len(reused_from) - len(stored),
+            reused_jobs=len(reused_from),
+            stored_jobs=len(stored),
+            seconds=time.perf_counter() - start,
+        )
+
+    def _solve(self, jobs: Dict[JobKey, _Inventory]):
+        """Solves in waves, largest inventories first: a job waits while a strictly larger inventory with the same query is unsolved."""
+        results: Dict[JobKey, Tuple[GearSet, float]] = {}
+        reused_from: Dict[JobKey, str] = {}
+        by_query: Dict[tuple, List[JobKey]] = {}
+        for key in jobs:
+            by_query.setdefault(key[1:], []).append(key)
+
+        stored = self._load_stored(jobs)
+        results.update(stored)
+        pending = set(jobs) - set(stored)
+        while pending:
+            unsolved = set(pending)
+            wave = []
+            for key in sorted(unsolved, key=lambda k: -len(jobs[k].items)):
+                supersets = [other for other in by_query[key[1:]] if other != key and jobs[key].keys < jobs[other].keys]
+                if self.reuse_nested and any(other in unsolved for other in supersets):
+                    continue
+                reusable = self._reusable(jobs[key], [other for other in supersets if other in results], results)
+                if reusable is not None:
+                    results[key] = results[reusable]
+                    reused_from[key] = reusable[0]
+                else:
+                    wave.append(key)
+                pending.discard(key)
+            computed = self._compute(wave, jobs)
+            results.update(computed)
+            self._store(computed)
+        self._store({key: results[key] for key in reused_from})
+        return results, reused_from, stored
+
+    def _store_key(self, key: JobKey):
+        from result_store import StoreKey
+        fingerprint, activity, target, level, skill_level = key
+        return StoreKey(catalogue_version=self.catalogue_version, activity=activity, target=target, level=level,
+                        skill_level=skill_level, inventory=fingerprint, optimizer=self.optimizer)
+
+    def _load_stored(self, jobs: Dict[JobKey, _Inventory]) -> Dict[JobKey, Tuple[GearSet, float]]:
+        if self.store is None: return {}
+        items_by_key = {(i.name, i.skill): i for i in self.items}
+        stored = {}
+        for key in jobs:
+            result = self.store.get(self._store_key(key), items_by_key)
+            if result is not None: stored[key] = (result.gearset, result.score)
+        return stored
+
+    def _store(self, results: Dict[JobKey, Tuple[GearSet, float]]):
+        if self.store is None or not results: return
+        from result_store import stored_result
+        self.store.put_many(stored_result(self._store_key(key), gearset, self.activities[key[1]], score)
+                            for key, (gearset, score) in results.items())
+
+    def _reusable(self, inventory: _Inventory, solved_supersets: List[JobKey], results) -> Optional[JobKey]:
+        if not self.reuse_nested: return None
+        for other in solved_supersets:
+            if all((i.name, i.skill) in inventory.keys for i in results[other][0].all_items):
+                return other
+        return None
+
+    def _candidate_items(self, key: JobKey, inventory: _Inventory) -> List[Item]:
+        activity = self.activities[key[1]]
+        return [item for item in inventory.items if is_candidate(item, activity)]
+
+    def _compute(self, wave: List[JobKey], jobs: Dict[JobKey, _Inventory]) -> Dict[JobKey, Tuple[GearSet, float]]:
+        if not wave: return {}
+        if self.workers <= 1 or len(wave) == 1:
+            return {key: optimize_job(self._candidate_items(key, jobs[key]), self.activities[key[1]], key, self.optimizer) for key in wave}
+
+        # Workers get the catalogue once (mapped if columnar), jobs only pass row numbers of their candidates
+        rows = {key: self._rows(self._candidate_items(key, jobs[key])) for key in wave}
+        if self.columnar is not None and all(r is not None for r in rows.values()):
+            initargs = ([], self.columnar.path)
+        else:
+            initargs = (self.items, None)
+            rows = {key: [self._item_index[id(item)] for item in self._candidate_items(key, jobs[key])] for key in wave}
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(wave)), initializer=_init_worker, initargs=initargs) as pool:
+            futures = {key: pool.submit(_optimize_job, rows[key], self.activities[key[1]], key, self.optimizer) for key in wave}
+            by_key = {(i.name, i.skill): i for i in self.items}
+            results = {}
+            for key, future in futures.items():
+                gearset, score = future.result()
+                results[key] = (_relink(gearset, by_key), score)
+            return results
+
+    def _rows(self, items: List[Item]) -> Optional[List[int]]:
+        if self.columnar is None: return None
+        return self.columnar.item_rows(items)
+
+
+def optimize_job(items: List[Item], activity: Activity, key: JobKey, optimizer_name: str = "q") -> Tuple[GearSet, float]:
+    _, _, target, level, skill_level = key
+    optimizer, targets = make_optimizer(optimizer_name, items)
+    result = optimizer.optimize_with_info(activity, player_level=level, player_skill_level=skill_level, optimazation_target=targets[target])
+    return result.gearset, result.score
+
+def _relink(gearset: GearSet, by_key: Dict[Tuple[str, Optional[str]], Item]) -> GearSet:
+    """Swaps the worker's copies in a result for the parent's item objects."""
+    relinked = gearset.model_copy(update={
+        "rings": [by_key[(i.name, i.skill)] for i in gearset.rings],
+        "tools": [by_key[(i.name, i.skill)] for i in gearset.tools],
+    })
+    for slot in SINGLE_SLOTS:
+        item = getattr(gearset, slot)
+        if item is not None: setattr(relinked, slot, by_key[(item.name, item.skill)])
+    return relinked
+
+
+# --- Worker side ---
+_worker_items: List[Item] = []
+_worker_columnar: Optional["ColumnarCatalogue"] = None
+
+def _init_worker(items: List[Item], columnar_path: Optional[str]):
+    global _worker_items, _worker_columnar
+    _worker_items = items
+    if columnar_path:
+        from columnar import ColumnarCatalogue
+        _worker_columnar = ColumnarCatalogue.open(columnar_path)
+
+def _optimize_job(rows: List[int], activity: Activity, key: JobKey, optimizer_name: str) -> Tuple[GearSet, float]:
+    items = _worker_columnar.items.get_many(rows) if _worker_columnar is not None else [_worker_items[i] for i in rows]
+    return optimize_job(items, activity, key, optimizer_name)
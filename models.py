@@ -1,6 +1,40 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 from pydantic import BaseModel, Field
 
+# get_stats key -> Item field summed into it
+STAT_FIELDS = {
+    "work_efficiency": "work_eff_percent", "xp_percent": "xp_percent", "flat_xp": "plus_xp",
+    "chest_finding": "chest_percent", "double_action": "double_action", "double_rewards": "double_rewards",
+    "no_mats": "no_mats_consumed_percent", "fine_material": "fine_mat_percent", "collectible_percent": "collectible_percent",
+    "flat_step_reduction": "minus_steps", "percent_step_reduction": "minus_steps_percent",
+    "quality_outcome": "quality_outcome", "gem_finding": "find_gems_percent",
+    "bird_nest_finding": "bird_nest_percent", "coin_pouch_finding": "find_coin_pouch_percent",
+}
+
+CAPPED_STATS = ("double_action", "double_rewards")
+
+def skill_stat(skill: Optional[str], stat: str) -> str:
+    """Key of a stat in the stats of several skills (get_stats with a list of skills), e.g. 'Mining:work_efficiency'."""
+    return f"{skill}:{stat}"
+
+def stat_name(key: str) -> str:
+    """The stat of a get_stats key, without the skill of skill_stat."""
+    return key.rpartition(":")[2]
+
+def cap_stats(stats: dict) -> dict:
+    """Caps applied to summed gear stats, the chance of doubling can't exceed 100%. Stats of several skills are capped per skill."""
+    keys = CAPPED_STATS if "double_action" in stats else [key for key in stats if key.endswith(CAPPED_STATS)]
+    for key in keys: stats[key] = min(1.0, stats[key])
+    return stats
+
+def add_stats(*stats_dicts: dict) -> dict:
+    """Sums uncapped stat dicts key by key."""
+    total = dict(stats_dicts[0])
+    for stats in stats_dicts[1:]:
+        for k, v in stats.items():
+            total[k] += v
+    return total
+
 def deduce_max_efficiency(base_steps: int, min_steps: int) -> float:
     if min_steps <= 0: return 0.0
     return (base_steps / min_steps) - 1.0
@@ -118,6 +152,10 @@ class Item(BaseModel):
             is_part_of_set = is_part_of_set_bool
         )
 
+    def get_stats(self, activity_skill: Union[str, List[str]]):
+        """Uncapped stats this item alone adds to a gearset for the given skill (or skills, see GearSet.get_stats)."""
+        return GearSet(tools=[self]).get_stats(activity_skill, capped=False)
+
 class Activity(BaseModel):
     activity: str
     locations: List[str] = Field(default_factory=list)
@@ -131,7 +169,20 @@ class Activity(BaseModel):
     max_work_efficiency: Optional[float] = None
     base_steps: Optional[int] = None
     min_steps: Optional[int] = None
-
+    is_recipe: bool = False
+    coin_per_reward_roll: Optional[float] = None
+    coin_per_chest_roll: Optional[float] = None
+    has_bird_nests: bool = False
+    has_gem_table: bool = False
+    has_gem_bag: bool = False
+    base_tokens_per_action: Optional[float] = None
+    collectible: Optional[str] = None
+    # Sheet columns computed by Arky's sheet for its reference loadout ("Current Steps" per action)
+    reference_steps: Optional[int] = None
+    steps_per_chest: Optional[float] = None
+    steps_per_collectible: Optional[float] = None
+    steps_per_gem: Optional[float] = None
+    steps_per_token: Optional[float] = None
 
     @classmethod
     def from_activity_csv_row(cls, row: dict):
@@ -140,6 +191,7 @@ class Activity(BaseModel):
             if not v or v == '-': return None
             if type_func == bool: return v.upper() == 'TRUE'
             if type_func == list: return [s.strip() for s in v.split(',')]
+            if type_func in (int, float): v = v.replace(',', '') # Thousands separators e.g. "133,500"
             return type_func(v.replace('%', ''))
 
         return cls(
@@ -155,6 +207,18 @@ class Activity(BaseModel):
             base_steps=_val('Base Steps', int),
             min_steps=_val('"Min" Steps', int),
             max_work_efficiency=deduce_max_efficiency(base_steps=_val('Base Steps', int) or 0, min_steps=_val('"Min" Steps', int) or 0),
+            coin_per_reward_roll=_val('Coin per Reward Roll', float),
+            coin_per_chest_roll=_val('Coin per Chest Roll', float),
+            has_bird_nests=_val('Has Bird Nests', bool) or False,
+            has_gem_table=_val('Has Gem Table', bool) or False,
+            has_gem_bag=_val('Has Gem Bag', bool) or False,
+            base_tokens_per_action=_val('Base Tokens/ Action', float),
+            collectible=_val('Collectible'),
+            reference_steps=_val('Current Steps', int),
+            steps_per_chest=_val('Steps/Chest (each skill)', float),
+            steps_per_collectible=_val('Steps/ Collectible', float),
+            steps_per_gem=_val('Steps/ Gem', float),
+            steps_per_token=_val('Steps/ Token', float),
         )
     @classmethod
     def from_recipe_csv_row(cls, row: dict):
@@ -163,6 +227,7 @@ class Activity(BaseModel):
             if not v or v == '-': return None
             if type_func == bool: return v.upper() == 'TRUE'
             if type_func == list: return [s.strip() for s in v.split(',')]
+            if type_func in (int, float): v = v.replace(',', '') # Thousands separators e.g. "133,500"
             return type_func(v.replace('%', ''))
         return cls(
             activity=row['Recipe'],
@@ -180,6 +245,9 @@ class Activity(BaseModel):
                 base_steps=_val('Base Steps', int) or 0, 
                 min_steps=_val('"Min" Steps', int) or 0
             ),
+            is_recipe=True,
+            reference_steps=_val('Current Steps', int),
+            steps_per_chest=_val('Steps/Chest', float),
         )
         
 
@@ -204,13 +272,21 @@ class GearSet(BaseModel):
         single = [self.head, self.chest, self.legs, self.feet, self.cape, self.back, self.neck, self.hands, self.primary, self.secondary, self.pet, self.consumable]
         return [i for i in single if i] + self.rings + self.tools
 
-    def get_stats(self, activity_skill: str):
+    def get_stats(self, activity_skill: Union[str, List[str]], capped: bool = True):
+        """
+        Summed stats of the items that apply to the skill. With a list of several skills (a route across skills),
+        every skill's stats are summed on their own, under skill_stat keys.
+        """
+        if isinstance(activity_skill, list):
+            if len(activity_skill) == 1: return self.get_stats(activity_skill[0], capped)
+            return {skill_stat(skill, key): value for skill in activity_skill for key, value in self.get_stats(skill, capped).items()}
         stats = {
             "work_efficiency": 0.0, "xp_percent": 0.0, "flat_xp": 0.0,
             "chest_finding": 0.0, "double_action": 0.0, "double_rewards": 0.0,
             "no_mats": 0.0, "fine_material": 0.0, "collectible_percent": 0.0,
             "flat_step_reduction": 0, "percent_step_reduction": 0.0,
-            "quality_outcome": 0.0
+            "quality_outcome": 0.0, "gem_finding": 0.0,
+            "bird_nest_finding": 0.0, "coin_pouch_finding": 0.0
         }
         for item in self.all_items:
             item_skills = item.skill.split(',') if item.skill else []
@@ -228,7 +304,9 @@ class GearSet(BaseModel):
                 if item.minus_steps: stats["flat_step_reduction"] += item.minus_steps
                 if item.minus_steps_percent: stats["percent_step_reduction"] += item.minus_steps_percent
                 if item.quality_outcome: stats["quality_outcome"] += item.quality_outcome
+                if item.find_gems_percent: stats["gem_finding"] += item.find_gems_percent
+                if item.bird_nest_percent: stats["bird_nest_finding"] += item.bird_nest_percent
+                if item.find_coin_pouch_percent: stats["coin_pouch_finding"] += item.find_coin_pouch_percent
         
-        stats["double_action"] = min(1.0, stats["double_action"])
-        stats["double_rewards"] = min(1.0, stats["double_rewards"])
+        if capped: cap_stats(stats)
         return stats
\ No newline at end of file
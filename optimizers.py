@@ -0,0 +1,30 @@
+"""
+The one factory of optimizers by name, used by the CLI, the benchmark, the guild batch and the precompute.
+Only the standard library is imported up front, each optimizer's module is imported when it is made.
+"""
+from typing import List, Optional
+
+OPTIMIZERS = ["q", "dp", "lns", "legacy"]
+
+
+def make_optimizer(name: str, items: List, workers: int = 1, iterations: int = 2000, time_limit: Optional[float] = None,
+                   seed: int = 0, max_states: Optional[int] = None):
+    """
+    (optimizer, its target enum) for q, dp, lns, legacy or oracle (benchmark.ExhaustiveOptimizer).
+    `workers` only applies to q, `iterations`, `time_limit` and `seed` only to lns, `max_states` (a beam, None is exact) only to dp.
+    """
+    if name == "legacy":
+        from gear_optimizer import GearOptimizer as LegacyGearOptimizer, OPTIMAZATION_TARGET as LEGACY_TARGET
+        return LegacyGearOptimizer(items), LEGACY_TARGET
+    from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET
+    if name == "q": return GearOptimizer(items, workers=workers), OPTIMAZATION_TARGET
+    if name == "dp":
+        from gear_optimizer_dp import DPGearOptimizer
+        return DPGearOptimizer(items, max_states=max_states), OPTIMAZATION_TARGET
+    if name == "lns":
+        from gear_optimizer_lns import LNSGearOptimizer
+        return LNSGearOptimizer(items, iterations=iterations, time_limit=time_limit, seed=seed), OPTIMAZATION_TARGET
+    if name == "oracle":
+        from benchmark import ExhaustiveOptimizer
+        return ExhaustiveOptimizer(items), OPTIMAZATION_TARGET
+    raise ValueError(f"Unknown optimizer '{name}'")
@@ -0,0 +1,152 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from models import Item, Activity, GearSet
+from utils import inventory_fingerprint
+from catalogue import Catalogue, CatalogueSnapshot
+from result_store import ResultStore, StoreKey, StoredResult, stored_result
+
+DEFAULT_LEVEL = 99  # The default profile: every item, character and skill level 99
+
+
+class PrecomputeStatus(BaseModel):
+    catalogue_version: str
+    total: int
+    done: int
+    failed: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.done + self.failed >= self.total
+
+
+class Precomputer:
+    """
+    Optimizes every activity x target for the default profile (all items, level 99) in a background process
+    pool, so those queries are answered without running an optimizer. Results already in the result store are
+    taken from there, new ones are written to it, so a restart (or the CLI) doesn't compute them again.
+    Jobs are submitted a few at a time and the store is checked right before each, so a result computed on
+    demand in the meantime isn't computed twice. A catalogue reload cancels what is left and starts over for
+    the new version. It runs the q optimizer by default, which (unlike legacy) only returns loadouts that meet
+    the activity's requirements.
+    """
+    def __init__(self, catalogue: Catalogue, store: Optional[ResultStore] = None, workers: Optional[int] = None,
+                 optimizer: str = "q"):
+        self.catalogue = catalogue
+        self.store = store
+        # One core is left to the server itself
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 1) - 1)
+        self.optimizer = optimizer
+        self._targets = _target_names(optimizer)
+        self._results: Dict[Tuple[str, str], StoredResult] = {}
+        self._status = PrecomputeStatus(catalogue_version=catalogue.version, total=len(catalogue.activities) * len(self._targets), done=0)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        catalogue.on_change(lambda change: self._wake.set())
+
+    def start(self):
+        """Starts the daemon thread that feeds the pool."""
+        if self._thread is not None and self._thread.is_alive(): return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self, catalogue_version: str, activity: str, target: str) -> Optional[StoredResult]:
+        """The precomputed result, None if it isn't ready yet or was computed for another catalogue version."""
+        with self._lock:
+            if catalogue_version != self._status.catalogue_version: return None
+            return self._results.get((activity, target))
+
+    def status(self) -> PrecomputeStatus:
+        with self._lock:
+            return self._status.model_copy()
+
+    def store_key(self, catalogue_version: str, fingerprint: str, activity: str, target: str) -> StoreKey:
+        """The key of a default profile result, the same the app uses for an on-demand run."""
+        return StoreKey(catalogue_version=catalogue_version, activity=activity, target=target, level=DEFAULT_LEVEL,
+                        skill_level=DEFAULT_LEVEL, inventory=fingerprint, optimizer=self.optimizer)
+
+    # --- Background thread ---
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            self._precompute(self.catalogue.snapshot())
+            # Sleeps until the catalogue changes (or stop), then starts over for the new version
+            if not self._wake.is_set(): self._wake.wait()
+
+    def _precompute(self, snapshot: CatalogueSnapshot):
+        jobs = [(activity, target) for activity in snapshot.activities for target in self._targets]
+        with self._lock:
+            self._results = {}
+            self._status = PrecomputeStatus(catalogue_version=snapshot.version, total=len(jobs), done=0)
+        fingerprint = inventory_fingerprint(snapshot.items)
+        pending: Dict[Future, Tuple[Activity, str]] = {}
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(snapshot.items,)) as pool:
+            queue = iter(jobs)
+            while True:
+                # A new catalogue version or stop: drop what is left
+                if self._wake.is_set():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return
+                # Keeps every worker busy plus one job each in the queue
+                while len(pending) < 2 * self.workers:
+                    job = next(queue, None)
+                    if job is None: break
+                    activity, target = job
+                    key = self.store_key(snapshot.version, fingerprint, activity.activity, target)
+                    stored = self.store.get(key, snapshot.items_by_key) if self.store is not None else None
+                    if stored is not None: self._finish(activity, target, stored)
+                    else: pending[pool.submit(_precompute_job, activity, target, self.optimizer)] = job
+                if not pending: return
+                done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    activity, target = pending.pop(future)
+                    try:
+                        gearset, score = future.result()
+                    except Exception:
+                        with self._lock: self._status.failed += 1
+                        continue
+                    result = stored_result(self.store_key(snapshot.version, fingerprint, activity.activity, target), gearset, activity, score)
+                    if self.store is not None: self.store.put(result)
+                    self._finish(activity, target, result)
+
+    def _finish(self, activity: Activity, target: str, result: StoredResult):
+        with self._lock:
+            self._results[(activity.activity, target)] = result
+            self._status.done += 1
+
+
+def _target_names(optimizer: str) -> List[str]:
+    if optimizer == "legacy":
+        from gear_optimizer import OPTIMAZATION_TARGET
+    else:
+        from gear_optimizer_q import OPTIMAZATION_TARGET
+    return [target.name for target in OPTIMAZATION_TARGET]
+
+
+# --- Worker side ---
+_worker_items: List[Item] = []
+
+def _init_worker(items: List[Item]):
+    global _worker_items
+    _worker_items = items
+
+def _precompute_job(activity: Activity, target: str, optimizer_name: str) -> Tuple[GearSet, Optional[float]]:
+    from optimizers import make_optimizer
+    optimizer, targets = make_optimizer(optimizer_name, _worker_items)
+    # The legacy optimizer has no score of its own, like in the app
+    if optimizer_name == "legacy":
+        return optimizer.optimize(activity, player_level=DEFAULT_LEVEL, player_skill_level=DEFAULT_LEVEL, optimazation_target=targets[target]), None
+    result = optimizer.optimize_with_info(activity, player_level=DEFAULT_LEVEL, player_skill_level=DEFAULT_LEVEL, optimazation_target=targets[target])
+    return result.gearset, result.score
@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+from models import Item, Activity, GearSet
+from gear_optimizer_q import SINGLE_SLOTS, is_candidate
+
+
+ItemKey = Tuple[str, Optional[str]]  # (Item, Skill) identifies an item row
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    catalogue_version TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    target TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    skill_level INTEGER NOT NULL,
+    inventory TEXT NOT NULL,
+    optimizer TEXT NOT NULL,
+    loadout TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    export TEXT NOT NULL,
+    score REAL,
+    created REAL NOT NULL,
+    PRIMARY KEY (catalogue_version, activity, target, level, skill_level, inventory, optimizer)
+)
+"""
+
+
+class StoreKey(BaseModel):
+    catalogue_version: str
+    activity: str
+    target: str
+    level: int
+    skill_level: int
+    inventory: str  # utils.inventory_fingerprint of the items the optimizer got
+    optimizer: str = "q"
+
+    def row(self) -> tuple:
+        return (self.catalogue_version, self.activity, self.target, self.level, self.skill_level, self.inventory, self.optimizer)
+
+
+class StoredResult(BaseModel):
+    key: StoreKey
+    gearset: GearSet
+    stats: Dict[str, float]
+    export: str
+    score: Optional[float] = None
+
+
+def _encode_loadout(gearset: GearSet) -> str:
+    """Item keys per slot, the items themselves come from the catalogue on load."""
+    loadout = {slot: [item.name, item.skill] for slot in SINGLE_SLOTS if (item := getattr(gearset, slot)) is not None}
+    loadout["rings"] = [[i.name, i.skill] for i in gearset.rings]
+    loadout["tools"] = [[i.name, i.skill] for i in gearset.tools]
+    return json.dumps(loadout)
+
+def _decode_loadout(loadout: str, items_by_key: Dict[ItemKey, Item]) -> Optional[GearSet]:
+    """None if an item of the loadout is no longer in the catalogue."""
+    data = json.loads(loadout)
+    try:
+        gearset = GearSet(
+            rings=[items_by_key[(name, skill)] for name, skill in data.pop("rings")],
+            tools=[items_by_key[(name, skill)] for name, skill in data.pop("tools")],
+        )
+        for slot, (name, skill) in data.items():
+            setattr(gearset, slot, items_by_key[(name, skill)])
+    except KeyError:
+        return None
+    return gearset
+
+
+class ResultStore:
+    """
+    Optimization results on disk (SQLite), shared by every process and session on the machine.
+    Rows are keyed by catalogue version, activity, target, levels, inventory fingerprint and optimizer,
+    and hold the loadout (as item keys), its stats, its export string and its score.
+    """
+    def __init__(self, path: str = os.path.join(".cache", "results.sqlite")):
+        self.path = path
+        if path != ":memory:": os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:": self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, key: StoreKey, items_by_key: Dict[ItemKey, Item]) -> Optional[StoredResult]:
+        """`items_by_key` resolves the stored item keys, e.g. CatalogueSnapshot.items_by_key."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT loadout, stats, export, score FROM results WHERE catalogue_version=? AND activity=? AND target=? "
+                "AND level=? AND skill_level=? AND inventory=? AND optimizer=?", key.row()).fetchone()
+        if row is None: return None
+        gearset = _decode_loadout(row[0], items_by_key)
+        if gearset is None: return None
+        return StoredResult(key=key, gearset=gearset, stats=json.loads(row[1]), export=row[2], score=row[3])
+
+    def put(self, result: StoredResult):
+        self.put_many([result])
+
+    def put_many(self, results: Iterable[StoredResult]) -> int:
+        """Bulk prefill, e.g. from a batch sweep, in one transaction. Returns the number of rows written."""
+        now = time.time()
+        rows = [result.key.row() + (_encode_loadout(result.gearset), json.dumps(result.stats), result.export, result.score, now)
+                for result in results]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        return len(rows)
+
+    # --- Invalidation ---
+    def prune(self, keep_version: str) -> int:
+        """Deletes the rows of every other catalogue version. Returns the number of rows deleted."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM results WHERE catalogue_version != ?", (keep_version,)).rowcount
+
+    def migrate(self, change, activities_by_name: Dict[str, Activity]) -> Tuple[int, int]:
+        """
+        Carries the rows of a catalogue.CatalogueChange's previous version over to the new one, except
+        those the change can affect: their activity changed or is gone, or a changed item is a candidate for it.
+        Returns (rows kept, rows deleted).
+        """
+        if change.previous_version is None or change.previous_version == change.version: return (0, 0)
+        touched_activities = change.touched_activities
+        touched_items = change.old_items + change.new_items
+        with self._lock, self._conn:
+            names = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT activity FROM results WHERE catalogue_version=?", (change.previous_version,))]
+            affected = [name for name in names
+                        if name in touched_activities or name not in activities_by_name
+                        or any(is_candidate(item, activities_by_name[name]) for item in touched_items)]
+            deleted = 0
+            for name in affected:
+                deleted += self._conn.execute("DELETE FROM results WHERE catalogue_version=? AND activity=?",
+                                              (change.previous_version, name)).rowcount
+            kept = self._conn.execute("UPDATE OR REPLACE results SET catalogue_version=? WHERE catalogue_version=?",
+                                      (change.version, change.previous_version)).rowcount
+        return kept, deleted
+
+    def attach(self, catalogue):
+        """Migrates the store on every reload of a catalogue.Catalogue."""
+        catalogue.on_change(lambda change: self.migrate(change, catalogue.snapshot().activities_by_name))
+
+
+def stored_result(key: StoreKey, gearset: GearSet, activity: Activity, score: Optional[float] = None) -> StoredResult:
+    from export import export_gearset
+    return StoredResult(key=key, gearset=gearset, stats=gearset.get_stats(activity.skill), export=export_gearset(gearset), score=score)
+
+def optimize_with_store(store: Optional[ResultStore], key: StoreKey, items_by_key: Dict[ItemKey, Item], activity: Activity,
+                        optimize: Callable[[], Tuple[GearSet, Optional[float]]]) -> Tuple[StoredResult, bool]:
+    """The stored result for `key`, or runs `optimize` and stores what it returns. The flag is True on a hit."""
+    if store is not None:
+        result = store.get(key, items_by_key)
+        if result is not None: return result, True
+    gearset, score = optimize()
+    result = stored_result(key, gearset, activity, score)
+    if store is not None: store.put(result)
+    return result, False
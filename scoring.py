@@ -0,0 +1,248 @@
+import math
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from pydantic import BaseModel, field_validator
+from models import Activity, CAPPED_STATS, GearSet, Item, STAT_FIELDS, skill_stat, stat_name
+from utils import calculate_quality_probabilities
+
+OPTIMAZATION_TARGET = Enum("OPTIMAZATION_TARGET", ["reward_rolls", "xp", "chests", "materials", "fine", "collectibles", "quality",
+                                                   "gems", "bird_nests", "coin_pouches"])
+
+# get_stats keys each target's score depends on, items without any of them can't change the score
+STEP_STATS = {"work_efficiency", "flat_step_reduction", "percent_step_reduction"}
+TARGET_STATS = {
+    OPTIMAZATION_TARGET.reward_rolls: STEP_STATS | {"double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.xp: STEP_STATS | {"xp_percent", "flat_xp", "double_action"},
+    OPTIMAZATION_TARGET.chests: STEP_STATS | {"chest_finding", "double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.materials: {"double_rewards", "no_mats"},
+    OPTIMAZATION_TARGET.fine: STEP_STATS | {"fine_material", "double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.collectibles: STEP_STATS | {"collectible_percent", "double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.quality: {"quality_outcome", "double_rewards", "no_mats"},
+    OPTIMAZATION_TARGET.gems: STEP_STATS | {"gem_finding", "double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.bird_nests: STEP_STATS | {"bird_nest_finding", "double_action", "double_rewards"},
+    OPTIMAZATION_TARGET.coin_pouches: STEP_STATS | {"coin_pouch_finding", "double_action", "double_rewards"},
+}
+
+# Targets scored as (1 + finding bonus) reward rolls per step, with the stat of the bonus
+_DROP_STATS = {
+    OPTIMAZATION_TARGET.chests: "chest_finding",
+    OPTIMAZATION_TARGET.fine: "fine_material",
+    OPTIMAZATION_TARGET.collectibles: "collectible_percent",
+    OPTIMAZATION_TARGET.gems: "gem_finding",
+    OPTIMAZATION_TARGET.bird_nests: "bird_nest_finding",
+    OPTIMAZATION_TARGET.coin_pouches: "coin_pouch_finding",
+}
+
+
+class WeightedObjective(BaseModel):
+    """
+    A weighted sum of targets, e.g. {"xp": 0.7, "chests": 0.3}. Every target is scored relative to its score
+    without gear, so the weights trade relative gains (+10% xp against +20% chests) whatever the targets' units.
+    Weights are positive: the score stays monotone in every stat, which the optimizers' pruning relies on.
+    """
+    weights: Dict[str, float]
+
+    @field_validator("weights")
+    @classmethod
+    def _known_targets(cls, weights: Dict[str, float]) -> Dict[str, float]:
+        if not weights: raise ValueError("A weighted objective needs at least one target")
+        for name, weight in weights.items():
+            if name not in OPTIMAZATION_TARGET.__members__: raise ValueError(f"Unknown target '{name}'")
+            if weight <= 0: raise ValueError(f"The weight of '{name}' must be positive")
+        return weights
+
+    @classmethod
+    def parse(cls, text: str) -> "WeightedObjective":
+        """From "xp=0.7,chests=0.3"."""
+        weights = {}
+        for term in text.split(","):
+            name, _, weight = term.partition("=")
+            weights[name.strip()] = float(weight) if weight.strip() else 1.0
+        return cls(weights=weights)
+
+    @property
+    def name(self) -> str:
+        """The objective in parse's format, used where a target name is stored."""
+        return ",".join(f"{name}={weight:g}" for name, weight in self.weights.items())
+
+    @property
+    def targets(self) -> List[Tuple[OPTIMAZATION_TARGET, float]]:
+        return [(OPTIMAZATION_TARGET[name], weight) for name, weight in self.weights.items()]
+
+
+Objective = Union[OPTIMAZATION_TARGET, WeightedObjective]
+
+
+class RouteStop(BaseModel):
+    activity: Activity
+    share: float = 1.0  # Relative time (steps) spent on the activity
+
+
+class Route(BaseModel):
+    """
+    Activities done in rotation without changing gear, e.g. a set of agility courses. A loadout's score for a
+    route is the share-weighted sum of its scores for the activities: the objective per step walked on the route.
+    The activities can be of several skills, e.g. gathering and then crafting: item stats are summed once per skill.
+    """
+    stops: List[RouteStop]
+
+    @field_validator("stops")
+    @classmethod
+    def _positive_shares(cls, stops: List[RouteStop]) -> List[RouteStop]:
+        if not stops: raise ValueError("A route needs at least one activity")
+        for stop in stops:
+            if stop.share <= 0: raise ValueError(f"The share of '{stop.activity.activity}' must be positive")
+        return stops
+
+    @property
+    def name(self) -> str:
+        return ",".join(f"{stop.activity.activity}={stop.share:g}" for stop in self.stops)
+
+    @property
+    def activities(self) -> List[Activity]:
+        return [stop.activity for stop in self.stops]
+
+    @property
+    def shares(self) -> List[float]:
+        """The shares scaled to sum to 1."""
+        total = sum(stop.share for stop in self.stops)
+        return [stop.share / total for stop in self.stops]
+
+    @property
+    def skills(self) -> List[Optional[str]]:
+        """The skills of the activities, each once, in route order."""
+        return list(dict.fromkeys(stop.activity.skill for stop in self.stops))
+
+
+def objective_stats(objective: Objective) -> Set[str]:
+    """TARGET_STATS of a target, or of every target of a weighted objective."""
+    if isinstance(objective, WeightedObjective):
+        return set().union(*(TARGET_STATS[target] for target, _ in objective.targets))
+    return TARGET_STATS[objective]
+
+
+class ScoreKernel:
+    """
+    The score of one objective for one activity and skill level. `score` takes capped stats and reads only
+    `stats`; the target dispatch and the activity's constants are resolved once, when the kernel is compiled.
+    A route's kernel holds its first activity and the skills of all of them. With several skills the stats are
+    skill_stat keys, summed per skill like GearSet.get_stats does for a list of skills.
+    """
+    def __init__(self, objective: Objective, activity: Activity, player_skill_level: int,
+                 stats: Set[str], score: Callable[[Dict[str, float]], float], skills: Optional[List[Optional[str]]] = None):
+        self.objective = objective
+        self.activity = activity
+        self.player_skill_level = player_skill_level
+        self.stats = frozenset(stats)
+        self.score = score
+        self.skills = skills or [activity.skill]
+        self.step_stats = frozenset(key for key in self.stats if stat_name(key) in STEP_STATS)
+        if len(self.skills) == 1:
+            self._fields = [(self.skills[0], [(key, STAT_FIELDS[key]) for key in sorted(self.stats)])]
+        else:
+            self._fields = [(skill, [(key, STAT_FIELDS[stat_name(key)]) for key in sorted(self.stats) if key == skill_stat(skill, stat_name(key))])
+                            for skill in self.skills]
+        self._capped = [key for key in sorted(self.stats) if stat_name(key) in CAPPED_STATS]
+
+    def aggregate(self, items: Iterable[Item]) -> Dict[str, float]:
+        """Capped sums of the kernel's stats over the items, the same values GearSet.get_stats gives for them."""
+        stats = {key: 0 if stat_name(key) == "flat_step_reduction" else 0.0 for key in self.stats}
+        for item in items:
+            item_skills = item.skill.split(',') if item.skill else []
+            for skill, fields in self._fields:
+                if item.skill is None or skill in item_skills:
+                    for key, field in fields:
+                        value = getattr(item, field)
+                        if value: stats[key] += value
+        for key in self._capped: stats[key] = min(1.0, stats[key])
+        return stats
+
+    def score_set(self, gearset: GearSet) -> float:
+        return self.score(self.aggregate(gearset.all_items))
+
+
+def compile_kernel(objective: Objective, activity: Union[Activity, Route], player_skill_level: int) -> ScoreKernel:
+    if isinstance(activity, Route):
+        return _compile_route(objective, activity, player_skill_level)
+    if isinstance(objective, WeightedObjective):
+        return _compile_weighted(objective, activity, player_skill_level)
+    term = _term(objective, activity, player_skill_level)
+    if objective in (OPTIMAZATION_TARGET.materials, OPTIMAZATION_TARGET.quality):
+        score = lambda stats: term(stats, None)
+    else:
+        steps_of = _steps_function(activity, player_skill_level)
+        score = lambda stats: term(stats, steps_of(stats))
+    return ScoreKernel(objective, activity, player_skill_level, TARGET_STATS[objective], score)
+
+
+def _compile_weighted(objective: WeightedObjective, activity: Activity, player_skill_level: int) -> ScoreKernel:
+    """One pass per candidate: the steps are computed once and shared by every term."""
+    empty = GearSet().get_stats(activity.skill)
+    terms = []
+    for target, weight in objective.targets:
+        kernel = compile_kernel(target, activity, player_skill_level)
+        baseline = kernel.score(empty)
+        # A target the activity can't give without gear (e.g. eternal quality far below the level) isn't normalized
+        terms.append((_term(target, activity, player_skill_level), weight / baseline if baseline > 0 else weight))
+    stats = objective_stats(objective)
+    steps_of = _steps_function(activity, player_skill_level) if stats & STEP_STATS else lambda stats: None
+
+    def score(stats: Dict[str, float]) -> float:
+        steps = steps_of(stats)
+        return sum(scale * term(stats, steps) for term, scale in terms)
+    return ScoreKernel(objective, activity, player_skill_level, stats, score)
+
+
+def _compile_route(objective: Objective, route: Route, player_skill_level: int) -> ScoreKernel:
+    """
+    One aggregate per candidate and skill of the route, every activity only adds its own steps and terms,
+    from the stats of its own skill.
+    """
+    stats = objective_stats(objective)
+    scores = [(share, compile_kernel(objective, activity, player_skill_level).score) for activity, share in zip(route.activities, route.shares)]
+    if len(route.skills) == 1:
+        def score(values: Dict[str, float]) -> float:
+            return sum(share * score_of(values) for share, score_of in scores)
+        return ScoreKernel(objective, route.activities[0], player_skill_level, stats, score)
+
+    keys = [[(stat, skill_stat(activity.skill, stat)) for stat in stats] for activity in route.activities]
+
+    def score(values: Dict[str, float]) -> float:
+        return sum(share * score_of({stat: values[key] for stat, key in activity_keys})
+                   for (share, score_of), activity_keys in zip(scores, keys))
+    return ScoreKernel(objective, route.activities[0], player_skill_level,
+                       {skill_stat(skill, stat) for skill in route.skills for stat in stats}, score, route.skills)
+
+
+def _steps_function(activity: Activity, player_skill_level: int) -> Callable[[Dict[str, float]], int]:
+    """utils.calculate_steps with the activity's constants folded in."""
+    level_eff = min(0.25, max(0, player_skill_level - activity.skill_level) * 0.0125)
+    max_eff = activity.max_work_efficiency
+    base_steps = activity.base_steps
+
+    def steps(stats: Dict[str, float]) -> int:
+        efficiency_multiplier = 1.0 + min(level_eff + stats["work_efficiency"], max_eff)
+        return max(10, math.ceil((base_steps / efficiency_multiplier) * (1.0 - stats["percent_step_reduction"])) - stats["flat_step_reduction"])
+    return steps
+
+
+def _term(target: OPTIMAZATION_TARGET, activity: Activity, player_skill_level: int) -> Callable[[Dict[str, float], Optional[int]], float]:
+    """The target's score from capped stats and the steps per action (None for the per-material targets)."""
+    if target == OPTIMAZATION_TARGET.reward_rolls:
+        return lambda stats, steps: ((1.0 + stats["double_action"]) * (1.0 + stats["double_rewards"])) / steps
+    if target == OPTIMAZATION_TARGET.xp:
+        base_xp = activity.base_xp or 0
+        return lambda stats, steps: ((base_xp * (1.0 + stats["xp_percent"]) + stats["flat_xp"]) * (1.0 + stats["double_action"])) / steps
+    if target in _DROP_STATS:
+        bonus = _DROP_STATS[target]
+        return lambda stats, steps: ((1.0 + stats[bonus]) * (1.0 + stats["double_action"]) * (1.0 + stats["double_rewards"])) / steps
+    if target == OPTIMAZATION_TARGET.materials:
+        return lambda stats, steps: (1.0 + stats["double_rewards"]) * (1.0 / (1.0 - min(0.99, stats["no_mats"])))
+    if target == OPTIMAZATION_TARGET.quality:
+        min_level = activity.skill_level or 0
+        def quality(stats, steps):
+            probs = calculate_quality_probabilities(activity_min_level=min_level, player_skill_level=player_skill_level,
+                                                    quality_bonus=stats["quality_outcome"])
+            return probs.get("Eternal", 0.0) * (1.0 + stats["double_rewards"]) * (1.0 / (1.0 - min(0.99, stats["no_mats"])))
+        return quality
+    return lambda stats, steps: 0.0
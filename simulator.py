@@ -0,0 +1,145 @@
+import numpy as np
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from models import Activity, GearSet
+from utils import calculate_steps, calculate_quality_probabilities
+from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET
+from drops import base_drop_rates, DROP_BONUS_STAT
+
+# Targets whose analytic score is a drop rate relative to the activity's base chance
+_DROP_TARGETS = {
+    OPTIMAZATION_TARGET.chests: "chests",
+    OPTIMAZATION_TARGET.fine: "fine",
+    OPTIMAZATION_TARGET.collectibles: "collectibles",
+    OPTIMAZATION_TARGET.gems: "gems",
+}
+# The activity data has no base chance of bird nests or coin pouches to simulate them from
+_NOT_SIMULATED = {OPTIMAZATION_TARGET.bird_nests, OPTIMAZATION_TARGET.coin_pouches}
+
+Z_95 = 1.959963984540054
+
+
+class SimulationResult(BaseModel):
+    target: OPTIMAZATION_TARGET
+    unit: str
+    analytic: float
+    mean: float
+    std_error: float
+    ci_low: float
+    ci_high: float
+    percentiles: Dict[str, float]
+
+    @property
+    def relative_error(self) -> float:
+        if self.analytic == 0: return 0.0 if self.mean == 0 else float("inf")
+        return (self.mean - self.analytic) / self.analytic
+
+    @property
+    def analytic_in_ci(self) -> bool:
+        return self.ci_low <= self.analytic <= self.ci_high
+
+    @property
+    def departs(self) -> bool:
+        """Whether the simulated process departs from the closed form (its score outside the 95% interval)."""
+        return not self.analytic_in_ci
+
+
+def analytic_score(gearset: GearSet, activity: Activity, player_skill_level: int, target: OPTIMAZATION_TARGET) -> float:
+    """The closed-form score the q-optimizer uses for this target."""
+    # The character level only sets the tool slots, which the score doesn't depend on
+    return GearOptimizer([]).bind(activity, 99, player_skill_level, target).calculate_score_for_set(gearset)
+
+
+def closed_form_caps(gearset: GearSet, activity: Activity) -> Dict[str, float]:
+    """Raw stats of the loadout beyond the caps the closed form applies (1.0 for doubling, 0.99 for no-mats)."""
+    raw = gearset.get_stats(activity.skill, capped=False)
+    caps = {"double_action": 1.0, "double_rewards": 1.0, "no_mats": 0.99}
+    return {stat: raw[stat] for stat, cap in caps.items() if raw[stat] > cap}
+
+
+def _rolls(rng: np.random.Generator, chance: float, n: int) -> np.ndarray:
+    """Successes of an uncapped chance per trial: 1.5 is one sure success and a 50% roll for a second."""
+    whole = int(chance)
+    return whole + (rng.random(n) < chance - whole)
+
+
+def simulate(gearset: GearSet, activity: Activity, player_skill_level: int, n_actions: int = 1_000_000,
+             batches: int = 100, seed: Optional[int] = None,
+             targets: Optional[List[OPTIMAZATION_TARGET]] = None,
+             materials_per_action: int = 1) -> Dict[OPTIMAZATION_TARGET, SimulationResult]:
+    """
+    Monte Carlo check of the analytic scores. Simulates `n_actions` step-costing actions, split into
+    `batches` equally sized sessions, from the raw (uncapped) stats rather than the closed form's:
+      * double action repeats the action, every repeat with its own rolls; a chance above 1.0 repeats it
+        more than once (1.5: once, and a 50% chance of a second time)
+      * double rewards adds reward rolls to each action the same way
+      * each action consumes `materials_per_action` materials, each with its own no-mats roll
+      * each action rolls a quality tier, each reward roll drops at the activity's base chance times (1 + bonus)
+    The closed form caps doubling at 1.0 and no-mats at 0.99 (closed_form_caps lists what a loadout exceeds),
+    so `departs` shows where it no longer describes the process. Materials are counted in actions' worth.
+    The mean and 95% confidence interval come from the session means, the percentiles describe
+    the spread between sessions.
+    """
+    targets = targets or [t for t in OPTIMAZATION_TARGET if t not in _NOT_SIMULATED]
+    rng = np.random.default_rng(seed)
+    stats = gearset.get_stats(activity.skill, capped=False)
+    steps = calculate_steps(
+        activity, player_skill_level, stats["work_efficiency"],
+        stats["flat_step_reduction"], stats["percent_step_reduction"]
+    )
+    no_mats = min(1.0, stats["no_mats"])  # A probability, 100% consumes nothing
+    xp_per_action = (activity.base_xp or 0) * (1.0 + stats["xp_percent"]) + stats["flat_xp"]
+    quality_cdf = np.cumsum(list(calculate_quality_probabilities(
+        activity_min_level=activity.skill_level or 0,
+        player_skill_level=player_skill_level,
+        quality_bonus=stats["quality_outcome"]
+    ).values()))
+    base_rates = base_drop_rates(activity)
+    drop_chance = {drop: base_rates[drop] * (1.0 + stats[DROP_BONUS_STAT[drop]]) for drop in _DROP_TARGETS.values()}
+
+    per_batch = max(1, n_actions // batches)
+    samples = {t: np.empty(batches) for t in targets}
+    for b in range(batches):
+        actions = per_batch + int(_rolls(rng, stats["double_action"], per_batch).sum())
+        rewards = 1 + _rolls(rng, stats["double_rewards"], actions)
+        consumed = int((rng.random(actions * materials_per_action) >= no_mats).sum()) / materials_per_action
+        tiers = np.searchsorted(quality_cdf, rng.random(actions), side="right")
+        total_rewards = int(rewards.sum())
+        batch_steps = per_batch * steps
+
+        for t in targets:
+            if t == OPTIMAZATION_TARGET.reward_rolls:
+                value = total_rewards / batch_steps
+            elif t == OPTIMAZATION_TARGET.xp:
+                value = actions * xp_per_action / batch_steps
+            elif t in _DROP_TARGETS:
+                value = int(_rolls(rng, drop_chance[_DROP_TARGETS[t]], total_rewards).sum()) / batch_steps
+            elif t == OPTIMAZATION_TARGET.materials:
+                value = total_rewards / consumed if consumed else float("inf")
+            elif t == OPTIMAZATION_TARGET.quality:
+                value = int(rewards[tiers >= 5].sum()) / consumed if consumed else float("inf")
+            else:
+                value = 0.0
+            samples[t][b] = value
+
+    results = {}
+    for t, values in samples.items():
+        analytic = analytic_score(gearset, activity, player_skill_level, t)
+        unit = "per step"
+        if t in _DROP_TARGETS:
+            analytic *= base_rates[_DROP_TARGETS[t]]
+        if t in (OPTIMAZATION_TARGET.materials, OPTIMAZATION_TARGET.quality):
+            unit = "per material"
+        mean = float(values.mean())
+        std_error = float(values.std(ddof=1) / np.sqrt(batches)) if batches > 1 else 0.0
+        results[t] = SimulationResult(
+            target=t,
+            unit=unit,
+            analytic=analytic,
+            mean=mean,
+            std_error=std_error,
+            ci_low=mean - Z_95 * std_error,
+            ci_high=mean + Z_95 * std_error,
+            percentiles={f"p{p}": float(np.percentile(values, p)) for p in (5, 25, 50, 75, 95)},
+        )
+    return results
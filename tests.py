@@ -1,6 +1,58 @@
 import unittest
-from models import Activity
-from utils import calculate_steps
+from models import Activity, GearSet, Item
+from utils import calculate_steps, calculate_level_from_xp, calculate_char_level_from_steps
+from chain import ActivityChain, ChainStage, ChainPlanner, StageLoadout, topological_order
+from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET, SetTracker, ConvergenceMonitor, CONVERGENCE_REASON
+from drops import base_drop_rates, batch_calculate_steps, stats_matrix, steps_per_drop
+from simulator import closed_form_caps, simulate
+from upgrades import rank_upgrades
+from gear_optimizer_dp import DPGearOptimizer
+from gear_optimizer_lns import LNSGearOptimizer
+from catalogue import Catalogue, ResultCache
+from columnar import ColumnarCatalogue
+from guild import GuildBatch, Profile
+from result_store import ResultStore, StoreKey, stored_result
+from precompute import Precomputer
+from catalogue import CatalogueChange
+from breakpoints import StepBreakpoints
+from benchmark import ExhaustiveOptimizer, run_benchmark, summarize
+from scoring import Route, RouteStop, WeightedObjective, compile_kernel
+from export import build_uuid_index, decode_gearset, decode_gearsets, encode_gearsets, export_gearset, read_gearsets, write_gearsets
+
+def small_inventory():
+    """(activity, items) small enough to brute force, with a set and restricted tools, shared by the optimizer tests."""
+    import random
+    rng = random.Random(11)
+    activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=120, max_work_efficiency=0.5)
+    def stats():
+        return dict(work_eff_percent=rng.choice([-0.05, 0, 0.1, 0.2]), double_action=rng.choice([0, 0.05]),
+                    double_rewards=rng.choice([0, 0.04]), minus_steps=rng.choice([0, 1, 3]))
+    items = (
+        [Item(name=f"Hat {i}", slot="Head", **stats()) for i in range(3)]
+        + [Item(name=f"Ring {i}", slot="Ring", **stats()) for i in range(4)]
+        + [Item(name=f"Tool {i}", slot="Tool", keywords=[rng.choice(["pickaxe", "hatchet", "brush"])], **stats()) for i in range(6)]
+        + [Item(name="Proper Boots", slot="Feet", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True, **stats()),
+           Item(name="Proper Amulet", slot="Neck", set_name="Proper", set_count=2, has_set_attr=True, work_eff_percent=0.3),
+           Item(name="Proper Hat", slot="Head", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True)]
+    )
+    return activity, items
+
+def brute_force(items, optimizer) -> float:
+    """Best score of the bound optimizer over every valid loadout of small_inventory's slots."""
+    import itertools
+    by_slot = {}
+    for item in items: by_slot.setdefault(item.slot, []).append(item)
+    ring_options = [()] + [(r,) for r in by_slot["Ring"]] + list(itertools.combinations_with_replacement(by_slot["Ring"], 2))
+    tool_options = [c for k in range(optimizer.tool_slots + 1) for c in itertools.combinations(by_slot["Tool"], k)
+                    if optimizer._is_valid_tool_set(list(c))]
+    best = float("-inf")
+    for head, feet, neck, rings, tools in itertools.product(
+        [None] + by_slot["Head"], [None] + by_slot["Feet"], [None] + by_slot["Neck"], ring_options, tool_options
+    ):
+        gearset = GearSet(head=head, feet=feet, neck=neck, rings=list(rings), tools=list(tools))
+        if not SetTracker(gearset.all_items).all_satisfied(gearset.all_items): continue
+        best = max(best, optimizer.calculate_score_for_set(gearset))
+    return best
 
 class TestWorkEfficiency(unittest.TestCase):
     def setUp(self):
@@ -104,5 +156,859 @@ class TestWorkEfficiency(unittest.TestCase):
         # 5. Flat Redux: 51 - 20 = 31
         self.assertEqual(steps, 31)
 
+class TestActivityChain(unittest.TestCase):
+    def setUp(self):
+        self.activities = [
+            Activity(activity="Mine Ore", skill="Mining", skill_level=1, base_steps=50, max_work_efficiency=1.0),
+            Activity(activity="Smelt Bar", skill="Smithing", skill_level=1, base_steps=40, max_work_efficiency=1.0),
+        ]
+        self.chain = ActivityChain(name="bars", goal="bar", goal_quantity=10, stages={
+            "ore": ChainStage(activity="Mine Ore"),
+            "bar": ChainStage(activity="Smelt Bar", inputs={"ore": 2}),
+        })
+
+    def _loadout(self, activity, steps, **stats):
+        base = {"double_action": 0.0, "double_rewards": 0.0, "no_mats": 0.0}
+        base.update(stats)
+        return StageLoadout(activity=activity, target=OPTIMAZATION_TARGET.reward_rolls, skill_level=99,
+                            gearset=GearSet(), stats=base, steps_per_action=steps)
+
+    def test_topological_order(self):
+        self.assertEqual(topological_order(self.chain), ["ore", "bar"])
+
+    def test_cycle_is_rejected(self):
+        self.chain.stages["ore"].inputs = {"bar": 1}
+        with self.assertRaises(ValueError):
+            topological_order(self.chain)
+
+    def test_total_steps_use_cached_stage_loadouts(self):
+        """10 bars, 2 ore each with 50% no mats, double rewards on ore and double action on bars"""
+        planner = ChainPlanner([], self.activities)
+        target = OPTIMAZATION_TARGET.reward_rolls
+        planner.stage_results[("Mine Ore", target, 99)] = self._loadout("Mine Ore", 20, double_rewards=1.0)
+        planner.stage_results[("Smelt Bar", target, 99)] = self._loadout("Smelt Bar", 30, double_action=0.5, no_mats=0.5)
+
+        plan = planner.plan([self.chain])[0]
+        bar, = [s for s in plan.stages if s.stage == "bar"]
+        ore, = [s for s in plan.stages if s.stage == "ore"]
+        # Bars: 10 actions, 300 steps / 1.5 = 200 steps, consumes 10 * 2 * 0.5 = 10 ore
+        self.assertAlmostEqual(bar.expected_steps, 200.0)
+        self.assertAlmostEqual(ore.quantity, 10.0)
+        # Ore: double rewards halves the actions -> 5 actions * 20 steps
+        self.assertAlmostEqual(ore.expected_steps, 100.0)
+        self.assertAlmostEqual(plan.total_steps, 300.0)
+
+class TestDrops(unittest.TestCase):
+    def setUp(self):
+        # Mine Copper Ore: sheet reference 40 steps/action, 4,000 steps/gem, 10,000 steps/chest
+        self.mining = Activity(
+            activity="Mine Copper Ore", skill="Mining", skill_level=1, base_steps=50, max_work_efficiency=0.5,
+            reference_steps=40, steps_per_chest=10000, steps_per_gem=4000, has_gem_table=True
+        )
+        self.stats = GearSet().get_stats("Mining")
+
+    def test_base_rates_from_sheet_columns(self):
+        rates = base_drop_rates(self.mining)
+        self.assertAlmostEqual(rates["chests"], 1 / 250)
+        self.assertAlmostEqual(rates["gems"], 1 / 100)
+        self.assertEqual(rates["collectibles"], 0.0)
+        # No sheet column for fine materials, they only get the base chance a caller passes
+        self.assertEqual(rates["fine"], 0.0)
+        self.assertEqual(base_drop_rates(self.mining, fine_base_chance=0.02)["fine"], 0.02)
+
+    def test_steps_per_drop_with_bonuses(self):
+        """Level 1, no eff -> 50 steps. Chests: 250 actions, halved by +100% chest finding"""
+        self.stats["chest_finding"] = 1.0
+        result = steps_per_drop(self.stats, self.mining, player_skill_level=1)
+        self.assertAlmostEqual(result["chests"], 50 * 125)
+        self.assertAlmostEqual(result["gems"], 50 * 100)
+        self.assertEqual(result["collectibles"], float("inf"))
+
+    def test_batch_steps_match_calculate_steps(self):
+        for eff, flat, pct in [(0.0, 0, 0.0), (0.3, 3, 0.05), (2.0, 40, 0.5)]:
+            self.stats.update(work_efficiency=eff, flat_step_reduction=flat, percent_step_reduction=pct)
+            expected = calculate_steps(self.mining, 40, eff, flat, pct)
+            self.assertEqual(batch_calculate_steps(stats_matrix([self.stats]), [self.mining], 40)[0, 0], expected)
+
+class TestSimulator(unittest.TestCase):
+    def test_simulation_matches_analytic_scores(self):
+        activity = Activity(activity="Smelt Bar", skill="Smithing", skill_level=1, base_steps=40, max_work_efficiency=1.0, base_xp=10)
+        gearset = GearSet(tools=[
+            Item(name="Tongs", slot="Tool", double_action=0.3, double_rewards=0.2),
+            Item(name="Apron", slot="Tool", no_mats_consumed_percent=0.25, xp_percent=0.1),
+        ])
+        targets = [OPTIMAZATION_TARGET.reward_rolls, OPTIMAZATION_TARGET.xp, OPTIMAZATION_TARGET.materials]
+        results = simulate(gearset, activity, player_skill_level=1, n_actions=200_000, seed=7, targets=targets)
+        for target in targets:
+            with self.subTest(target=target.name):
+                self.assertLess(abs(results[target].relative_error), 0.01)
+                self.assertLessEqual(results[target].ci_low, results[target].ci_high)
+                self.assertFalse(results[target].departs)
+
+    def test_uncapped_double_action_departs_from_the_closed_form(self):
+        """The closed form caps double action at 1.0, the raw process repeats an action 1.5 times on average"""
+        activity = Activity(activity="Smelt Bar", skill="Smithing", skill_level=1, base_steps=40, max_work_efficiency=1.0, base_xp=10)
+        gearset = GearSet(tools=[Item(name="Tongs", slot="Tool", double_action=0.8), Item(name="Bellows", slot="Tool", double_action=0.7)])
+        self.assertEqual(closed_form_caps(gearset, activity), {"double_action": 1.5})
+        result = simulate(gearset, activity, player_skill_level=1, n_actions=200_000, seed=7, targets=[OPTIMAZATION_TARGET.xp])[OPTIMAZATION_TARGET.xp]
+        self.assertTrue(result.departs)
+        self.assertAlmostEqual(result.mean / result.analytic, 2.5 / 2.0, places=2)
+
+class TestUpgrades(unittest.TestCase):
+    def test_ranks_unowned_items_by_gain(self):
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        owned = [Item(name="Cap", slot="Head", work_eff_percent=0.1)]
+        catalogue = owned + [
+            Item(name="Helm", slot="Head", work_eff_percent=0.3),
+            Item(name="Hat", slot="Head", work_eff_percent=0.05),
+            Item(name="Boots", slot="Feet", work_eff_percent=0.1),
+            Item(name="Pickaxe", slot="Tool", skill="Mining", work_eff_percent=0.5),
+        ]
+        report = rank_upgrades(catalogue, owned, activity, player_level=99, player_skill_level=1)
+        # Every unowned item is ranked, the ones that can't help (or can't be worn) with gain 0
+        self.assertEqual([c.item.name for c in report.candidates], ["Helm", "Boots", "Hat", "Pickaxe"])
+        self.assertGreater(report.candidates[0].gain, report.candidates[1].gain)
+        self.assertEqual(report.candidates[0].gearset.head.name, "Helm")
+        self.assertEqual([c.gain for c in report.candidates[2:]], [0.0, 0.0])
+
+    def test_upgrades_keep_the_set_bonuses_of_the_loadout(self):
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        owned = [Item(name="Proper Boots", slot="Feet", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True),
+                 Item(name="Proper Amulet", slot="Neck", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True,
+                      work_eff_percent=0.3)]
+        # Better boots alone, but replacing the set boots would break the amulet's bonus
+        fast_boots = Item(name="Fast Boots", slot="Feet", work_eff_percent=0.1)
+        report = rank_upgrades(owned + [fast_boots], owned, activity, player_level=99, player_skill_level=1)
+        self.assertEqual(report.base_gearset.neck.name, "Proper Amulet")
+        self.assertEqual(report.candidates[0].gain, 0.0)
+        self.assertIsNone(report.candidates[0].gearset)
+
+    def test_set_piece_is_scored_with_its_owned_partners(self):
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        def piece(name, slot, eff=0.0):
+            return Item(name=name, slot=slot, work_eff_percent=eff, set_name="Proper", set_count=3,
+                        has_set_attr=True, is_part_of_set=True)
+        owned = [piece("Proper Boots", "Feet"), piece("Proper Amulet", "Neck", 0.3)]
+        # No target stats of its own, but the third piece lets the amulet's bonus be worn
+        hat = piece("Proper Hat", "Head")
+        report = rank_upgrades(owned + [hat], owned, activity, player_level=99, player_skill_level=1)
+        self.assertIsNone(report.base_gearset.neck)
+        self.assertEqual(report.candidates[0].item.name, "Proper Hat")
+        self.assertGreater(report.candidates[0].gain, 0.0)
+        self.assertEqual(sorted(i.name for i in report.candidates[0].gearset.all_items),
+                         ["Proper Amulet", "Proper Boots", "Proper Hat"])
+
+class TestRingSearch(unittest.TestCase):
+    def test_pruned_ring_search_matches_brute_force(self):
+        import itertools, random
+        rng = random.Random(5)
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=200, max_work_efficiency=0.6)
+        rings = [Item(name=f"Ring {i}", slot="Ring", work_eff_percent=rng.choice([0, 0.05, 0.1, 0.2]),
+                      double_action=rng.choice([0, 0.02, 0.05]), double_rewards=rng.choice([0, 0.03]))
+                 for i in range(25)]
+        optimizer = GearOptimizer(rings).bind(activity, player_level=1, player_skill_level=1)
+        gearset = GearSet(head=Item(name="Hat", slot="Head", work_eff_percent=0.3))
+
+        best_rings, best_score = optimizer._search_rings(gearset, rings, SetTracker(), optimizer.calculate_score_for_set(gearset))
+        brute = max(optimizer.calculate_score_for_set(gearset.model_copy(update={"rings": list(pair)}))
+                    for pair in itertools.combinations_with_replacement(rings, 2))
+        self.assertAlmostEqual(best_score, brute)
+        self.assertAlmostEqual(optimizer.calculate_score_for_set(gearset.model_copy(update={"rings": best_rings})), brute)
+
+class TestSetSearch(unittest.TestCase):
+    def setUp(self):
+        self.activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=2.0)
+        def piece(name, slot, eff, count=2, part=True):
+            return Item(name=name, slot=slot, work_eff_percent=eff, set_name="Proper", set_count=count,
+                        has_set_attr=True, is_part_of_set=part)
+        self.items = [
+            piece("Proper Hat", "Head", 0.1), piece("Proper Boots", "Feet", 0.2),
+            piece("Proper Pants", "Legs", 0.05), piece("Proper Helm", "Head", 0.3),
+            piece("Proper Ring", "Ring", 0.15), piece("Proper Amulet", "Neck", 0.25, part=False),
+            piece("Proper Charm", "Neck", 0.0, part=False),
+        ]
+        self.optimizer = GearOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1)
+
+    def test_top_sets_are_bounded_sorted_and_feasible(self):
+        candidates = self.optimizer._get_candidates()
+        set_names = self.optimizer.get_all_sets()
+        set_data = self.optimizer.preprocessing_sets(set_names, candidates)
+        scored = self.optimizer.score_sets_on_empty_gear_set(set_names, set_data, top_k=5)
+
+        self.assertEqual(len(scored), 5)
+        scores = [score for score, _ in scored]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        # Best: the two strongest pieces in different slots, completed with the amulet
+        self.assertEqual(sorted(i.name for i in scored[0][1]), ["Proper Amulet", "Proper Boots", "Proper Helm"])
+        for _, set_items in scored:
+            heads = [i for i in set_items if i.slot == "Head"]
+            self.assertLessEqual(len(heads), 1)
+            # The zero-stat charm never improves a set, so it is never added as a completion
+            self.assertNotIn("Proper Charm", [i.name for i in set_items])
+
+    def test_set_tracker_counts_on_equip_and_unequip(self):
+        hat, boots, amulet = self.items[0], self.items[1], self.items[5]
+        tracker = SetTracker([hat, amulet])
+        self.assertFalse(tracker.is_satisfied("Proper"))
+        tracker.equip(boots)
+        self.assertTrue(tracker.is_active(amulet))
+        self.assertTrue(tracker.all_satisfied([hat, boots, amulet]))
+        tracker.unequip(hat)
+        self.assertFalse(tracker.is_satisfied("Proper"))
+
+    def test_optimize_keeps_set_pieces_needed_by_a_bonus(self):
+        """A better non-set helm must not replace a piece the amulet's set bonus depends on"""
+        self.optimizer.all_items = self.items[:2] + [self.items[5], Item(name="Helm", slot="Head", work_eff_percent=0.15)]
+        gearset = self.optimizer.optimize(self.activity, player_level=1, player_skill_level=1)
+        names = sorted(i.name for i in gearset.all_items)
+        self.assertEqual(names, ["Proper Amulet", "Proper Boots", "Proper Hat"])
+
+class TestConvergence(unittest.TestCase):
+    def test_monitor_stops_on_cycles_and_plateaus(self):
+        monitor = ConvergenceMonitor("a")
+        self.assertIsNone(monitor.step("b", 1.0, 2.0))
+        self.assertIsNone(monitor.step("c", 2.0, 3.0))
+        # Back to an earlier loadout: every further pass would repeat the same swaps
+        self.assertEqual(monitor.step("b", 3.0, 3.0 + 1e-15), CONVERGENCE_REASON.cycle)
+        self.assertEqual(ConvergenceMonitor("a").step("b", 2.0, 2.0 + 1e-15), CONVERGENCE_REASON.plateau)
+        self.assertEqual(ConvergenceMonitor("a").step("a", 2.0, 2.0), CONVERGENCE_REASON.converged)
+        monitor = ConvergenceMonitor(0, max_iterations=3)
+        self.assertEqual([monitor.step(i, i, i + 1) for i in (1, 2, 3)], [None, None, CONVERGENCE_REASON.max_iterations])
+
+    def test_optimize_reports_instead_of_printing(self):
+        import io
+        from contextlib import redirect_stdout
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=2.0)
+        items = [Item(name="Hat", slot="Head", work_eff_percent=0.1), Item(name="Helm", slot="Head", work_eff_percent=0.1),
+                 Item(name="Boots", slot="Feet", work_eff_percent=0.2), Item(name="Ring", slot="Ring", double_action=0.05)]
+        optimizer = GearOptimizer(items).bind(activity, player_level=1, player_skill_level=1)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            result = optimizer.search()
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(result.reason, CONVERGENCE_REASON.converged)
+        self.assertEqual(result.iterations, 2)
+        self.assertAlmostEqual(result.score, optimizer.calculate_score_for_set(result.gearset))
+        self.assertEqual(sorted(i.name for i in result.gearset.all_items), ["Boots", "Hat", "Ring", "Ring"])
+
+class TestScoring(unittest.TestCase):
+    def setUp(self):
+        self.activity = Activity(activity="Mine Ore", skill="Mining", skill_level=20, base_steps=120, max_work_efficiency=1.5, base_xp=30)
+        self.gearsets = [GearSet(), GearSet(
+            head=Item(name="Helm", slot="Head", work_eff_percent=0.3, quality_outcome=2.0, find_gems_percent=0.2),
+            rings=[Item(name="Band", slot="Ring", double_action=0.6, xp_percent=0.1, bird_nest_percent=0.5)] * 2,
+            tools=[Item(name="Pick", slot="Tool", minus_steps=3, minus_steps_percent=0.1, double_rewards=0.3, chest_percent=0.4,
+                        no_mats_consumed_percent=0.2, fine_mat_percent=0.1, collectible_percent=0.3, plus_xp=2.0,
+                        find_coin_pouch_percent=0.25),
+                   Item(name="Smithing Gloves", slot="Tool", skill="Smithing", work_eff_percent=1.0)],
+        )]
+
+    def test_kernels_match_the_reference_formulas(self):
+        from utils import calculate_quality_probabilities
+        def reference(stats, target):
+            steps = calculate_steps(self.activity, 40, stats["work_efficiency"], stats["flat_step_reduction"], stats["percent_step_reduction"])
+            da, dr = 1.0 + stats["double_action"], 1.0 + stats["double_rewards"]
+            nmc = 1.0 / (1.0 - min(0.99, stats["no_mats"]))
+            bonus = {"chests": "chest_finding", "fine": "fine_material", "collectibles": "collectible_percent", "gems": "gem_finding",
+                     "bird_nests": "bird_nest_finding", "coin_pouches": "coin_pouch_finding"}
+            if target.name == "reward_rolls": return da * dr / steps
+            if target.name == "xp": return (30 * (1.0 + stats["xp_percent"]) + stats["flat_xp"]) * da / steps
+            if target.name == "materials": return dr * nmc
+            if target.name == "quality":
+                return calculate_quality_probabilities(20, 40, stats["quality_outcome"])["Eternal"] * dr * nmc
+            return (1.0 + stats[bonus[target.name]]) * da * dr / steps
+        for target in OPTIMAZATION_TARGET:
+            kernel = compile_kernel(target, self.activity, 40)
+            for gearset in self.gearsets:
+                with self.subTest(target=target.name, items=len(gearset.all_items)):
+                    stats = gearset.get_stats("Mining")
+                    self.assertEqual(kernel.score(stats), reference(stats, target))
+                    # Only the target's stats are summed, to the same values
+                    self.assertEqual(kernel.aggregate(gearset.all_items), {k: stats[k] for k in kernel.stats})
+
+    def test_weighted_objective(self):
+        objective = WeightedObjective.parse("xp=0.7, chests=0.3")
+        self.assertEqual(objective.name, "xp=0.7,chests=0.3")
+        self.assertEqual(WeightedObjective.parse(objective.name), objective)
+        for invalid in ("xp=0.7,gold=0.3", "xp=-1", "xp=abc"):
+            with self.assertRaises(ValueError): WeightedObjective.parse(invalid)
+
+        # Every term is relative to the score without gear
+        gearset = self.gearsets[1]
+        kernel = compile_kernel(objective, self.activity, 40)
+        xp, chests = (compile_kernel(t, self.activity, 40) for t in (OPTIMAZATION_TARGET.xp, OPTIMAZATION_TARGET.chests))
+        expected = 0.7 * xp.score_set(gearset) / xp.score_set(GearSet()) + 0.3 * chests.score_set(gearset) / chests.score_set(GearSet())
+        self.assertAlmostEqual(kernel.score_set(gearset), expected)
+        self.assertAlmostEqual(kernel.score_set(GearSet()), 1.0)
+
+        # The weights decide between an xp and a chest ring
+        items = [Item(name="Xp Ring", slot="Ring", xp_percent=0.2), Item(name="Chest Ring", slot="Ring", chest_percent=0.3)]
+        for spec, ring in (("xp=0.9,chests=0.1", "Xp Ring"), ("xp=0.1,chests=0.9", "Chest Ring")):
+            gearset = GearOptimizer(items).optimize(self.activity, 99, 40, WeightedObjective.parse(spec))
+            self.assertEqual([r.name for r in gearset.rings], [ring, ring])
+
+    def test_route_objective(self):
+        course = Activity(activity="Course", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        swim = Activity(activity="Swim", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=0.0)
+        route = Route(stops=[RouteStop(activity=course, share=3), RouteStop(activity=swim, share=1)])
+        self.assertEqual(route.shares, [0.75, 0.25])
+        with self.assertRaises(ValueError): Route(stops=[RouteStop(activity=course), RouteStop(activity=swim, share=0)])
+
+        # Every activity's score from one aggregate, weighted by its share of the time
+        gearset = self.gearsets[1]
+        kernel = compile_kernel(OPTIMAZATION_TARGET.xp, route, 40)
+        course_score, swim_score = (compile_kernel(OPTIMAZATION_TARGET.xp, a, 40).score_set(gearset) for a in (course, swim))
+        self.assertAlmostEqual(kernel.score_set(gearset), 0.75 * course_score + 0.25 * swim_score)
+
+        # Efficiency only pays on the course, the shares decide between it and double rewards
+        items = [Item(name="Fast Hat", slot="Head", work_eff_percent=0.5), Item(name="Lucky Hat", slot="Head", double_rewards=0.1)]
+        for shares, hat in (((0.9, 0.1), "Fast Hat"), ((0.1, 0.9), "Lucky Hat")):
+            route = Route(stops=[RouteStop(activity=course, share=shares[0]), RouteStop(activity=swim, share=shares[1])])
+            for optimizer in (GearOptimizer(items), DPGearOptimizer(items)):
+                with self.subTest(shares=shares, optimizer=type(optimizer).__name__):
+                    self.assertEqual(optimizer.optimize(route, 1, 1).head.name, hat)
+
+    def test_route_across_skills(self):
+        # A gather-and-craft loop: every activity is scored from the stats of its own skill
+        smelt = Activity(activity="Smelt Ore", skill="Smithing", skill_level=20, base_steps=120, max_work_efficiency=1.5, base_xp=30)
+        route = Route(stops=[RouteStop(activity=self.activity, share=1), RouteStop(activity=smelt, share=3)])
+        self.assertEqual(route.skills, ["Mining", "Smithing"])
+        gearset = self.gearsets[1]
+        for target in (OPTIMAZATION_TARGET.xp, OPTIMAZATION_TARGET.chests, WeightedObjective.parse("xp=0.7,chests=0.3")):
+            with self.subTest(target=target):
+                kernel = compile_kernel(target, route, 40)
+                mine_score, smelt_score = (compile_kernel(target, a, 40).score_set(gearset) for a in (self.activity, smelt))
+                self.assertNotAlmostEqual(mine_score, smelt_score)
+                self.assertAlmostEqual(kernel.score_set(gearset), 0.25 * mine_score + 0.75 * smelt_score)
+                stats = gearset.get_stats(route.skills)
+                self.assertEqual(kernel.aggregate(gearset.all_items), {k: stats[k] for k in kernel.stats})
+                self.assertAlmostEqual(kernel.score(stats), kernel.score_set(gearset))
+
+        # Each hat only speeds up its own skill, the shares decide which one pays more
+        items = [Item(name="Mining Hat", slot="Head", skill="Mining", work_eff_percent=0.5),
+                 Item(name="Smithing Hat", slot="Head", skill="Smithing", work_eff_percent=0.3)]
+        for shares, hat in (((0.9, 0.1), "Mining Hat"), ((0.1, 0.9), "Smithing Hat")):
+            route = Route(stops=[RouteStop(activity=self.activity, share=shares[0]), RouteStop(activity=smelt, share=shares[1])])
+            for optimizer in (GearOptimizer(items), DPGearOptimizer(items), LNSGearOptimizer(items), ExhaustiveOptimizer(items)):
+                with self.subTest(shares=shares, optimizer=type(optimizer).__name__):
+                    self.assertEqual(optimizer.optimize(route, 1, 20).head.name, hat)
+
+    def test_new_targets_use_their_finding_stat(self):
+        items = [Item(name="Gem Lens", slot="Neck", find_gems_percent=0.1), Item(name="Nest Charm", slot="Neck", bird_nest_percent=0.1),
+                 Item(name="Pouch Charm", slot="Neck", find_coin_pouch_percent=0.1)]
+        for target, name in (("gems", "Gem Lens"), ("bird_nests", "Nest Charm"), ("coin_pouches", "Pouch Charm")):
+            gearset = GearOptimizer(items).optimize(self.activity, 99, 40, OPTIMAZATION_TARGET[target])
+            self.assertEqual(gearset.neck.name, name)
+
+class TestParallelOptimize(unittest.TestCase):
+    def test_workers_give_the_serial_result(self):
+        import random
+        rng = random.Random(3)
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=150, max_work_efficiency=0.8)
+        def stats():
+            return dict(work_eff_percent=rng.choice([0, 0.05, 0.1]), double_action=rng.choice([0, 0.03]), double_rewards=rng.choice([0, 0.02]))
+        items = (
+            [Item(name=f"Tool {i}", slot="Tool", keywords=[rng.choice(["pickaxe", "hatchet", "brush"])], **stats()) for i in range(12)]
+            + [Item(name=f"Ring {i}", slot="Ring", **stats()) for i in range(5)]
+            + [Item(name="Proper Boots", slot="Feet", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True, work_eff_percent=0.1),
+               Item(name="Proper Hat", slot="Head", set_name="Proper", set_count=2, has_set_attr=True, is_part_of_set=True, work_eff_percent=0.1)]
+        )
+        serial = GearOptimizer(items).optimize(activity, player_level=99, player_skill_level=1)
+        parallel = GearOptimizer(items, workers=2).optimize(activity, player_level=99, player_skill_level=1)
+        self.assertEqual([i.name for i in parallel.all_items], [i.name for i in serial.all_items])
+        # The result holds the caller's items, not copies from the workers
+        self.assertTrue(all(any(i is j for j in items) for i in parallel.all_items))
+
+    def test_one_optimizer_serves_concurrent_calls(self):
+        from concurrent.futures import ThreadPoolExecutor
+        activity, items = small_inventory()
+        activities = [activity, activity.model_copy(update={"activity": "Pickaxe Course", "required_keywords": ["pickaxe"]})]
+        queries = [(activity, level, target) for activity in activities for level in (1, 99)
+                   for target in (OPTIMAZATION_TARGET.reward_rolls, OPTIMAZATION_TARGET.materials, OPTIMAZATION_TARGET.xp)]
+        def names(result):
+            return [i.name for i in result.gearset.all_items], result.score
+        expected = [names(GearOptimizer(items).optimize_with_info(a, level, 1, t)) for a, level, t in queries]
+        shared = GearOptimizer(items)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda query: names(shared.optimize_with_info(query[0], query[1], 1, query[2])), queries * 3))
+        self.assertEqual(results, expected * 3)
+        # Calls run on bound copies, the shared optimizer itself is never changed
+        self.assertIsNone(shared.context)
+        with self.assertRaises(RuntimeError): shared.calculate_score_for_set(GearSet())
+
+class TestMultiStart(unittest.TestCase):
+    def setUp(self):
+        self.activity, self.items = small_inventory()
+
+    def test_best_start_is_kept_and_seeded(self):
+        single = GearOptimizer(self.items).optimize_with_info(self.activity, player_level=1, player_skill_level=1)
+        runs = [GearOptimizer(self.items, workers=workers).optimize_multi_start(
+                    self.activity, player_level=1, player_skill_level=1, starts=6, seed=5) for workers in (1, 2, 1)]
+        result = runs[0]
+        self.assertEqual(len(result.scores), 6)
+        # The first start is the plain search
+        self.assertAlmostEqual(result.scores[0], single.score)
+        self.assertEqual(result.best.score, max(result.scores))
+        self.assertGreaterEqual(result.best.score, single.score)
+        self.assertTrue(SetTracker(result.best.gearset.all_items).all_satisfied(result.best.gearset.all_items))
+        for other in runs[1:]:
+            self.assertEqual(other.scores, result.scores)
+            self.assertEqual([i.name for i in other.best.gearset.all_items], [i.name for i in result.best.gearset.all_items])
+
+class TestLNSOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.activity, self.items = small_inventory()
+
+    def test_reaches_the_optimum_reproducibly(self):
+        for target in (OPTIMAZATION_TARGET.reward_rolls, OPTIMAZATION_TARGET.materials):
+            runs = [LNSGearOptimizer(self.items, iterations=300, seed=4).optimize_with_info(
+                        self.activity, player_level=1, player_skill_level=1, optimazation_target=target) for _ in range(2)]
+            gearset = runs[0].gearset
+            self.assertEqual([i.name for i in runs[1].gearset.all_items], [i.name for i in gearset.all_items])
+            self.assertEqual((runs[0].iterations, runs[0].reason), (300, CONVERGENCE_REASON.max_iterations))
+            optimizer = LNSGearOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1, optimazation_target=target)
+            self.assertTrue(optimizer._is_valid_tool_set(gearset.tools))
+            self.assertLessEqual(len(gearset.tools), optimizer.tool_slots)
+            self.assertTrue(SetTracker(gearset.all_items).all_satisfied(gearset.all_items))
+            self.assertAlmostEqual(runs[0].score, brute_force(self.items, optimizer))
+
+    def test_time_budget(self):
+        import time
+        start = time.perf_counter()
+        result = LNSGearOptimizer(self.items, time_limit=0.2).optimize_with_info(self.activity, player_level=1, player_skill_level=1)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertGreater(result.iterations, 0)
+        self.assertEqual(result.reason, CONVERGENCE_REASON.time_limit)
+
+class TestCatalogue(unittest.TestCase):
+    def setUp(self):
+        import os, shutil, tempfile
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.files = {}
+        for name in ("items.csv", "activities.csv", "recipes.csv"):
+            self.files[name] = os.path.join(self.dir, name)
+            shutil.copy(name, self.files[name])
+        self.catalogue = Catalogue(self.files["items.csv"], self.files["activities.csv"], self.files["recipes.csv"])
+
+    def rewrite(self, name, edit):
+        import csv, os
+        with open(self.files[name], newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        fieldnames = list(rows[0].keys())
+        rows = edit(rows)
+        with open(self.files[name], "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        stat = os.stat(self.files[name])
+        os.utime(self.files[name], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def test_reload_only_replaces_changed_rows(self):
+        before = self.catalogue.snapshot()
+        self.assertIsNone(self.catalogue.check_for_changes())
+        edited = before.items[0]
+
+        def edit(rows):
+            rows[0]["Work %"] = "55%"
+            return [rows[0]] + rows[2:]
+        self.rewrite("items.csv", edit)
+        change = self.catalogue.check_for_changes()
+
+        after = self.catalogue.snapshot()
+        self.assertNotEqual(after.version, before.version)
+        self.assertEqual(change.items_changed, [(edited.name, edited.skill)])
+        self.assertEqual(len(change.items_removed), 1)
+        self.assertEqual(after.items_by_key[(edited.name, edited.skill)].work_eff_percent, 0.55)
+        # Rows that didn't change keep their objects, the old snapshot is untouched
+        self.assertIs(after.items[1], before.items[2])
+        self.assertIs(before.items[0], edited)
+        self.assertEqual(len(after.items), len(before.items) - 1)
+
+    def test_result_cache_evicts_only_affected_results(self):
+        cache = ResultCache(self.catalogue)
+        activities = self.catalogue.snapshot().activities_by_name
+        changed, kept = activities["Hut Jumping"], activities["Wreck Diving"]
+        cache.put("changed", changed, "gearset a", self.catalogue.version)
+        cache.put("kept", kept, "gearset b", self.catalogue.version)
+
+        def edit(rows):
+            for row in rows:
+                if row["Activity"] == "Hut Jumping": row["Base Steps"] = "999"
+            return rows
+        self.rewrite("activities.csv", edit)
+        self.catalogue.check_for_changes()
+        self.assertIsNone(cache.get("changed"))
+        self.assertEqual(cache.get("kept"), "gearset b")
+        # A result computed on the old version is not stored any more
+        cache.put("late", kept, "gearset c", "outdated")
+        self.assertIsNone(cache.get("late"))
+
+class TestDPOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.activity, self.items = small_inventory()
+
+    def test_dp_matches_brute_force(self):
+        for target in (OPTIMAZATION_TARGET.reward_rolls, OPTIMAZATION_TARGET.materials):
+            optimizer = DPGearOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1, optimazation_target=target)
+            gearset = optimizer.search().gearset
+            self.assertTrue(optimizer._is_valid_tool_set(gearset.tools))
+            self.assertTrue(SetTracker(gearset.all_items).all_satisfied(gearset.all_items))
+            self.assertAlmostEqual(optimizer.calculate_score_for_set(gearset), brute_force(self.items, optimizer))
+
+    def test_state_cap_is_a_beam(self):
+        from optimizers import make_optimizer
+        target = OPTIMAZATION_TARGET.reward_rolls
+        # Exact unless the beam is asked for
+        self.assertIsNone(DPGearOptimizer(self.items).max_states)
+        self.assertEqual(make_optimizer("dp", self.items, max_states=2)[0].max_states, 2)
+        exact = DPGearOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1, optimazation_target=target)
+        self.assertAlmostEqual(exact.search().score, brute_force(self.items, exact))
+        # A tiny beam still returns a valid loadout, never better than the optimum
+        beam = DPGearOptimizer(self.items, max_states=2).bind(self.activity, player_level=1, player_skill_level=1, optimazation_target=target)
+        result = beam.search()
+        self.assertTrue(SetTracker(result.gearset.all_items).all_satisfied(result.gearset.all_items))
+        self.assertLessEqual(result.score, exact.search().score + 1e-12)
+
+    def test_capped_efficiency_lands_in_one_bucket(self):
+        """Efficiency past the cap, rounded to the bucket resolution, must still reach the capped step count"""
+        activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=0.7857142857142858)
+        items = [Item(name="Hat", slot="Head", work_eff_percent=0.8), Item(name="Cap", slot="Head", work_eff_percent=0.78, double_action=0.01)]
+        optimizer = DPGearOptimizer(items).bind(activity, player_level=1, player_skill_level=1)
+        gearset = optimizer.search().gearset
+        self.assertEqual(gearset.head.name, "Hat")
+        self.assertAlmostEqual(optimizer.calculate_score_for_set(gearset), 1 / 56)
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.activity, self.items = small_inventory()
+
+    def test_oracle_matches_brute_force(self):
+        for target in (OPTIMAZATION_TARGET.reward_rolls, OPTIMAZATION_TARGET.materials, OPTIMAZATION_TARGET.xp):
+            optimizer = ExhaustiveOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1, optimazation_target=target)
+            gearset = optimizer.search().gearset
+            self.assertTrue(optimizer.is_valid(gearset))
+            self.assertAlmostEqual(optimizer.calculate_score_for_set(gearset), brute_force(self.items, optimizer))
+
+    def test_gaps_against_the_oracle(self):
+        rows = run_benchmark(self.items, [self.activity], [OPTIMAZATION_TARGET.reward_rolls],
+                             optimizers=["q", "dp"], inventory_size=10, seeds=[0, 1], player_level=1, player_skill_level=1)
+        self.assertEqual(len(rows), 4)
+        for row in rows:
+            self.assertTrue(row.valid)
+            self.assertGreaterEqual(row.gap, -1e-9)
+        dp = next(summary for summary in summarize(rows) if summary.optimizer == "dp")
+        self.assertEqual((dp.cases, dp.optimal, dp.invalid), (2, 2, 0))
+
+class TestRequirements(unittest.TestCase):
+    def setUp(self):
+        self.base_activity, base_items = small_inventory()
+        # A pickaxe without any stat: only the requirement makes an optimizer wear it
+        self.items = base_items + [Item(name="Plain Pickaxe", slot="Tool", keywords=["pickaxe"]),
+                                   Item(name="Lantern", slot="Head", keywords=["lightSource"])]
+        self.activity = self.base_activity.model_copy(update={"required_keywords": ["pickaxe", "lightSource"]})
+
+    def test_optimizers_meet_the_requirements_and_agree(self):
+        oracle = ExhaustiveOptimizer(self.items).bind(self.activity, player_level=1, player_skill_level=1)
+        optimum = oracle.search().score
+        for optimizer, exact in ((GearOptimizer(self.items), False), (LNSGearOptimizer(self.items, iterations=200), False),
+                                 (DPGearOptimizer(self.items), True)):
+            result = optimizer.optimize_with_info(self.activity, player_level=1, player_skill_level=1)
+            self.assertTrue(oracle.is_valid(result.gearset), type(optimizer).__name__)
+            self.assertEqual(result.unmet_requirements, {})
+            if exact: self.assertAlmostEqual(result.score, optimum)
+            else: self.assertLessEqual(result.score, optimum + 1e-12)
+
+    def test_underwater_needs_three_diving_pieces(self):
+        activity = self.base_activity.model_copy(update={"is_underwater": True})
+        diving = [Item(name=f"Diving {slot}", slot=slot, keywords=["diving"]) for slot in ("Head", "Chest", "Legs")]
+        for optimizer in (GearOptimizer(self.items + diving), DPGearOptimizer(self.items + diving)):
+            gearset = optimizer.optimize(activity, player_level=1, player_skill_level=1)
+            self.assertEqual(sum("diving" in item.keywords for item in gearset.all_items), 3)
+
+    def test_items_above_the_level_are_left_out_and_unmet_requirements_reported(self):
+        items = self.items + [Item(name="Mithril Pickaxe", slot="Tool", keywords=["pickaxe"], skill="Agility", min_level=50, work_eff_percent=1.0)]
+        activity = self.activity.model_copy(update={"required_keywords": ["pickaxe", "spear"]})
+        for optimizer in (GearOptimizer(items), DPGearOptimizer(items)):
+            result = optimizer.optimize_with_info(activity, player_level=99, player_skill_level=20)
+            self.assertNotIn("Mithril Pickaxe", [item.name for item in result.gearset.all_items])
+            self.assertTrue(any("pickaxe" in item.keywords for item in result.gearset.tools))
+            self.assertEqual(result.unmet_requirements, {"spear": 1})
+
+class TestColumnarCatalogue(unittest.TestCase):
+    def setUp(self):
+        import shutil, tempfile
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.catalogue = Catalogue()
+        self.columnar = ColumnarCatalogue.for_catalogue(self.catalogue, root=self.dir)
+
+    def test_rows_round_trip(self):
+        opened = ColumnarCatalogue.open(self.columnar.path)
+        self.assertEqual(opened.version, self.catalogue.version)
+        self.assertEqual(opened.items.all(), self.catalogue.items)
+        self.assertEqual(opened.activities.all(), self.catalogue.activities)
+        self.assertEqual(self.columnar.item_rows(self.catalogue.items[:3]), [0, 1, 2])
+        # An item that was edited after the build has no row
+        edited = self.catalogue.items[0].model_copy(update={"work_eff_percent": 9.0})
+        self.assertIsNone(self.columnar.item_rows([edited]))
+
+    def test_workers_map_the_columnar_catalogue(self):
+        activity = self.catalogue.snapshot().activities_by_name["Sledding"]
+        items = self.catalogue.items
+        serial = GearOptimizer(items).optimize(activity, player_level=99, player_skill_level=99)
+        parallel = GearOptimizer(items, workers=2, columnar=self.columnar).optimize(activity, player_level=99, player_skill_level=99)
+        self.assertEqual([i.name for i in parallel.all_items], [i.name for i in serial.all_items])
+
+        planner = ChainPlanner(items, self.catalogue.activities, workers=2, columnar=self.columnar)
+        self.assertIsNotNone(planner._candidate_rows(activity))
+        planner.optimize_stages([ActivityChain(name="sledding", goal="a", stages={
+            "a": ChainStage(activity="Sledding"), "b": ChainStage(activity="Sledding", target=OPTIMAZATION_TARGET.xp)})])
+        loadout = planner.stage_results[("Sledding", OPTIMAZATION_TARGET.reward_rolls, 99)]
+        self.assertEqual([i.name for i in loadout.gearset.all_items], [i.name for i in serial.all_items])
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        import shutil, tempfile
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def _run(self, code: str) -> str:
+        import subprocess, sys
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        return result.stdout
+
+    def test_targets_mirror_the_optimizer(self):
+        import cli
+        self.assertEqual(cli.TARGETS, [t.name for t in OPTIMAZATION_TARGET])
+
+    def test_unknown_optimizer_is_rejected_everywhere(self):
+        from optimizers import make_optimizer
+        from guild import optimize_job
+        with self.assertRaises(ValueError): make_optimizer("greedy", [])
+        # The guild batch uses the same factory, it used to fall back to q
+        with self.assertRaises(ValueError): optimize_job([], Activity(activity="A"), ("", "A", "xp", 99, 99), "greedy")
+
+    def test_list_activities_from_cache_imports_no_models(self):
+        listing = f"import sys, cli; cli.main(['--cache-dir', {self.cache_dir!r}, 'list-activities', '--skill', 'Agility']); "
+        self._run(listing)  # Fills the cache
+        out = self._run(listing + "print('pydantic' in sys.modules, 'numpy' in sys.modules)")
+        self.assertIn("Sledding\tAgility", out)
+        self.assertTrue(out.strip().endswith("False False"))
+
+class TestExportCodec(unittest.TestCase):
+    def setUp(self):
+        self.items = [
+            Item(name="Amulet of Eel (T1-Normal)", slot="Neck", uuid="eel"),
+            Item(name="Amulet of Eel (T6-Eternal)", slot="Neck", uuid="eel", work_eff_percent=0.1),
+            Item(name="Hookhat", slot="Head", skill="Carpentry", uuid="hook"),
+            Item(name="Hookhat (Glo)", slot="Head", skill="Crafting,Smithing", uuid="hook"),
+            Item(name="Proper Boots", slot="Feet", uuid="boots", set_name="Proper", set_count=2, is_part_of_set=True),
+            Item(name="Proper Gloves", slot="Hands", uuid="gloves", set_name="Proper", set_count=2, is_part_of_set=True),
+            Item(name="Proper Ring (Base)", slot="Ring", uuid="ring", set_count=0),
+            Item(name="Proper Ring (1 Set)", slot="Ring", uuid="ring", set_name="Proper", set_count=1, has_set_attr=True),
+            Item(name="Proper Ring (2 Set)", slot="Ring", uuid="ring", set_name="Proper", set_count=2, has_set_attr=True),
+            Item(name="Pickaxe", slot="Tool", uuid="pick"),
+        ]
+        self.index = build_uuid_index(self.items)
+        self.by_name = {i.name: i for i in self.items}
+
+    def _names(self, gearset):
+        return [i.name for i in gearset.all_items]
+
+    def test_round_trip_picks_quality_skill_and_set_variants(self):
+        b = self.by_name
+        crafting = Activity(activity="Craft", skill="Crafting", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        gearsets = [
+            GearSet(neck=b["Amulet of Eel (T6-Eternal)"], head=b["Hookhat (Glo)"], tools=[b["Pickaxe"]]),
+            GearSet(feet=b["Proper Boots"], hands=b["Proper Gloves"], rings=[b["Proper Ring (2 Set)"]]),
+            GearSet(feet=b["Proper Boots"], rings=[b["Proper Ring (1 Set)"], b["Proper Ring (1 Set)"]]),
+        ]
+        codes = encode_gearsets(gearsets)
+        self.assertEqual(codes[0], export_gearset(gearsets[0]))
+        decoded = decode_gearsets(codes, self.index, activity=crafting)
+        for original, gearset in zip(gearsets, decoded):
+            self.assertEqual(self._names(gearset), self._names(original))
+        # Without an activity the first row of the uuid is taken
+        self.assertEqual(decode_gearset(codes[0], self.index).head.name, "Hookhat")
+
+    def test_round_trip_of_an_optimizer_result(self):
+        snapshot = Catalogue("items.csv", "activities.csv", "recipes.csv").snapshot()
+        activity = next(a for a in snapshot.activities if a.activity == "Hut Jumping")
+        gearset = GearOptimizer(snapshot.items).optimize(activity, player_level=99, player_skill_level=99)
+        index = build_uuid_index(snapshot.items)
+        code = export_gearset(gearset)
+        # Progressive variants share a uuid, the decoder takes the one the optimizer keeps
+        self.assertIn("Omni-tool (200+)", self._names(gearset))
+        self.assertEqual(self._names(decode_gearset(code, index, activity)), self._names(gearset))
+        self.assertIn("Omni-tool (200+)", self._names(decode_gearset(code, index)))
+
+    def test_unknown_items_and_streaming(self):
+        import io
+        code = export_gearset(GearSet(neck=Item(name="New", slot="Neck", uuid="new"), tools=[self.by_name["Pickaxe"]]))
+        with self.assertRaises(ValueError):
+            decode_gearset(code, self.index)
+        self.assertEqual(self._names(decode_gearset(code, self.index, strict=False)), ["Pickaxe"])
+
+        stream = io.StringIO()
+        records = ((f"sweep {i}", GearSet(tools=[self.by_name["Pickaxe"]])) for i in range(3))
+        self.assertEqual(write_gearsets(stream, records), 3)
+        stream.seek(0)
+        read = list(read_gearsets(stream, self.index))
+        self.assertEqual([label for label, _ in read], ["sweep 0", "sweep 1", "sweep 2"])
+        self.assertEqual(self._names(read[2][1]), ["Pickaxe"])
+
+class TestGuildBatch(unittest.TestCase):
+    def setUp(self):
+        self.activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=150, max_work_efficiency=0.8)
+        self.items = [
+            Item(name="Fast Hat", slot="Head", export_name="fast_hat", work_eff_percent=0.2),
+            Item(name="Slow Hat", slot="Head", export_name="slow_hat", work_eff_percent=0.1),
+            Item(name="Boots", slot="Feet", export_name="boots", work_eff_percent=0.1),
+            Item(name="Stick", slot="Tool", export_name="stick", double_action=0.05),
+        ]
+
+    def test_from_user_export_levels(self):
+        profile = Profile.from_user_export({"name": "Kozz", "steps": 10121691, "skills": {"Agility": 4771615}, "bank": {"boots": 1}})
+        self.assertEqual(profile.name, "Kozz")
+        self.assertEqual(profile.owned, ["boots"])
+        # Same levels the app derives from the export
+        self.assertEqual(profile.level, calculate_char_level_from_steps(10121691))
+        self.assertEqual(profile.skill_level(self.activity), calculate_level_from_xp(4771615))
+        self.assertEqual(profile.skill_level(Activity(activity="Mine", skill="Mining")), 1)
+        self.assertEqual(Profile.from_user_export({}).owned, None)
+
+    def test_shared_and_nested_inventories_are_optimized_once(self):
+        everything = ["fast_hat", "slow_hat", "boots", "stick"]
+        profiles = [
+            Profile(name="a", owned=everything),
+            Profile(name="b", owned=list(reversed(everything))),     # same inventory as a
+            Profile(name="c", owned=["fast_hat", "boots", "stick"]),  # nested, a's loadout only uses these
+            Profile(name="d", owned=["slow_hat"]),                    # nested, but a's loadout doesn't fit
+            Profile(name="e", level=10, owned=everything),            # same inventory, other level
+        ]
+        report = GuildBatch(self.items, [self.activity]).run(profiles, ["Hut Jumping"])
+        self.assertEqual(report.unique_inventories, 3)
+        self.assertEqual((report.unique_jobs, report.computed_jobs, report.reused_jobs), (4, 3, 1))
+        results = {r.player: r for r in report.results}
+        self.assertIs(results["a"].gearset, results["b"].gearset)
+        self.assertIsNotNone(results["c"].reused_from)
+        self.assertEqual([i.name for i in results["c"].gearset.all_items], [i.name for i in results["a"].gearset.all_items])
+        self.assertEqual([i.name for i in results["d"].gearset.all_items], ["Slow Hat"])
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        import shutil, tempfile, os
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = ResultStore(os.path.join(directory, "results.sqlite"))
+        self.addCleanup(self.store.close)
+        self.hat = Item(name="Hat", slot="Head", skill="Agility", uuid="hat", work_eff_percent=0.1)
+        self.pick = Item(name="Pick", slot="Tool", skill="Mining", uuid="pick", double_action=0.05)
+        self.items_by_key = {(i.name, i.skill): i for i in (self.hat, self.pick)}
+        self.agility = Activity(activity="Hut Jumping", skill="Agility", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+        self.mining = Activity(activity="Mine Ore", skill="Mining", skill_level=1, base_steps=100, max_work_efficiency=1.0)
+
+    def _key(self, activity, version="v1"):
+        return StoreKey(catalogue_version=version, activity=activity.activity, target="xp", level=99, skill_level=99, inventory="inv")
+
+    def test_round_trip_and_bulk_prefill(self):
+        results = [stored_result(self._key(self.agility), GearSet(head=self.hat), self.agility, 1.5),
+                   stored_result(self._key(self.mining), GearSet(tools=[self.pick]), self.mining, 2.0)]
+        self.assertEqual(self.store.put_many(results), 2)
+        hit = self.store.get(self._key(self.mining), self.items_by_key)
+        self.assertIs(hit.gearset.tools[0], self.pick)
+        self.assertEqual((hit.score, hit.export), (2.0, results[1].export))
+        self.assertAlmostEqual(hit.stats["double_action"], 0.05)
+        self.assertIsNone(self.store.get(self._key(self.mining, version="v2"), self.items_by_key))
+        # An item that left the catalogue makes the stored loadout a miss
+        self.assertIsNone(self.store.get(self._key(self.agility), {}))
+
+    def test_migrate_drops_only_affected_results(self):
+        self.store.put_many([stored_result(self._key(self.agility), GearSet(head=self.hat), self.agility),
+                             stored_result(self._key(self.mining), GearSet(tools=[self.pick]), self.mining)])
+        new_pick = self.pick.model_copy(update={"double_action": 0.1})
+        change = CatalogueChange(version="v2", previous_version="v1", items_changed=[("Pick", "Mining")],
+                                 old_items=[self.pick], new_items=[new_pick])
+        kept, deleted = self.store.migrate(change, {a.activity: a for a in (self.agility, self.mining)})
+        self.assertEqual((kept, deleted), (1, 1))
+        self.assertIsNotNone(self.store.get(self._key(self.agility, version="v2"), self.items_by_key))
+        self.assertIsNone(self.store.get(self._key(self.mining, version="v2"), self.items_by_key))
+        self.assertEqual(self.store.prune("v3"), 1)
+
+class TestPrecompute(unittest.TestCase):
+    def setUp(self):
+        import csv, os, shutil, tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # A small catalogue: 40 items, 2 activities and 1 recipe
+        files = []
+        for name, rows_kept in (("items.csv", 40), ("activities.csv", 2), ("recipes.csv", 1)):
+            with open(name, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            files.append(os.path.join(directory, name))
+            with open(files[-1], "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows[:rows_kept])
+        self.catalogue = Catalogue(*files)
+        self.store = ResultStore(os.path.join(directory, "results.sqlite"))
+        self.addCleanup(self.store.close)
+
+    def test_default_profile_is_precomputed_and_stored(self):
+        import time
+        from utils import inventory_fingerprint
+        snapshot = self.catalogue.snapshot()
+        precomputer = Precomputer(self.catalogue, self.store, workers=1)
+        # The default optimizer enforces requirements, its key is the one the app's on-demand runs use
+        self.assertEqual(precomputer.optimizer, "q")
+        # A result already in the store is served from there, not computed again
+        first = snapshot.activities[0]
+        key = precomputer.store_key(snapshot.version, inventory_fingerprint(snapshot.items), first.activity, "xp")
+        self.store.put(stored_result(key, GearSet(), first, -1.0))
+        precomputer.start()
+        self.addCleanup(precomputer.stop)
+        deadline = time.time() + 120
+        while not precomputer.status().finished and time.time() < deadline: time.sleep(0.1)
+
+        status = precomputer.status()
+        self.assertEqual((status.total, status.done, status.failed), (3 * len(OPTIMAZATION_TARGET), status.total, 0))
+        self.assertEqual(len(self.store), status.total)
+        self.assertEqual(precomputer.get(snapshot.version, first.activity, "xp").score, -1.0)
+        result = precomputer.get(snapshot.version, first.activity, "reward_rolls")
+        expected = GearOptimizer(snapshot.items).optimize(first, player_level=99, player_skill_level=99)
+        self.assertEqual(result.export, stored_result(key, expected, first).export)
+        self.assertIsNone(precomputer.get("older version", first.activity, "reward_rolls"))
+
+class TestStepBreakpoints(unittest.TestCase):
+    def setUp(self):
+        self.activity = Activity(activity="Hut Jumping", skill="Agility", skill_level=10, base_steps=113, max_work_efficiency=0.75)
+        self.breakpoints = StepBreakpoints(self.activity, player_skill_level=20)
+
+    def test_thresholds_are_exact(self):
+        import math, random
+        rng = random.Random(5)
+        for _ in range(300):
+            steps, pct, flat = rng.randint(10, 120), rng.choice([0.0, 0.05, 0.1]), rng.choice([0, 1, 3])
+            threshold = self.breakpoints.min_efficiency(steps, pct, flat)
+            if threshold is None:
+                self.assertGreater(self.breakpoints.steps(5.0, pct, flat), steps)
+                continue
+            self.assertLessEqual(self.breakpoints.steps(threshold, pct, flat), steps)
+            if threshold > 0:
+                self.assertGreater(self.breakpoints.steps(math.nextafter(threshold, -math.inf), pct, flat), steps)
+
+    def test_table_keeps_pareto_minimal_requirements(self):
+        table = self.breakpoints.table([(0.0, 0), (0.1, 0), (0.0, 2)])
+        self.assertEqual(table[0].steps, self.breakpoints.steps(0.0, 0.0, 0))
+        for row in table:
+            for eff, pct, flat in row.requirements:
+                self.assertLessEqual(self.breakpoints.steps(eff, pct, flat), row.steps)
+        # A reduction is only listed if it needs less efficiency than no reduction
+        for row in table:
+            by_reduction = {(pct, flat): eff for eff, pct, flat in row.requirements}
+            if (0.0, 0) in by_reduction:
+                self.assertTrue(all(eff < by_reduction[(0.0, 0)] for r, eff in by_reduction.items() if r != (0.0, 0)))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,207 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from models import Item, Activity, GearSet
+from gear_optimizer_q import GearOptimizer, OPTIMAZATION_TARGET, SINGLE_SLOTS, SetTracker
+from scoring import Objective, objective_stats
+
+
+class UpgradeCandidate(BaseModel):
+    item: Item
+    gain: float
+    relative_gain: float
+    new_score: float
+    refined: bool = False
+    gearset: Optional[GearSet] = None  # None when the item can't improve the loadout (gain 0)
+
+
+class UpgradeReport(BaseModel):
+    base_score: float
+    base_gearset: GearSet
+    candidates: List[UpgradeCandidate]
+
+
+def _item_key(item: Item):
+    return (item.name, item.skill)
+
+
+def _relevant_stats(item: Item, activity: Activity, target: Objective) -> Dict[str, float]:
+    stats = item.get_stats(activity.skill)
+    return {k: stats[k] for k in objective_stats(target)}
+
+
+def _dominates(a: Dict[str, float], b: Dict[str, float]) -> bool:
+    return all(a[k] >= b[k] for k in a)
+
+
+def _copy_set(gearset: GearSet) -> GearSet:
+    return gearset.model_copy(update={"rings": list(gearset.rings), "tools": list(gearset.tools)})
+
+
+class UpgradeAnalyzer:
+    """
+    Ranks unowned items by how much they would improve the owned-inventory optimum.
+    The owned optimum is computed once. Every unowned item is then scored by placing it
+    in its own slot(s) with the rest of the loadout fixed, set items together with the owned
+    pieces of their set, and only the most promising items get a re-optimization of the other slots. Every unowned item is in the ranking: items that
+    can't be worn for the activity, or can't improve the loadout, come last with a gain of 0.
+    """
+    def __init__(self, all_items: List[Item], owned_items: List[Item]):
+        self.all_items = all_items
+        self.owned_items = owned_items
+        owned_keys = {_item_key(i) for i in owned_items}
+        self.unowned_items = [i for i in all_items if _item_key(i) not in owned_keys]
+
+    def rank(self, activity: Activity, player_level: int, player_skill_level: int,
+             optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls,
+             refine_top: int = 20) -> UpgradeReport:
+        # Bound to the query, so the placements below are scored for it as well
+        optimizer = GearOptimizer(self.owned_items).bind(activity, player_level, player_skill_level, optimazation_target)
+        base = optimizer.search()
+        base_set, base_score = base.gearset, base.score
+
+        owned_candidates = optimizer._keep_best_versions(optimizer._get_candidates(), activity)
+        unowned_candidates = GearOptimizer(self.unowned_items).with_context(optimizer.context)._get_candidates()
+
+        # Stats of what is currently equipped, for the dominance bound on single slots
+        equipped_stats = {
+            slot: _relevant_stats(getattr(base_set, slot), activity, optimazation_target)
+            for slot in SINGLE_SLOTS if getattr(base_set, slot)
+        }
+
+        candidates, unchanged = [], []
+        usable = {id(item) for items in unowned_candidates.values() for item in items}
+        for item in self.unowned_items:
+            if id(item) in usable:
+                stats = _relevant_stats(item, activity, optimazation_target)
+                # Bounds: the score is monotone in every target stat, so an item without any of them,
+                # or one that is no better than what is equipped in that slot, can't improve the set
+                # bounds don't hold for set items, their value can be a set bonus that needs the owned partners
+                slot_attr = item.slot.lower()
+                if item.set_name is not None:
+                    new_set, new_score = self._best_set_placement(optimizer, base_set, item, owned_candidates)
+                elif any(v != 0 for v in stats.values()) and not (slot_attr in equipped_stats and _dominates(equipped_stats[slot_attr], stats)):
+                    new_set, new_score = self._best_local_placement(optimizer, base_set, item)
+                else:
+                    new_set = None
+                if new_set is not None and new_score > base_score:
+                    candidates.append(UpgradeCandidate(
+                        item=item,
+                        gain=new_score - base_score,
+                        relative_gain=(new_score - base_score) / base_score if base_score else 0.0,
+                        new_score=new_score,
+                        gearset=new_set,
+                    ))
+                    continue
+            unchanged.append(UpgradeCandidate(item=item, gain=0.0, relative_gain=0.0, new_score=base_score))
+
+        candidates.sort(key=lambda c: c.gain, reverse=True)
+
+        # The slot-local gain is a lower bound, re-optimizing the other slots around the item can only add to it
+        for candidate in candidates[:refine_top]:
+            refined_set, refined_score = self._resweep(optimizer, candidate.gearset, candidate.item, owned_candidates)
+            if refined_score > candidate.new_score:
+                candidate.gearset = refined_set
+                candidate.new_score = refined_score
+                candidate.gain = refined_score - base_score
+                candidate.relative_gain = candidate.gain / base_score if base_score else 0.0
+            candidate.refined = True
+        candidates.sort(key=lambda c: c.gain, reverse=True)
+
+        return UpgradeReport(base_score=base_score, base_gearset=base_set, candidates=candidates + unchanged)
+
+    def _placements(self, optimizer: GearOptimizer, gearset: GearSet, item: Item):
+        """Every way of putting `item` into `gearset` by replacing or filling one slot."""
+        if item.slot == "Ring":
+            for i in range(len(gearset.rings)):
+                new_set = _copy_set(gearset)
+                new_set.rings[i] = item
+                yield new_set
+            if len(gearset.rings) < 2:
+                new_set = _copy_set(gearset)
+                new_set.rings.append(item)
+                yield new_set
+        elif item.slot == "Tool":
+            for i in range(len(gearset.tools)):
+                new_set = _copy_set(gearset)
+                new_set.tools[i] = item
+                if optimizer._is_valid_tool_set(new_set.tools): yield new_set
+            if len(gearset.tools) < optimizer.tool_slots:
+                new_set = _copy_set(gearset)
+                new_set.tools.append(item)
+                if optimizer._is_valid_tool_set(new_set.tools): yield new_set
+        else:
+            new_set = _copy_set(gearset)
+            setattr(new_set, item.slot.lower(), item)
+            yield new_set
+
+    def _is_valid(self, optimizer: GearOptimizer, gearset: GearSet) -> bool:
+        """Every set bonus of the loadout still has its pieces, and the activity's requirements are met."""
+        items = gearset.all_items
+        return SetTracker(items).all_satisfied(items) and optimizer.requirements.is_satisfied(items)
+
+    def _best_local_placement(self, optimizer: GearOptimizer, gearset: GearSet, item: Item):
+        best_set, best_score = None, float("-inf")
+        for new_set in self._placements(optimizer, gearset, item):
+            if not self._is_valid(optimizer, new_set): continue
+            score = optimizer.calculate_score_for_set(new_set)
+            if score > best_score:
+                best_set, best_score = new_set, score
+        return best_set, best_score
+
+    def _best_set_placement(self, optimizer: GearOptimizer, gearset: GearSet, item: Item, owned_candidates: Dict[str, List[Item]]):
+        """
+        Best placement of a set item: alone, or together with the best owned pieces of its set in every
+        other slot. Partners are then dropped one at a time while that keeps the loadout valid and helps.
+        """
+        best_set, best_score = self._best_local_placement(optimizer, gearset, item)
+
+        def place(group):
+            score, new_set = optimizer.place_set(gearset, group)
+            if new_set is None or not self._is_valid(optimizer, new_set): return None, float("-inf")
+            return new_set, score
+
+        used = {item.slot: 1}
+        group = [item]
+        for slot, items in owned_candidates.items():
+            partners = [i for i in items if i.set_name == item.set_name]
+            partners.sort(key=lambda i: optimizer.place_set(gearset, [i])[0], reverse=True)
+            for partner in partners:
+                if used.get(partner.slot, 0) >= optimizer._slot_capacity(partner.slot): break
+                used[partner.slot] = used.get(partner.slot, 0) + 1
+                group.append(partner)
+
+        group_set, group_score = place(group)
+        improved = True
+        while improved and len(group) > 1:
+            improved = False
+            for partner in group[1:]:
+                smaller = [i for i in group if i is not partner]
+                new_set, score = place(smaller)
+                if score >= group_score:
+                    group, group_set, group_score, improved = smaller, new_set, score, True
+                    break
+        if group_set is not None and group_score > best_score:
+            return group_set, group_score
+        return best_set, best_score
+
+    def _resweep(self, optimizer: GearOptimizer, gearset: GearSet, pinned: Item, owned_candidates: Dict[str, List[Item]]):
+        """One pass of slot-local re-optimization over the owned items with `pinned` kept equipped."""
+        current = _copy_set(gearset)
+        current_score = optimizer.calculate_score_for_set(current)
+        for slot, items in owned_candidates.items():
+            for item in items:
+                for new_set in self._placements(optimizer, current, item):
+                    if not any(i is pinned for i in new_set.all_items): continue
+                    if not self._is_valid(optimizer, new_set): continue
+                    score = optimizer.calculate_score_for_set(new_set)
+                    if score > current_score:
+                        current, current_score = new_set, score
+        return current, current_score
+
+
+def rank_upgrades(all_items: List[Item], owned_items: List[Item], activity: Activity, player_level: int,
+                  player_skill_level: int, optimazation_target: Objective = OPTIMAZATION_TARGET.reward_rolls,
+                  refine_top: int = 20) -> UpgradeReport:
+    return UpgradeAnalyzer(all_items, owned_items).rank(
+        activity, player_level, player_skill_level, optimazation_target, refine_top
+    )
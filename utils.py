@@ -1,43 +1,86 @@
 import csv
+import hashlib
 from models import Item, Activity
 
 
-def parse_csv_to_items(file_path: str) -> list[Item]:
+def read_csv_rows(file_path: str, name_column: str) -> list[dict]:
+    """Rows of one of Arky's sheet exports without empty cells and placeholder ("None") rows."""
     with open(file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        items = []
-        for row in reader:
-            data = {k: v for k, v in row.items() if v != ''}
-            if data["Item"] == "None":
-                continue
-            item = Item.from_csv_row(data)
-            items.append(item)
-        return items
+        return parse_csv_rows(f, name_column)
+
+def parse_csv_rows(lines, name_column: str) -> list[dict]:
+    rows = []
+    for row in csv.DictReader(lines):
+        data = {k: v for k, v in row.items() if v != ''}
+        if data[name_column] == "None":
+            continue
+        rows.append(data)
+    return rows
+
+def parse_csv_to_items(file_path: str) -> list[Item]:
+    return [Item.from_csv_row(data) for data in read_csv_rows(file_path, "Item")]
     
 def parse_csv_to_activities(activities_file_path: str, recipes_file_path: str) -> list[Activity]:
-    activities = []
-    with open(activities_file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data = {k: v for k, v in row.items() if v != ''}
-            if data["Activity"] == "None":
-                continue
-            activity = Activity.from_activity_csv_row(data)
-            activities.append(activity)
-    with open(recipes_file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data = {k: v for k, v in row.items() if v != ''}
-            if data["Recipe"] == "None":
-                continue
-            activity = Activity.from_recipe_csv_row(data)
-            activities.append(activity)
+    activities = [Activity.from_activity_csv_row(data) for data in read_csv_rows(activities_file_path, "Activity")]
+    activities += [Activity.from_recipe_csv_row(data) for data in read_csv_rows(recipes_file_path, "Recipe")]
     return activities
+
+def get_owned_item_names(user_data: dict) -> set[str]:
+    """Export names of every item in the bank, inventory and gear of a WalkScape user export."""
+    owned_items_names = set()
+    owned_items_names.update(user_data.get("bank", {}).keys())
+    owned_items_names.update(user_data.get("inventory", {}).keys())
+    if "gear" in user_data:
+        equipped = {v for v in user_data["gear"].values() if v}
+        owned_items_names.update(equipped)
+    return owned_items_names
+
+def filter_owned_items(items: list[Item], user_data: dict) -> list[Item]:
+    owned_items_names = get_owned_item_names(user_data)
+    return [item for item in items if item.export_name in owned_items_names]
     
 
 
 import math
 
+def inventory_fingerprint(items: list[Item]) -> str:
+    """Order-independent hash of a set of items, (name, skill) identifies an item row."""
+    keys = sorted(f"{item.name}\x1f{item.skill or ''}" for item in items)
+    return hashlib.sha1("\x1e".join(keys).encode("utf-8")).hexdigest()
+
+def catalogue_version(texts: list[str]) -> str:
+    """Content hash of the items, activities and recipes CSV texts, identifies a catalogue version."""
+    return hashlib.sha1("\0".join(texts).encode("utf-8")).hexdigest()
+
+def get_xp_for_level(level: int) -> int:
+    """Standard XP curve formula (internal)."""
+    total = 0
+    for i in range(1, level):
+        total += math.floor(i + 300 * (2 ** (i / 7.0)))
+    return math.floor(total / 4)
+
+def calculate_level_from_xp(current_xp: int) -> int:
+    """Reverse lookup: Finds skill level based on XP."""
+    # Optimization: Simple iterative check since max level is usually < 150
+    for lvl in range(1, 150):
+        if get_xp_for_level(lvl + 1) > current_xp:
+            return lvl
+    return 150
+
+def calculate_char_level_from_steps(current_steps: int) -> int:
+    """
+    Specific formula for Character Level based on Steps.
+    Step Req = (Standard_XP_Curve / 4).floor() * 4.6
+    """
+    for lvl in range(1, 120):
+        # Calculate steps required for NEXT level
+        xp_req_standard = get_xp_for_level(lvl + 1)
+        steps_req = math.floor(xp_req_standard) * 4.6
+        
+        if steps_req > current_steps:
+            return lvl
+    return 120
+
 def calculate_steps(
    activity:Activity,
    player_skill_level: int,